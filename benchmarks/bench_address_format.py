@@ -0,0 +1,41 @@
+"""
+Benchmark for the address formats: parses a response with A and AAAA
+answers with each ADDRESS_FORMAT_* value.
+
+Usage: python benchmarks/bench_address_format.py [iterations]
+"""
+
+import sys
+import timeit
+
+import pycares
+
+from dnswire import response, rr
+
+
+FORMATS = (
+    ('text', pycares.ADDRESS_FORMAT_TEXT),
+    ('packed', pycares.ADDRESS_FORMAT_PACKED),
+    ('int', pycares.ADDRESS_FORMAT_INT),
+    ('ipaddress', pycares.ADDRESS_FORMAT_IPADDRESS),
+)
+
+
+def build_response():
+    name = 'example.com'
+    answer = [rr(name, 'A', 300, f'192.0.2.{i}') for i in range(1, 9)]
+    answer += [rr(name, 'AAAA', 300, f'2001:db8::{i}') for i in range(1, 9)]
+    return response(name, 'A', answer)
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+
+    buf = build_response()
+    for label, address_format in FORMATS:
+        elapsed = min(timeit.repeat(lambda: pycares.parse_wire(buf, address_format=address_format), number=iterations, repeat=5))
+        print(f"{label}: {elapsed / iterations * 1e6:.1f} us/response")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+"""
+Benchmark for delivering query results to asyncio: one call_soon_threadsafe()
+per completed query from the event thread, versus pycares.aio, either with
+the event thread waking the loop up once per burst of completions, or with
+the loop watching the sockets of the channel itself.
+
+Queries are paced at a target rate against a local responder (dnsserver.py)
+running in a subprocess. Every query asks for a different name, so none of
+them is answered from the query cache.
+
+Usage: python benchmarks/bench_aio_delivery.py [qps] [seconds]
+"""
+
+import asyncio
+import functools
+import statistics
+import sys
+import time
+
+import pycares
+import pycares.aio
+
+import dnsserver
+
+
+def set_future(future, result, error):
+    if future.done():
+        return
+    if error is not None:
+        future.set_exception(pycares.AresError(error, pycares.errno.strerror(error)))
+    else:
+        future.set_result(result)
+
+
+class ThreadsafeResolver:
+    """The usual glue: the event thread hands every result to the loop"""
+
+    def __init__(self, loop, server):
+        self.loop = loop
+        self.wakeups = 0
+        self.channel = pycares.Channel(servers=[server], timeout=5.0, tries=2)
+
+    def _callback(self, future, result, error):
+        self.wakeups += 1
+        self.loop.call_soon_threadsafe(set_future, future, result, error)
+
+    def query(self, name, query_type):
+        future = self.loop.create_future()
+        self.channel.query(name, query_type, callback=lambda result, error: self._callback(future, result, error))
+        return future
+
+    def close(self):
+        self.channel.close()
+
+
+class BatchedResolver(pycares.aio.DNSResolver):
+    """pycares.aio with the event thread, counting how many times the loop is woken up"""
+
+    def __init__(self, loop, server):
+        super().__init__(loop=loop, event_thread=True, servers=[server], timeout=5.0, tries=2)
+        self.wakeups = 0
+
+    def _process_completions(self):
+        self.wakeups += 1
+        super()._process_completions()
+
+
+class SocketResolver(pycares.aio.DNSResolver):
+    """pycares.aio watching the sockets, counting how many times they are processed"""
+
+    def __init__(self, loop, server):
+        super().__init__(loop=loop, servers=[server], timeout=5.0, tries=2)
+        self.wakeups = 0
+
+    def _process_read(self, fd):
+        self.wakeups += 1
+        super()._process_read(fd)
+
+
+async def run(label, resolver_class, server, qps, seconds):
+    loop = asyncio.get_running_loop()
+    resolver = resolver_class(loop, server)
+    total = int(qps * seconds)
+    latencies = []
+    futures = []
+
+    def done(start, future):
+        latencies.append(loop.time() - start)
+
+    start = loop.time()
+    cpu_start = time.process_time()
+    sent = 0
+    while sent < total:
+        # When behind, catch up by at most 10ms worth of queries per tick so
+        # the loop keeps handling results
+        due = min(total, int((loop.time() - start) * qps) + 1, sent + max(1, qps // 100))
+        while sent < due:
+            future = resolver.query('q%d.example.com' % sent, pycares.QUERY_TYPE_A)
+            future.add_done_callback(functools.partial(done, loop.time()))
+            futures.append(future)
+            sent += 1
+        await asyncio.sleep(0.001)
+
+    results = await asyncio.gather(*futures, return_exceptions=True)
+    elapsed = loop.time() - start
+    cpu = time.process_time() - cpu_start
+    resolver.close()
+
+    errors = sum(1 for r in results if isinstance(r, Exception))
+    latencies.sort()
+    print(f"{label}:")
+    print(f"  throughput: {total / elapsed:.0f} queries/s ({errors} errors), CPU {cpu / total * 1e6:.1f} us/query")
+    print(f"  latency: median {statistics.median(latencies) * 1e3:.2f} ms, "
+          f"p99 {latencies[int(len(latencies) * 0.99)] * 1e3:.2f} ms")
+    print(f"  loop wakeups: {resolver.wakeups} ({total / max(resolver.wakeups, 1):.1f} results per wakeup)")
+
+
+def main():
+    qps = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 2.0
+
+    process, server = dnsserver.start()
+    try:
+        print(f"Target rate: {qps} queries/s for {seconds:.1f}s")
+        asyncio.run(run('call_soon_threadsafe per result', ThreadsafeResolver, server, qps, seconds))
+        asyncio.run(run('pycares.aio, event thread (one wakeup per burst)', BatchedResolver, server, qps, seconds))
+        asyncio.run(run('pycares.aio, sockets watched by the loop', SocketResolver, server, qps, seconds))
+    finally:
+        process.terminate()
+        process.wait()
+
+
+if __name__ == '__main__':
+    main()
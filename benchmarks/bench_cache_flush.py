@@ -0,0 +1,58 @@
+"""
+Benchmark for flushing a domain from the response cache with
+Channel.cache_flush(suffix=...), which finds the entries with an index of the
+names by label, versus going over all the entries with cache_entries(). The
+cache is filled from a local responder (dnsserver.py).
+
+Usage: python benchmarks/bench_cache_flush.py [zones] [names per zone]
+"""
+
+import sys
+import threading
+import time
+
+import dnsserver
+import pycares
+
+
+def fill(channel, names):
+    done = threading.Event()
+    results = []
+
+    def cb(result, errorno):
+        results.append(errorno)
+        if len(results) == len(names):
+            done.set()
+
+    for name in names:
+        channel.query(name, pycares.QUERY_TYPE_A, callback=cb)
+    done.wait()
+
+
+def main():
+    zones = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    per_zone = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    names = ['host%d.zone%d.example.com' % (i, zone) for zone in range(zones) for i in range(per_zone)]
+
+    process, server = dnsserver.start()
+    try:
+        channel = pycares.Channel(servers=[server], timeout=5.0, tries=2, cache_size=2 * len(names), qcache_max_ttl=0)
+        fill(channel, names)
+
+        start = time.perf_counter()
+        matches = [e.name for e in channel.cache_entries() if e.name.endswith('.zone1.example.com')]
+        elapsed = time.perf_counter() - start
+        print(f"scan of {len(names)} entries: {elapsed * 1e3:.2f} ms ({len(matches)} matches)")
+
+        start = time.perf_counter()
+        count = channel.cache_flush(suffix='zone1.example.com')
+        elapsed = time.perf_counter() - start
+        print(f"cache_flush(suffix): {elapsed * 1e3:.2f} ms ({count} entries)")
+        channel.close()
+    finally:
+        process.terminate()
+        process.wait()
+
+
+if __name__ == '__main__':
+    main()
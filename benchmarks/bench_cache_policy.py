@@ -0,0 +1,69 @@
+"""
+Benchmark for the hit ratio of the response cache policies (cache_policy)
+on a Zipfian trace of names, with and without scans of names looked up only
+once mixed in, like those of a crawler. Misses are answered by a local
+responder (dnsserver.py).
+
+Usage: python benchmarks/bench_cache_policy.py [queries] [cache size]
+"""
+
+import itertools
+import random
+import sys
+import threading
+import time
+
+import dnsserver
+import pycares
+
+NAMES = 100000
+ZIPF_EXPONENT = 1.0
+
+
+def zipf_trace(count, scan_fraction, seed=42):
+    rng = random.Random(seed)
+    weights = itertools.accumulate(1 / (rank ** ZIPF_EXPONENT) for rank in range(1, NAMES + 1))
+    popular = rng.choices(range(NAMES), cum_weights=list(weights), k=count)
+    scans = itertools.count()
+    return ['scan%d.example.com' % next(scans) if rng.random() < scan_fraction else 'host%d.example.com' % i
+            for i in popular]
+
+
+def run(label, server, trace, **kwargs):
+    channel = pycares.Channel(servers=[server], timeout=5.0, tries=2, qcache_max_ttl=0, **kwargs)
+    done = threading.Event()
+
+    def cb(result, errorno):
+        done.set()
+
+    start = time.perf_counter()
+    for name in trace:
+        # Hits call the callback right away, wait for the misses
+        done.clear()
+        channel.query(name, pycares.QUERY_TYPE_A, callback=cb)
+        done.wait()
+    elapsed = time.perf_counter() - start
+    stats = channel.cache_stats()
+    channel.close()
+
+    ratio = stats['hits'] / (stats['hits'] + stats['misses'])
+    print(f"{label}: {ratio:.1%} hit ratio, {elapsed / len(trace) * 1e6:.2f} us/query")
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    cache_size = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+
+    process, server = dnsserver.start()
+    try:
+        for scan_fraction in (0.0, 0.3):
+            trace = zipf_trace(count, scan_fraction)
+            for policy in ('lru', 'tinylfu'):
+                run(f"{policy}, {scan_fraction:.0%} scans", server, trace, cache_size=cache_size, cache_policy=policy)
+    finally:
+        process.terminate()
+        process.wait()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""
+Benchmark for warm restarts with a response cache snapshot: the time to
+save the cache of a channel (Channel.cache_save), to load it in a new one
+(Channel.cache_load, which only maps the file) and to answer every name from
+the snapshot, versus answering them from a local responder (dnsserver.py)
+with a cold cache.
+
+Usage: python benchmarks/bench_cache_snapshot.py [names]
+"""
+
+import os
+import sys
+import tempfile
+import threading
+import time
+
+import dnsserver
+import pycares
+
+
+def resolve(channel, names):
+    done = threading.Event()
+    results = []
+
+    def cb(result, errorno):
+        results.append(errorno)
+        if len(results) == len(names):
+            done.set()
+
+    start = time.perf_counter()
+    for name in names:
+        channel.query(name, pycares.QUERY_TYPE_A, callback=cb)
+    done.wait()
+    elapsed = time.perf_counter() - start
+    assert results.count(None) == len(names)
+    return elapsed
+
+
+def new_channel(server, count):
+    return pycares.Channel(servers=[server], timeout=5.0, tries=2, cache_size=count, qcache_max_ttl=0, cache_snapshots=True)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    names = ['host%d.example.com' % i for i in range(count)]
+    path = os.path.join(tempfile.mkdtemp(), 'cache.snapshot')
+
+    process, server = dnsserver.start()
+    try:
+        channel = new_channel(server, count)
+        elapsed = resolve(channel, names)
+        print(f"cold cache: {elapsed / count * 1e6:.2f} us/query")
+
+        start = time.perf_counter()
+        channel.cache_save(path)
+        elapsed = time.perf_counter() - start
+        channel.close()
+        print(f"cache_save: {elapsed * 1e3:.1f} ms for {count} entries ({os.path.getsize(path) / 1e6:.1f} MB)")
+
+        channel = new_channel(server, count)
+        start = time.perf_counter()
+        channel.cache_load(path)
+        elapsed = time.perf_counter() - start
+        print(f"cache_load: {elapsed * 1e3:.3f} ms")
+
+        elapsed = resolve(channel, names)
+        print(f"snapshot hits: {elapsed / count * 1e6:.2f} us/query")
+        elapsed = resolve(channel, names)
+        print(f"cache hits: {elapsed / count * 1e6:.2f} us/query")
+        channel.close()
+    finally:
+        process.terminate()
+        process.wait()
+        os.remove(path)
+        os.rmdir(os.path.dirname(path))
+
+
+if __name__ == '__main__':
+    main()
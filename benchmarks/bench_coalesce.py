@@ -0,0 +1,56 @@
+"""
+Benchmark for query coalescing: a burst of identical queries, as sent by
+many concurrent requests for the same hostname, against a local responder
+(dnsserver.py) which answers after 20ms, with and without coalesce_queries.
+
+Without coalescing, the queries sent before the first answer arrives all go
+to the server, the later ones are answered by the c-ares query cache, and
+each answer is parsed separately.
+
+Usage: python benchmarks/bench_coalesce.py [queries]
+"""
+
+import sys
+import threading
+import time
+
+import dnsserver
+import pycares
+
+
+def run(label, server, count, coalesce):
+    channel = pycares.Channel(servers=[server], timeout=5.0, tries=2, coalesce_queries=coalesce)
+    done = threading.Event()
+    results = []
+
+    def cb(result, errorno):
+        results.append(errorno)
+        if len(results) == count:
+            done.set()
+
+    start = time.perf_counter()
+    for _ in range(count):
+        channel.query('backend.example.com', pycares.QUERY_TYPE_A, callback=cb)
+    done.wait()
+    elapsed = time.perf_counter() - start
+    channel.close()
+
+    errors = sum(1 for errorno in results if errorno is not None)
+    print(f"{label}: {elapsed / count * 1e6:.2f} us/query, "
+          f"{channel.queries_coalesced} coalesced, {errors} errors")
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+
+    process, server = dnsserver.start(delay=0.02)
+    try:
+        run('Channel.query()', server, count, False)
+        run('Channel.query(), coalesce_queries=True', server, count, True)
+    finally:
+        process.terminate()
+        process.wait()
+
+
+if __name__ == '__main__':
+    main()
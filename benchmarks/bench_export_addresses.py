@@ -0,0 +1,40 @@
+"""
+Benchmark for the bulk address export: gets the addresses of a large A
+record set as a list of records, with DNSResult.export_addresses(), from
+a LazyDNSResult and with parse_wire_addresses().
+
+Usage: python benchmarks/bench_export_addresses.py [records] [iterations]
+"""
+
+import sys
+import timeit
+
+import pycares
+
+from dnswire import response, rr
+
+
+def build_response(count):
+    name = 'pool.example.com'
+    answer = [rr(name, 'A', 300, f'10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}') for i in range(count)]
+    return response(name, 'A', answer)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    iterations = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+
+    buf = build_response(count)
+    cases = (
+        ('records', lambda: [r.data.addr for r in pycares.parse_wire(buf).answer]),
+        ('export_addresses', lambda: pycares.parse_wire(buf).export_addresses()),
+        ('lazy export_addresses', lambda: pycares.parse_wire(buf, lazy=True).export_addresses()),
+        ('parse_wire_addresses', lambda: pycares.parse_wire_addresses([buf])),
+    )
+    for label, func in cases:
+        elapsed = min(timeit.repeat(func, number=iterations, repeat=5))
+        print(f"{label}: {elapsed / iterations / count * 1e9:.0f} ns/address")
+
+
+if __name__ == '__main__':
+    main()
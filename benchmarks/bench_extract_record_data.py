@@ -0,0 +1,47 @@
+"""
+Microbenchmark for extract_record_data() over a response mixing all the
+supported record types.
+
+Usage: python benchmarks/bench_extract_record_data.py [iterations]
+"""
+
+import sys
+import timeit
+
+import pycares
+from pycares import _ffi, _lib
+
+from dnswire import mixed_response
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+
+    buf = mixed_response()
+    dnsrec_p = _ffi.new("ares_dns_record_t **")
+    status = _lib.ares_dns_parse(buf, len(buf), 0, dnsrec_p)
+    if status != _lib.ARES_SUCCESS:
+        raise pycares.AresError(status, pycares.errno.strerror(status))
+    dnsrec = dnsrec_p[0]
+
+    count = _lib.ares_dns_record_rr_cnt(dnsrec, _lib.ARES_SECTION_ANSWER)
+    rrs = []
+    for i in range(count):
+        rr = _lib.ares_dns_record_rr_get_const(dnsrec, _lib.ARES_SECTION_ANSWER, i)
+        rrs.append((rr, _lib.ares_dns_rr_get_type(rr)))
+
+    extract_record_data = pycares.extract_record_data
+
+    def run():
+        for rr, rec_type in rrs:
+            extract_record_data(rr, rec_type)
+
+    elapsed = min(timeit.repeat(run, number=iterations, repeat=5))
+    per_rr = elapsed / (iterations * len(rrs)) * 1e9
+    print(f"{len(rrs)} records x {iterations} iterations: {elapsed:.3f}s ({per_rr:.0f} ns/record)")
+
+    _lib.ares_dns_record_destroy(dnsrec)
+
+
+if __name__ == '__main__':
+    main()
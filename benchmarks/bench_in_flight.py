@@ -0,0 +1,86 @@
+"""
+Benchmark for the per-query bookkeeping of in-flight queries: registering the
+callback when a query is submitted and looking it up when it completes.
+
+getaddrinfo() for "localhost" is answered from the hosts file, so the
+round trip is dominated by the bookkeeping rather than by the network. The
+same load is also run from several threads, each with its own channel.
+Every measurement is the best of 3 runs.
+
+Usage: python benchmarks/bench_in_flight.py [queries] [threads]
+"""
+
+import socket
+import sys
+import threading
+import time
+
+import pycares
+
+
+def resolve(count):
+    channel = pycares.Channel()
+    done = 0
+
+    def cb(result, errorno):
+        nonlocal done
+        done += 1
+
+    for _ in range(count):
+        channel.getaddrinfo('localhost', None, family=socket.AF_INET, callback=cb)
+    channel.wait()
+    channel.close()
+    assert done == count
+
+
+def submit(count, server):
+    channel = pycares.Channel(servers=[server], timeout=60.0, tries=1)
+
+    def cb(result, errorno):
+        pass
+
+    start = time.perf_counter()
+    for _ in range(count):
+        channel.query('example.com', pycares.QUERY_TYPE_A, callback=cb)
+    elapsed = time.perf_counter() - start
+    channel.cancel()
+    channel.wait()
+    channel.close()
+    return elapsed
+
+
+def resolve_threads(count, nthreads):
+    threads = [threading.Thread(target=resolve, args=(count // nthreads,)) for _ in range(nthreads)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - start
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    nthreads = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+
+    elapsed = min(timed(resolve, count) for _ in range(3))
+    print(f"getaddrinfo round trip, 1 thread: {elapsed / count * 1e6:.2f} us/query")
+
+    elapsed = min(resolve_threads(count, nthreads) for _ in range(3))
+    print(f"getaddrinfo round trip, {nthreads} threads: {elapsed / count * 1e6:.2f} us/query")
+
+    blackhole = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    blackhole.bind(('127.0.0.1', 0))
+    server = '127.0.0.1:%d' % blackhole.getsockname()[1]
+    elapsed = min(submit(count, server) for _ in range(3))
+    print(f"query submission: {elapsed / count * 1e6:.2f} us/query")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,45 @@
+"""
+Benchmark for parse_dnsrec() on a typical response with records in the
+answer, authority and additional sections, parsing all sections or only
+the answer one.
+
+Usage: python benchmarks/bench_parse_dnsrec.py [iterations]
+"""
+
+import sys
+import timeit
+
+import pycares
+from pycares import _ffi, _lib
+
+from dnswire import response, rr
+
+
+def build_response():
+    name = 'example.com'
+    answer = [rr(name, 'A', 300, f'192.0.2.{i}') for i in range(1, 5)]
+    authority = [rr(name, 'NS', 3600, f'ns{i}.example.com') for i in range(1, 5)]
+    additional = [rr(f'ns{i}.example.com', 'A', 3600, f'198.51.100.{i}') for i in range(1, 5)]
+    additional += [rr(f'ns{i}.example.com', 'AAAA', 3600, f'2001:db8::{i}') for i in range(1, 5)]
+    return response(name, 'A', answer, authority, additional)
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+
+    buf = build_response()
+    dnsrec_p = _ffi.new("ares_dns_record_t **")
+    status = _lib.ares_dns_parse(buf, len(buf), 0, dnsrec_p)
+    if status != _lib.ARES_SUCCESS:
+        raise pycares.AresError(status, pycares.errno.strerror(status))
+    dnsrec = dnsrec_p[0]
+
+    for label, sections in (('all sections', None), ('answer only', (pycares.SECTION_ANSWER,))):
+        elapsed = min(timeit.repeat(lambda: pycares.parse_dnsrec(dnsrec, sections), number=iterations, repeat=5))
+        print(f"{label}: {elapsed / iterations * 1e6:.1f} us/response")
+
+    _lib.ares_dns_record_destroy(dnsrec)
+
+
+if __name__ == '__main__':
+    main()
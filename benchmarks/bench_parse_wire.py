@@ -0,0 +1,47 @@
+"""
+Benchmark for parse_wire_many(): parses a corpus of captured-like DNS
+responses in the calling process and spread on a process pool.
+
+Usage: python benchmarks/bench_parse_wire.py [messages] [processes]
+"""
+
+import concurrent.futures
+import os
+import sys
+import time
+
+import pycares
+
+from dnswire import response, rr
+
+
+def build_corpus(count):
+    messages = []
+    for i in range(count):
+        name = f'host{i}.example.com'
+        answer = [rr(name, 'A', 300, f'192.0.2.{j}') for j in range(1, 4)]
+        authority = [rr('example.com', 'NS', 3600, 'ns1.example.com')]
+        messages.append(response(name, 'A', answer, authority))
+    return messages
+
+
+def run(label, messages, **kwargs):
+    start = time.perf_counter()
+    results = pycares.parse_wire_many(messages, **kwargs)
+    elapsed = time.perf_counter() - start
+    assert all(status is None for _, status in results)
+    print(f"{label}: {elapsed:.2f}s ({len(messages) / elapsed:.0f} messages/s)")
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    processes = int(sys.argv[2]) if len(sys.argv) > 2 else os.cpu_count()
+
+    messages = build_corpus(count)
+    run('single process', messages)
+    with concurrent.futures.ProcessPoolExecutor(processes) as executor:
+        run(f'{processes} processes', messages, executor=executor, chunksize=5000)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+"""
+Benchmark for the submission cost of Channel.search() versus submitting
+a PreparedQuery with Channel.send().
+
+Queries are sent to a local socket which never answers and cancelled
+afterwards, only the time spent submitting them is measured.
+
+Usage: python benchmarks/bench_prepared_query.py [queries]
+"""
+
+import socket
+import sys
+import time
+
+import pycares
+
+
+def noop(result, errorno):
+    pass
+
+
+def run(label, submit, count, server):
+    channel = pycares.Channel(servers=[server], timeout=60.0, tries=1)
+    start = time.perf_counter()
+    submit(channel, count)
+    elapsed = time.perf_counter() - start
+    channel.cancel()
+    channel.wait()
+    channel.close()
+    print(f"{label}: {elapsed / count * 1e6:.2f} us/query")
+
+
+def submit_search(channel, count):
+    for _ in range(count):
+        channel.search('example.com', pycares.QUERY_TYPE_A, callback=noop)
+
+
+def submit_query(channel, count):
+    for _ in range(count):
+        channel.query('example.com', pycares.QUERY_TYPE_A, callback=noop)
+
+
+def submit_prepared(search):
+    def submit(channel, count):
+        query = pycares.PreparedQuery('example.com', pycares.QUERY_TYPE_A)
+        for _ in range(count):
+            channel.send(query, search=search, callback=noop)
+    return submit
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+
+    blackhole = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    blackhole.bind(('127.0.0.1', 0))
+    server = '127.0.0.1:%d' % blackhole.getsockname()[1]
+
+    run('Channel.query()', submit_query, count, server)
+    run('Channel.send(PreparedQuery)', submit_prepared(False), count, server)
+    run('Channel.search()', submit_search, count, server)
+    run('Channel.send(PreparedQuery, search=True)', submit_prepared(True), count, server)
+
+    blackhole.close()
+
+
+if __name__ == '__main__':
+    main()
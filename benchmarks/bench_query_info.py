@@ -0,0 +1,51 @@
+"""
+Benchmark for the cost of the per-query timeout and latency accounting:
+the time per query against a local responder (dnsserver.py), with the
+default callbacks and with query_info, which also gives each callback a
+QueryInfo.
+
+Usage: python benchmarks/bench_query_info.py [queries]
+"""
+
+import sys
+import threading
+import time
+
+import dnsserver
+import pycares
+
+
+def run(label, server, count, **kwargs):
+    channel = pycares.Channel(servers=[server], timeout=5.0, tries=2, qcache_max_ttl=0, **kwargs)
+    done = threading.Event()
+    results = []
+
+    def cb(result, errorno, *info):
+        results.append(errorno)
+        if len(results) == count:
+            done.set()
+
+    start = time.perf_counter()
+    for i in range(count):
+        channel.query('host%d.example.com' % i, pycares.QUERY_TYPE_A, callback=cb)
+    done.wait()
+    elapsed = time.perf_counter() - start
+    stats = channel.query_stats()
+    channel.close()
+    print(f"{label}: {elapsed / count * 1e6:.2f} us/query, latency mean {stats['latency_mean'] * 1e3:.2f} ms, max {stats['latency_max'] * 1e3:.2f} ms")
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+
+    process, server = dnsserver.start()
+    try:
+        run('default', server, count)
+        run('query_info', server, count, query_info=True)
+    finally:
+        process.terminate()
+        process.wait()
+
+
+if __name__ == '__main__':
+    main()
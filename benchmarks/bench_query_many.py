@@ -0,0 +1,57 @@
+"""
+Benchmark for the submission cost of a loop of Channel.query() calls versus
+a single Channel.query_many() call for the same names.
+
+Queries are sent to a local socket which never answers and cancelled
+afterwards, only the time spent submitting them is measured.
+
+Usage: python benchmarks/bench_query_many.py [queries]
+"""
+
+import socket
+import sys
+import time
+
+import pycares
+
+
+def noop(*args):
+    pass
+
+
+def run(label, submit, names, server):
+    channel = pycares.Channel(servers=[server], timeout=60.0, tries=1)
+    start = time.perf_counter()
+    submit(channel, names)
+    elapsed = time.perf_counter() - start
+    channel.cancel()
+    channel.wait()
+    channel.close()
+    print(f"{label}: {elapsed / len(names) * 1e6:.2f} us/query")
+
+
+def submit_query(channel, names):
+    for name in names:
+        channel.query(name, pycares.QUERY_TYPE_A, callback=noop)
+
+
+def submit_query_many(channel, names):
+    channel.query_many(names, pycares.QUERY_TYPE_A, callback=noop)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    names = ['host%d.example.com' % i for i in range(count)]
+
+    blackhole = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    blackhole.bind(('127.0.0.1', 0))
+    server = '127.0.0.1:%d' % blackhole.getsockname()[1]
+
+    run('Channel.query() loop', submit_query, names, server)
+    run('Channel.query_many()', submit_query_many, names, server)
+
+    blackhole.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,42 @@
+"""
+Memory benchmark for the result types: allocates a corpus of DNSRecord
+objects (A records by default) and reports the bytes used per record.
+
+Usage: python benchmarks/bench_record_memory.py [records]
+"""
+
+import sys
+import tracemalloc
+
+import pycares
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+
+    # Intern the field values so only the record objects themselves are measured
+    name = 'example.com'
+    addr = '192.0.2.1'
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    records = [
+        pycares.DNSRecord(
+            name=name,
+            type=pycares.QUERY_TYPE_A,
+            record_class=pycares.QUERY_CLASS_IN,
+            ttl=300,
+            data=pycares.ARecordData(addr=addr)
+        )
+        for _ in range(count)
+    ]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    per_record = (after - before) / count
+    print(f"{count} records: {(after - before) / 2**20:.1f} MiB ({per_record:.0f} bytes/record)")
+    del records
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+"""
+Benchmark for pycares.resolve_stream(): throughput and peak memory while
+resolving a stream of names against a local responder (dnsserver.py), for
+inputs of growing length. The peak memory should not grow with the input.
+
+Usage: python benchmarks/bench_resolve_stream.py [max_in_flight]
+"""
+
+import sys
+import time
+import tracemalloc
+
+import dnsserver
+import pycares
+
+
+def run(server, count, max_in_flight):
+    channel = pycares.Channel(servers=[server], timeout=5.0, tries=2)
+    names = ('host%d.example.com' % i for i in range(count))
+    errors = 0
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    for name, result, errorno in pycares.resolve_stream(channel, names, pycares.QUERY_TYPE_A, max_in_flight=max_in_flight):
+        if errorno is not None:
+            errors += 1
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    channel.close()
+
+    print(f"{count:>7} names: {count / elapsed:8.0f} queries/s, peak memory {peak / 1024:7.1f} KiB, {errors} errors")
+
+
+def main():
+    max_in_flight = int(sys.argv[1]) if len(sys.argv) > 1 else 256
+
+    process, server = dnsserver.start()
+    try:
+        print(f"max_in_flight={max_in_flight}")
+        for count in (10000, 50000, 200000):
+            run(server, count, max_in_flight)
+    finally:
+        process.terminate()
+        process.wait()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+"""
+Benchmark for repeated queries of a few names answered from a cache: the
+c-ares query cache, where each hit is parsed again, versus the response
+cache of the Channel (cache_size), where hits are answered with the result
+parsed before. Answers come from a local responder (dnsserver.py).
+
+Usage: python benchmarks/bench_response_cache.py [queries]
+"""
+
+import sys
+import threading
+import time
+
+import dnsserver
+import pycares
+
+NAMES = ['host%d.example.com' % i for i in range(10)]
+
+
+def run(label, server, count, **kwargs):
+    channel = pycares.Channel(servers=[server], timeout=5.0, tries=2, **kwargs)
+    done = threading.Event()
+    results = []
+
+    def cb(result, errorno):
+        results.append(errorno)
+        if len(results) == len(NAMES):
+            done.set()
+
+    # Fill the caches
+    for name in NAMES:
+        channel.query(name, pycares.QUERY_TYPE_A, callback=cb)
+    done.wait()
+
+    done.clear()
+    results.clear()
+    count -= count % len(NAMES)
+
+    def cb(result, errorno):
+        results.append(errorno)
+        if len(results) == count:
+            done.set()
+
+    start = time.perf_counter()
+    for i in range(count):
+        channel.query(NAMES[i % len(NAMES)], pycares.QUERY_TYPE_A, callback=cb)
+    done.wait()
+    elapsed = time.perf_counter() - start
+    channel.close()
+
+    print(f"{label}: {elapsed / count * 1e6:.2f} us/query")
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+
+    process, server = dnsserver.start()
+    try:
+        run('c-ares query cache', server, count)
+        run('Channel response cache', server, count, cache_size=1000, qcache_max_ttl=0)
+    finally:
+        process.terminate()
+        process.wait()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""
+Benchmark for a pool of worker processes resolving the same names, each with
+its own Channel and response cache: the number of queries sent upstream (to
+a local responder, see dnsserver.py) and the time per query, with and
+without a shared cache (the shared_cache option of Channel).
+
+Usage: python benchmarks/bench_shared_cache.py [workers] [names] [queries per worker]
+"""
+
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+import dnsserver
+import pycares
+
+
+def worker(server, names, count, shared_cache):
+    channel = pycares.Channel(servers=[server], timeout=5.0, tries=2, cache_size=len(names), qcache_max_ttl=0, shared_cache=shared_cache)
+    done = threading.Event()
+    results = []
+
+    def cb(result, errorno):
+        results.append(errorno)
+        if len(results) == count:
+            done.set()
+
+    start = time.perf_counter()
+    for _ in range(count):
+        channel.query(random.choice(names), pycares.QUERY_TYPE_A, callback=cb)
+    done.wait()
+    elapsed = time.perf_counter() - start
+    stats = channel.cache_stats()
+    channel.close()
+    return stats['misses'], elapsed
+
+
+def run(label, server, workers, names, count, shared_cache=None):
+    with multiprocessing.Pool(workers) as pool:
+        results = pool.starmap(worker, [(server, names, count, shared_cache)] * workers)
+    upstream = sum(misses for misses, _ in results)
+    elapsed = sum(elapsed for _, elapsed in results)
+    print(f"{label}: {upstream} upstream queries, {elapsed / (workers * count) * 1e6:.2f} us/query")
+
+
+def main():
+    workers = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 5000
+    per_worker = int(sys.argv[3]) if len(sys.argv) > 3 else 20000
+    names = ['host%d.example.com' % i for i in range(count)]
+    path = os.path.join(tempfile.mkdtemp(), 'shared.cache')
+
+    process, server = dnsserver.start()
+    try:
+        run('private caches', server, workers, names, per_worker)
+        run('shared cache', server, workers, names, per_worker, shared_cache=path)
+    finally:
+        process.terminate()
+        process.wait()
+        os.remove(path)
+        os.rmdir(os.path.dirname(path))
+
+
+if __name__ == '__main__':
+    main()
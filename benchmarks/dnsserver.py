@@ -0,0 +1,69 @@
+"""
+Minimal UDP DNS responder for the benchmarks which need a live server.
+
+Every query gets a single A record (192.0.2.1) for the name it asked about.
+The server runs in a separate process so it doesn't compete with the
+benchmark for the GIL.
+
+Usage: python benchmarks/dnsserver.py [delay] (prints the port it listens on)
+
+With a delay (in seconds) the answers are held back, like those of a remote
+server would be.
+"""
+
+import socket
+import struct
+import subprocess
+import sys
+import threading
+
+# Answer with a compression pointer to the name in the question
+ANSWER = b'\xc0\x0c' + struct.pack('!HHIH', 1, 1, 300, 4) + socket.inet_aton('192.0.2.1')
+
+
+def reply(query):
+    # Skip the question name, then its type and class
+    end = 12
+    while query[end]:
+        end += query[end] + 1
+    end += 5
+    header = query[:2] + struct.pack('!HHHHH', 0x8180, 1, 1, 0, 0)
+    return header + query[12:end] + ANSWER
+
+
+def send_reply(sock, query, addr):
+    try:
+        sock.sendto(reply(query), addr)
+    except (IndexError, OSError):
+        pass
+
+
+def serve(sock, delay=0.0):
+    while True:
+        query, addr = sock.recvfrom(4096)
+        if delay:
+            threading.Timer(delay, send_reply, (sock, query, addr)).start()
+        else:
+            send_reply(sock, query, addr)
+
+
+def start(delay=0.0):
+    """Start the server in a subprocess, returns (process, 'host:port')"""
+    process = subprocess.Popen([sys.executable, __file__, str(delay)], stdout=subprocess.PIPE, text=True)
+    port = int(process.stdout.readline())
+    return process, '127.0.0.1:%d' % port
+
+
+def main():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1024 * 1024)
+    sock.bind(('127.0.0.1', 0))
+    print(sock.getsockname()[1], flush=True)
+    try:
+        serve(sock, float(sys.argv[1]) if len(sys.argv) > 1 else 0.0)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
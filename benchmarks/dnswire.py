@@ -0,0 +1,86 @@
+"""
+Helpers to build DNS response messages in wire format.
+
+The benchmarks feed these to c-ares so they can run without network access.
+"""
+
+import socket
+import struct
+
+
+def encode_name(name):
+    out = b''
+    for label in name.rstrip('.').split('.'):
+        if label:
+            label = label.encode('ascii')
+            out += struct.pack('!B', len(label)) + label
+    return out + b'\x00'
+
+
+def charstr(data):
+    if isinstance(data, str):
+        data = data.encode('ascii')
+    return struct.pack('!B', len(data)) + data
+
+
+RDATA = {
+    'A': lambda addr: socket.inet_pton(socket.AF_INET, addr),
+    'AAAA': lambda addr: socket.inet_pton(socket.AF_INET6, addr),
+    'NS': lambda name: encode_name(name),
+    'CNAME': lambda name: encode_name(name),
+    'PTR': lambda name: encode_name(name),
+    'MX': lambda pref, exchange: struct.pack('!H', pref) + encode_name(exchange),
+    'TXT': lambda *chunks: b''.join(charstr(c) for c in chunks),
+    'SOA': lambda mname, rname, serial, refresh, retry, expire, minimum: (
+        encode_name(mname) + encode_name(rname) +
+        struct.pack('!IIIII', serial, refresh, retry, expire, minimum)),
+    'SRV': lambda prio, weight, port, target: struct.pack('!HHH', prio, weight, port) + encode_name(target),
+    'NAPTR': lambda order, pref, flags, services, regexp, replacement: (
+        struct.pack('!HH', order, pref) + charstr(flags) + charstr(services) +
+        charstr(regexp) + encode_name(replacement)),
+    'CAA': lambda critical, tag, value: struct.pack('!B', critical) + charstr(tag) + value.encode('ascii'),
+    'TLSA': lambda usage, selector, mtype, data: struct.pack('!BBB', usage, selector, mtype) + data,
+    'HTTPS': lambda prio, target, params: (
+        struct.pack('!H', prio) + encode_name(target) +
+        b''.join(struct.pack('!HH', k, len(v)) + v for k, v in params)),
+    'URI': lambda prio, weight, target: struct.pack('!HH', prio, weight) + target.encode('ascii'),
+}
+
+TYPES = {
+    'A': 1, 'NS': 2, 'CNAME': 5, 'SOA': 6, 'PTR': 12, 'MX': 15, 'TXT': 16,
+    'AAAA': 28, 'SRV': 33, 'NAPTR': 35, 'TLSA': 52, 'HTTPS': 65, 'URI': 256,
+    'CAA': 257,
+}
+
+
+def rr(name, rtype, ttl, *args):
+    rdata = RDATA[rtype](*args)
+    return encode_name(name) + struct.pack('!HHIH', TYPES[rtype], 1, ttl, len(rdata)) + rdata
+
+
+def response(qname, qtype, answer=(), authority=(), additional=(), qid=0x1234, rcode=0):
+    header = struct.pack('!HHHHHH', qid, 0x8180 | rcode, 1, len(answer), len(authority), len(additional))
+    question = encode_name(qname) + struct.pack('!HH', TYPES[qtype], 1)
+    return header + question + b''.join(answer) + b''.join(authority) + b''.join(additional)
+
+
+def mixed_response():
+    """A response carrying one record of every type pycares knows about."""
+    name = 'example.com'
+    answer = [
+        rr(name, 'A', 300, '192.0.2.1'),
+        rr(name, 'AAAA', 300, '2001:db8::1'),
+        rr(name, 'NS', 300, 'ns1.example.com'),
+        rr(name, 'CNAME', 300, 'www.example.com'),
+        rr(name, 'PTR', 300, 'host.example.com'),
+        rr(name, 'MX', 300, 10, 'mail.example.com'),
+        rr(name, 'TXT', 300, 'v=spf1 -all'),
+        rr(name, 'SOA', 300, 'ns1.example.com', 'hostmaster.example.com', 1, 7200, 3600, 1209600, 300),
+        rr(name, 'SRV', 300, 10, 5, 5060, 'sip.example.com'),
+        rr(name, 'NAPTR', 300, 100, 10, 'S', 'SIP+D2U', '', '_sip._udp.example.com'),
+        rr(name, 'CAA', 300, 0, 'issue', 'letsencrypt.org'),
+        rr(name, 'TLSA', 300, 3, 1, 1, b'\xab' * 32),
+        rr(name, 'HTTPS', 300, 1, '', [(1, b'\x02h2')]),
+        rr(name, 'URI', 300, 10, 1, 'https://www.example.com/'),
+    ]
+    return response(name, 'A', answer)
@@ -1,4 +1,7 @@
 
+# pycares.aio provides a ready to use resolver, this example shows how to
+# integrate a channel with the asyncio event loop manually.
+
 import asyncio
 import socket
 
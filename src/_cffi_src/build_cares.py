@@ -260,6 +260,7 @@ typedef int... ares_socklen_t;
 #define ARES_OPT_EDNSPSZ        ...
 #define ARES_OPT_RESOLVCONF     ...
 #define ARES_OPT_EVENT_THREAD   ...
+#define ARES_OPT_QUERY_CACHE    ...
 
 #define ARES_NI_NOFQDN                  ...
 #define ARES_NI_NUMERICHOST             ...
@@ -539,6 +540,50 @@ struct ares_addrinfo_hints {
   int ai_socktype;
   int ai_protocol;
 };
+
+/* pycares helpers, see HELPERS */
+#define PYCARES_ADDRSTRLEN ...
+#define PYCARES_RR_FILL_ADDR_TEXT ...
+
+typedef struct {
+  const ares_dns_rr_t *rr;
+  const char          *name;
+  unsigned int         type;
+  unsigned int         rclass;
+  unsigned int         ttl;
+  unsigned int         ints[5];
+  const char          *strs[4];
+  const unsigned char *bin;
+  size_t               bin_len;
+  char                 addr[...];
+  ...;
+} pycares_rr_t;
+
+/* Completion ring, see COMPLETION_RING */
+#define PYCARES_COMPLETION_DNSREC ...
+#define PYCARES_COMPLETION_ADDRINFO ...
+
+typedef struct {
+  size_t  index;
+  int     kind;
+  int     status;
+  size_t  timeouts;
+  void   *result;
+  ...;
+} pycares_completion_t;
+
+typedef struct {
+  pycares_completion_t *entries;
+  size_t                mask;
+  ...;
+} pycares_ring_t;
+
+typedef struct {
+  pycares_ring_t *ring;
+  void           *owner;
+  size_t          index;
+  ...;
+} pycares_slot_t;
 """
 
 FUNCTIONS = """
@@ -597,6 +642,12 @@ ares_status_t ares_query_dnsrec(ares_channel channel,
                                 void *arg,
                                 unsigned short *qid);
 
+ares_status_t ares_send_dnsrec(ares_channel channel,
+                               const ares_dns_record_t *dnsrec,
+                               ares_callback_dnsrec callback,
+                               void *arg,
+                               unsigned short *qid);
+
 ares_status_t ares_search_dnsrec(ares_channel channel,
                                  const ares_dns_record_t *dnsrec,
                                  ares_callback_dnsrec callback,
@@ -615,6 +666,17 @@ ares_status_t ares_dns_record_query_add(ares_dns_record_t *dnsrec,
 
 void ares_dns_record_destroy(ares_dns_record_t *dnsrec);
 
+ares_dns_record_t *ares_dns_record_duplicate(const ares_dns_record_t *dnsrec);
+
+ares_status_t ares_dns_parse(const unsigned char *buf,
+                             size_t buf_len,
+                             unsigned int flags,
+                             ares_dns_record_t **dnsrec);
+
+ares_status_t ares_dns_write(const ares_dns_record_t *dnsrec,
+                             unsigned char **buf,
+                             size_t *buf_len);
+
 size_t ares_dns_record_rr_cnt(const ares_dns_record_t *dnsrec,
                               ares_dns_section_t sect);
 
@@ -712,6 +774,90 @@ int ares_inet_pton(int af, const char *src, void *dst);
 ares_bool_t ares_threadsafety(void);
 
 ares_status_t ares_queue_wait_empty(ares_channel channel, int timeout_ms);
+
+/* pycares helpers, see HELPERS */
+void pycares_rr_fill(const ares_dns_rr_t *rr, pycares_rr_t *out, int flags);
+
+size_t pycares_section_fill(const ares_dns_record_t *dnsrec,
+                            ares_dns_section_t sect,
+                            pycares_rr_t *out,
+                            size_t max,
+                            int flags);
+
+size_t pycares_section_addrs(const ares_dns_record_t *dnsrec,
+                             ares_dns_section_t sect,
+                             int family,
+                             unsigned char *addrs,
+                             unsigned int *ttls,
+                             size_t max);
+
+unsigned int pycares_answer_ttl(const ares_dns_record_t *dnsrec);
+
+unsigned int pycares_negative_ttl(const ares_dns_record_t *dnsrec);
+
+/* Completion ring, see COMPLETION_RING */
+void pycares_ring_dnsrec_cb(void *arg,
+                            ares_status_t status,
+                            size_t timeouts,
+                            const ares_dns_record_t *dnsrec);
+
+void pycares_ring_addrinfo_cb(void *arg,
+                              int status,
+                              int timeouts,
+                              struct ares_addrinfo *res);
+
+void pycares_query_many(ares_channel channel,
+                        const char *names,
+                        size_t count,
+                        ares_dns_class_t dnsclass,
+                        ares_dns_rec_type_t type,
+                        ares_callback_dnsrec callback,
+                        void **args);
+
+void pycares_getaddrinfo_many(ares_channel channel,
+                              const char *names,
+                              size_t count,
+                              const char *service,
+                              const struct ares_addrinfo_hints *hints,
+                              ares_addrinfo_callback callback,
+                              void **args);
+
+void pycares_host_cb(void *arg,
+                     int status,
+                     int timeouts,
+                     struct hostent *hostent);
+
+void pycares_nameinfo_cb(void *arg,
+                         int status,
+                         int timeouts,
+                         char *node,
+                         char *service);
+
+void pycares_query_dnsrec_cb(void *arg,
+                             ares_status_t status,
+                             size_t timeouts,
+                             const ares_dns_record_t *dnsrec);
+
+void pycares_addrinfo_cb(void *arg,
+                         int status,
+                         int timeouts,
+                         struct ares_addrinfo *res);
+
+void pycares_ring_init(pycares_ring_t *ring,
+                       pycares_completion_t *entries,
+                       size_t size);
+
+size_t pycares_ring_pop(pycares_ring_t *ring,
+                        pycares_completion_t *out,
+                        size_t max);
+
+size_t pycares_ring_size(pycares_ring_t *ring);
+
+void pycares_ring_set_notify(pycares_ring_t *ring, ares_socket_t fd);
+
+int pycares_ring_arm(pycares_ring_t *ring);
+
+void pycares_ring_notify(pycares_ring_t *ring);
 """
 
 CALLBACKS = """
@@ -720,26 +866,37 @@ extern "Python" void _sock_state_cb(void *data,
                                     int readable,
                                     int writable);
 
-extern "Python" void _host_cb(void *arg,
-                              int status,
-                              int timeouts,
-                              struct hostent *hostent);
-
-extern "Python" void _nameinfo_cb(void *arg,
-                                  int status,
-                                  int timeouts,
-                                  char *node,
-                                  char *service);
-
-extern "Python" void _query_dnsrec_cb(void *arg,
-                                      ares_status_t status,
-                                      size_t timeouts,
-                                      const ares_dns_record_t *dnsrec);
-
-extern "Python" void _addrinfo_cb(void *arg,
-                                  int status,
-                                  int timeouts,
-                                  struct ares_addrinfo *res);
+extern "Python+C" void _host_cb(void *owner,
+                                size_t index,
+                                int status,
+                                int timeouts,
+                                struct hostent *hostent);
+
+extern "Python+C" void _nameinfo_cb(void *owner,
+                                    size_t index,
+                                    int status,
+                                    int timeouts,
+                                    char *node,
+                                    char *service);
+
+extern "Python+C" void _query_dnsrec_cb(void *owner,
+                                        size_t index,
+                                        ares_status_t status,
+                                        size_t timeouts,
+                                        const ares_dns_record_t *dnsrec);
+
+extern "Python+C" void _addrinfo_cb(void *owner,
+                                    size_t index,
+                                    int status,
+                                    int timeouts,
+                                    struct ares_addrinfo *res);
+
+extern "Python+C" void _completion_overflow_cb(void *owner,
+                                               size_t index,
+                                               int kind,
+                                               int status,
+                                               size_t timeouts,
+                                               void *result);
 """
 
 INCLUDES = """
@@ -754,9 +911,514 @@ INCLUDES = """
 #endif
 #include <ares.h>
 #include <ares_dns_record.h>
+#include <string.h>
+"""
+
+# Helpers which read all the fields of a resource record in one go, so
+# building its Python representation takes a single call into C.
+HELPERS = """
+#define PYCARES_ADDRSTRLEN 64
+
+/* Flags for pycares_rr_fill */
+#define PYCARES_RR_FILL_ADDR_TEXT 1
+
+typedef struct {
+  const ares_dns_rr_t *rr;
+  const char          *name;
+  unsigned int         type;
+  unsigned int         rclass;
+  unsigned int         ttl;
+  /* Type specific fields, in the order of the *RecordData dataclasses */
+  unsigned int         ints[5];
+  const char          *strs[4];
+  /* Binary data, for A and AAAA records the packed address */
+  const unsigned char *bin;
+  size_t               bin_len;
+  /* Text form of A and AAAA addresses, with PYCARES_RR_FILL_ADDR_TEXT */
+  char                 addr[PYCARES_ADDRSTRLEN];
+} pycares_rr_t;
+
+/* An IPv4 address as an integer, in host byte order */
+static unsigned int pycares_addr4_to_uint(const unsigned char *b)
+{
+  return ((unsigned int)b[0] << 24) | ((unsigned int)b[1] << 16) |
+         ((unsigned int)b[2] << 8) | (unsigned int)b[3];
+}
+
+static void pycares_rr_fill(const ares_dns_rr_t *rr, pycares_rr_t *out, int flags)
+{
+  const void *addr;
+
+  memset(out, 0, sizeof(*out));
+  out->rr     = rr;
+  out->name   = ares_dns_rr_get_name(rr);
+  out->type   = (unsigned int)ares_dns_rr_get_type(rr);
+  out->rclass = (unsigned int)ares_dns_rr_get_class(rr);
+  out->ttl    = ares_dns_rr_get_ttl(rr);
+
+  switch (ares_dns_rr_get_type(rr)) {
+    case ARES_REC_TYPE_A:
+      addr = ares_dns_rr_get_addr(rr, ARES_RR_A_ADDR);
+      if (addr != NULL) {
+        out->bin     = addr;
+        out->bin_len = sizeof(struct in_addr);
+        out->ints[0] = pycares_addr4_to_uint(addr);
+        if (flags & PYCARES_RR_FILL_ADDR_TEXT) {
+          ares_inet_ntop(AF_INET, addr, out->addr, sizeof(out->addr));
+        }
+      }
+      break;
+    case ARES_REC_TYPE_AAAA:
+      addr = ares_dns_rr_get_addr6(rr, ARES_RR_AAAA_ADDR);
+      if (addr != NULL) {
+        out->bin     = addr;
+        out->bin_len = sizeof(struct ares_in6_addr);
+        if (flags & PYCARES_RR_FILL_ADDR_TEXT) {
+          ares_inet_ntop(AF_INET6, addr, out->addr, sizeof(out->addr));
+        }
+      }
+      break;
+    case ARES_REC_TYPE_NS:
+      out->strs[0] = ares_dns_rr_get_str(rr, ARES_RR_NS_NSDNAME);
+      break;
+    case ARES_REC_TYPE_CNAME:
+      out->strs[0] = ares_dns_rr_get_str(rr, ARES_RR_CNAME_CNAME);
+      break;
+    case ARES_REC_TYPE_PTR:
+      out->strs[0] = ares_dns_rr_get_str(rr, ARES_RR_PTR_DNAME);
+      break;
+    case ARES_REC_TYPE_MX:
+      out->ints[0] = ares_dns_rr_get_u16(rr, ARES_RR_MX_PREFERENCE);
+      out->strs[0] = ares_dns_rr_get_str(rr, ARES_RR_MX_EXCHANGE);
+      break;
+    case ARES_REC_TYPE_TXT:
+      /* The chunks come back concatenated */
+      out->bin = ares_dns_rr_get_bin(rr, ARES_RR_TXT_DATA, &out->bin_len);
+      break;
+    case ARES_REC_TYPE_CAA:
+      out->ints[0] = ares_dns_rr_get_u8(rr, ARES_RR_CAA_CRITICAL);
+      out->strs[0] = ares_dns_rr_get_str(rr, ARES_RR_CAA_TAG);
+      out->bin     = ares_dns_rr_get_bin(rr, ARES_RR_CAA_VALUE, &out->bin_len);
+      break;
+    case ARES_REC_TYPE_SOA:
+      out->strs[0] = ares_dns_rr_get_str(rr, ARES_RR_SOA_MNAME);
+      out->strs[1] = ares_dns_rr_get_str(rr, ARES_RR_SOA_RNAME);
+      out->ints[0] = ares_dns_rr_get_u32(rr, ARES_RR_SOA_SERIAL);
+      out->ints[1] = ares_dns_rr_get_u32(rr, ARES_RR_SOA_REFRESH);
+      out->ints[2] = ares_dns_rr_get_u32(rr, ARES_RR_SOA_RETRY);
+      out->ints[3] = ares_dns_rr_get_u32(rr, ARES_RR_SOA_EXPIRE);
+      out->ints[4] = ares_dns_rr_get_u32(rr, ARES_RR_SOA_MINIMUM);
+      break;
+    case ARES_REC_TYPE_SRV:
+      out->ints[0] = ares_dns_rr_get_u16(rr, ARES_RR_SRV_PRIORITY);
+      out->ints[1] = ares_dns_rr_get_u16(rr, ARES_RR_SRV_WEIGHT);
+      out->ints[2] = ares_dns_rr_get_u16(rr, ARES_RR_SRV_PORT);
+      out->strs[0] = ares_dns_rr_get_str(rr, ARES_RR_SRV_TARGET);
+      break;
+    case ARES_REC_TYPE_NAPTR:
+      out->ints[0] = ares_dns_rr_get_u16(rr, ARES_RR_NAPTR_ORDER);
+      out->ints[1] = ares_dns_rr_get_u16(rr, ARES_RR_NAPTR_PREFERENCE);
+      out->strs[0] = ares_dns_rr_get_str(rr, ARES_RR_NAPTR_FLAGS);
+      out->strs[1] = ares_dns_rr_get_str(rr, ARES_RR_NAPTR_SERVICES);
+      out->strs[2] = ares_dns_rr_get_str(rr, ARES_RR_NAPTR_REGEXP);
+      out->strs[3] = ares_dns_rr_get_str(rr, ARES_RR_NAPTR_REPLACEMENT);
+      break;
+    case ARES_REC_TYPE_TLSA:
+      out->ints[0] = ares_dns_rr_get_u8(rr, ARES_RR_TLSA_CERT_USAGE);
+      out->ints[1] = ares_dns_rr_get_u8(rr, ARES_RR_TLSA_SELECTOR);
+      out->ints[2] = ares_dns_rr_get_u8(rr, ARES_RR_TLSA_MATCH);
+      out->bin     = ares_dns_rr_get_bin(rr, ARES_RR_TLSA_DATA, &out->bin_len);
+      break;
+    case ARES_REC_TYPE_HTTPS:
+      /* The params are read from Python, there is a variable number of them */
+      out->ints[0] = ares_dns_rr_get_u16(rr, ARES_RR_HTTPS_PRIORITY);
+      out->strs[0] = ares_dns_rr_get_str(rr, ARES_RR_HTTPS_TARGET);
+      break;
+    case ARES_REC_TYPE_URI:
+      out->ints[0] = ares_dns_rr_get_u16(rr, ARES_RR_URI_PRIORITY);
+      out->ints[1] = ares_dns_rr_get_u16(rr, ARES_RR_URI_WEIGHT);
+      out->strs[0] = ares_dns_rr_get_str(rr, ARES_RR_URI_TARGET);
+      break;
+    default:
+      break;
+  }
+}
+
+static size_t pycares_section_fill(const ares_dns_record_t *dnsrec,
+                                   ares_dns_section_t sect,
+                                   pycares_rr_t *out,
+                                   size_t max,
+                                   int flags)
+{
+  size_t cnt = ares_dns_record_rr_cnt(dnsrec, sect);
+  size_t i;
+  size_t n = 0;
+
+  if (cnt > max) {
+    cnt = max;
+  }
+
+  for (i = 0; i < cnt; i++) {
+    const ares_dns_rr_t *rr = ares_dns_record_rr_get_const(dnsrec, sect, i);
+    if (rr != NULL) {
+      pycares_rr_fill(rr, &out[n++], flags);
+    }
+  }
+
+  return n;
+}
+
+/* Copy the addresses of the A (AF_INET) or AAAA (AF_INET6) records in a
+ * section to addrs, as integers or 16 byte values respectively, and their
+ * TTLs to ttls. Returns the number of addresses copied. */
+static size_t pycares_section_addrs(const ares_dns_record_t *dnsrec,
+                                    ares_dns_section_t sect,
+                                    int family,
+                                    unsigned char *addrs,
+                                    unsigned int *ttls,
+                                    size_t max)
+{
+  size_t cnt = ares_dns_record_rr_cnt(dnsrec, sect);
+  size_t i;
+  size_t n = 0;
+
+  for (i = 0; i < cnt && n < max; i++) {
+    const ares_dns_rr_t *rr = ares_dns_record_rr_get_const(dnsrec, sect, i);
+    if (rr == NULL) {
+      continue;
+    }
+
+    if (family == AF_INET && ares_dns_rr_get_type(rr) == ARES_REC_TYPE_A) {
+      const struct in_addr *addr = ares_dns_rr_get_addr(rr, ARES_RR_A_ADDR);
+      unsigned int          value;
+      if (addr == NULL) {
+        continue;
+      }
+      value = pycares_addr4_to_uint((const unsigned char *)addr);
+      memcpy(addrs + n * sizeof(value), &value, sizeof(value));
+    } else if (family == AF_INET6 &&
+               ares_dns_rr_get_type(rr) == ARES_REC_TYPE_AAAA) {
+      const struct ares_in6_addr *addr =
+        ares_dns_rr_get_addr6(rr, ARES_RR_AAAA_ADDR);
+      if (addr == NULL) {
+        continue;
+      }
+      memcpy(addrs + n * sizeof(*addr), addr, sizeof(*addr));
+    } else {
+      continue;
+    }
+
+    ttls[n++] = ares_dns_rr_get_ttl(rr);
+  }
+
+  return n;
+}
+
+/* Lowest TTL of the records in the answer section, 0 if there are none. */
+static unsigned int pycares_answer_ttl(const ares_dns_record_t *dnsrec)
+{
+  size_t       cnt = ares_dns_record_rr_cnt(dnsrec, ARES_SECTION_ANSWER);
+  size_t       i;
+  unsigned int ttl   = 0;
+  int          found = 0;
+
+  for (i = 0; i < cnt; i++) {
+    const ares_dns_rr_t *rr =
+      ares_dns_record_rr_get_const(dnsrec, ARES_SECTION_ANSWER, i);
+    unsigned int rr_ttl;
+    if (rr == NULL) {
+      continue;
+    }
+    rr_ttl = ares_dns_rr_get_ttl(rr);
+    if (!found || rr_ttl < ttl) {
+      ttl   = rr_ttl;
+      found = 1;
+    }
+  }
+
+  return ttl;
+}
+
+/* TTL of a negative answer (RFC 2308 section 5): the lower of the TTL and
+ * the MINIMUM field of the SOA record in the authority section, 0 if there
+ * is none. */
+static unsigned int pycares_negative_ttl(const ares_dns_record_t *dnsrec)
+{
+  size_t cnt = ares_dns_record_rr_cnt(dnsrec, ARES_SECTION_AUTHORITY);
+  size_t i;
+
+  for (i = 0; i < cnt; i++) {
+    const ares_dns_rr_t *rr =
+      ares_dns_record_rr_get_const(dnsrec, ARES_SECTION_AUTHORITY, i);
+    unsigned int ttl;
+    unsigned int minimum;
+    if (rr == NULL || ares_dns_rr_get_type(rr) != ARES_REC_TYPE_SOA) {
+      continue;
+    }
+    ttl     = ares_dns_rr_get_ttl(rr);
+    minimum = ares_dns_rr_get_u32(rr, ARES_RR_SOA_MINIMUM);
+    return ttl < minimum ? ttl : minimum;
+  }
+
+  return 0;
+}
+
+/* Batch submission: names holds count NUL terminated names back to back and
+ * args the callback argument of each query. c-ares calls the callback of
+ * every query, also when it fails to submit it. */
+static void pycares_query_many(ares_channel_t *channel, const char *names,
+                               size_t count, ares_dns_class_t dnsclass,
+                               ares_dns_rec_type_t type,
+                               ares_callback_dnsrec callback, void **args)
+{
+  size_t i;
+
+  for (i = 0; i < count; i++) {
+    ares_query_dnsrec(channel, names, dnsclass, type, callback, args[i], NULL);
+    names += strlen(names) + 1;
+  }
+}
+
+static void pycares_getaddrinfo_many(ares_channel_t *channel,
+                                     const char *names, size_t count,
+                                     const char *service,
+                                     const struct ares_addrinfo_hints *hints,
+                                     ares_addrinfo_callback callback,
+                                     void **args)
+{
+  size_t i;
+
+  for (i = 0; i < count; i++) {
+    ares_getaddrinfo(channel, names, service, hints, callback, args[i]);
+    names += strlen(names) + 1;
+  }
+}
+"""
+
+# Completion ring: queries submitted with the pycares_ring_* callbacks don't
+# run any Python code when they complete. The callbacks (which run on the
+# c-ares event thread) push the result to a ring buffer which Python drains,
+# in batches, on a thread of its choice.
+#
+# The ring has a single producer and a single consumer. c-ares invokes query
+# callbacks with the channel lock held, so pushes are serialized, and Python
+# only lets one thread pop at a time. When the ring is full the completion is
+# handed to _completion_overflow_cb instead, which takes the GIL.
+#
+# Optionally the ring notifies a file descriptor (an eventfd, a pipe or a
+# socket) when completions are pushed, once per burst: the consumer arms the
+# ring when it's done draining it and the first push after that disarms it
+# and writes to the descriptor.
+COMPLETION_RING = """
+#if defined(_MSC_VER)
+#  include <windows.h>
+#  define PYCARES_LOAD_ACQUIRE(p) \
+     InterlockedCompareExchange64((volatile LONG64 *)(p), 0, 0)
+#  define PYCARES_STORE_RELEASE(p, v) \
+     InterlockedExchange64((volatile LONG64 *)(p), (LONG64)(v))
+#  define PYCARES_EXCHANGE(p, v) \
+     InterlockedExchange64((volatile LONG64 *)(p), (LONG64)(v))
+#else
+#  include <unistd.h>
+#  define PYCARES_LOAD_ACQUIRE(p)     __atomic_load_n((p), __ATOMIC_ACQUIRE)
+#  define PYCARES_STORE_RELEASE(p, v) __atomic_store_n((p), (v), __ATOMIC_RELEASE)
+#  define PYCARES_EXCHANGE(p, v)      __atomic_exchange_n((p), (v), __ATOMIC_SEQ_CST)
+#endif
+
+#define PYCARES_COMPLETION_DNSREC   1
+#define PYCARES_COMPLETION_ADDRINFO 2
+
+typedef struct {
+  size_t  index;    /* pycares_slot_t index of the query */
+  int     kind;     /* PYCARES_COMPLETION_* */
+  int     status;
+  size_t  timeouts;
+  void   *result;   /* ares_dns_record_t * or struct ares_addrinfo *, owned */
+} pycares_completion_t;
+
+typedef struct {
+  pycares_completion_t *entries;
+  size_t                mask;   /* number of entries - 1, a power of 2 */
+  long long             head;   /* next entry to pop, written by the consumer */
+  long long             tail;   /* next entry to push, written by the producer */
+  long long             armed;  /* notify_fd must be written on the next push */
+  ares_socket_t         notify_fd;
+} pycares_ring_t;
+
+/* In-flight query slot, the callback argument of every query. Slots are
+ * preallocated and reused by the in-flight table of each channel (owner is
+ * its cffi handle). ring is only set for queries delivered through a ring. */
+typedef struct {
+  pycares_ring_t *ring;
+  void           *owner;
+  size_t          index;
+} pycares_slot_t;
+
+void _completion_overflow_cb(void *owner, size_t index, int kind, int status,
+                             size_t timeouts, void *result);
+void _host_cb(void *owner, size_t index, int status, int timeouts,
+              struct hostent *hostent);
+void _nameinfo_cb(void *owner, size_t index, int status, int timeouts,
+                  char *node, char *service);
+void _query_dnsrec_cb(void *owner, size_t index, ares_status_t status,
+                      size_t timeouts, const ares_dns_record_t *dnsrec);
+void _addrinfo_cb(void *owner, size_t index, int status, int timeouts,
+                  struct ares_addrinfo *res);
+
+/* size must be a power of 2 */
+static void pycares_ring_init(pycares_ring_t *ring,
+                              pycares_completion_t *entries, size_t size)
+{
+  memset(ring, 0, sizeof(*ring));
+  ring->entries   = entries;
+  ring->mask      = size - 1;
+  ring->notify_fd = ARES_SOCKET_BAD;
+}
+
+static void pycares_ring_notify(pycares_ring_t *ring)
+{
+  unsigned long long one = 1;
+
+  if (ring->notify_fd == ARES_SOCKET_BAD || !PYCARES_EXCHANGE(&ring->armed, 0)) {
+    return;
+  }
+
+  /* The descriptor is non-blocking, if it's full a wakeup is pending already.
+   * Eventfds need the 8 bytes, pipes and sockets don't care. */
+#if defined(_WIN32)
+  send(ring->notify_fd, (const char *)&one, sizeof(one), 0);
+#else
+  if (write(ring->notify_fd, &one, sizeof(one)) < 0) {
+    /* Nothing to do */
+  }
+#endif
+}
+
+static void pycares_ring_set_notify(pycares_ring_t *ring, ares_socket_t fd)
+{
+  ring->notify_fd = fd;
+  PYCARES_EXCHANGE(&ring->armed, 1);
+}
+
+/* Arm the notification again, returns whether completions were pushed
+ * meanwhile (which didn't notify) */
+static int pycares_ring_arm(pycares_ring_t *ring)
+{
+  PYCARES_EXCHANGE(&ring->armed, 1);
+  return PYCARES_LOAD_ACQUIRE(&ring->tail) != PYCARES_LOAD_ACQUIRE(&ring->head);
+}
+
+static void pycares_ring_push(pycares_slot_t *slot, int kind, int status,
+                              size_t timeouts, void *result)
+{
+  pycares_ring_t       *ring = slot->ring;
+  long long             tail = ring->tail;
+  long long             head = PYCARES_LOAD_ACQUIRE(&ring->head);
+  pycares_completion_t *entry;
+
+  if ((size_t)(tail - head) > ring->mask) {
+    _completion_overflow_cb(slot->owner, slot->index, kind, status, timeouts,
+                            result);
+    return;
+  }
+
+  entry           = &ring->entries[(size_t)tail & ring->mask];
+  entry->index    = slot->index;
+  entry->kind     = kind;
+  entry->status   = status;
+  entry->timeouts = timeouts;
+  entry->result   = result;
+  PYCARES_STORE_RELEASE(&ring->tail, tail + 1);
+  pycares_ring_notify(ring);
+}
+
+static void pycares_ring_dnsrec_cb(void *arg, ares_status_t status,
+                                   size_t timeouts,
+                                   const ares_dns_record_t *dnsrec)
+{
+  ares_dns_record_t *dup = NULL;
+
+  /* c-ares frees the record when the callback returns. Negative answers are
+   * kept for their SOA record, see pycares_negative_ttl() */
+  if ((status == ARES_SUCCESS || status == ARES_ENOTFOUND ||
+       status == ARES_ENODATA) &&
+      dnsrec != NULL) {
+    dup = ares_dns_record_duplicate(dnsrec);
+    if (dup == NULL && status == ARES_SUCCESS) {
+      status = ARES_ENOMEM;
+    }
+  }
+
+  pycares_ring_push(arg, PYCARES_COMPLETION_DNSREC, (int)status, timeouts, dup);
+}
+
+static void pycares_ring_addrinfo_cb(void *arg, int status, int timeouts,
+                                     struct ares_addrinfo *res)
+{
+  /* The result is owned by the callback already */
+  pycares_ring_push(arg, PYCARES_COMPLETION_ADDRINFO, status, (size_t)timeouts,
+                    res);
+}
+
+/* Callbacks of the queries delivered directly, they unpack the slot so the
+ * Python side gets its owner and index as is */
+static void pycares_host_cb(void *arg, int status, int timeouts,
+                            struct hostent *hostent)
+{
+  pycares_slot_t *slot = arg;
+  _host_cb(slot->owner, slot->index, status, timeouts, hostent);
+}
+
+static void pycares_nameinfo_cb(void *arg, int status, int timeouts,
+                                char *node, char *service)
+{
+  pycares_slot_t *slot = arg;
+  _nameinfo_cb(slot->owner, slot->index, status, timeouts, node, service);
+}
+
+static void pycares_query_dnsrec_cb(void *arg, ares_status_t status,
+                                    size_t timeouts,
+                                    const ares_dns_record_t *dnsrec)
+{
+  pycares_slot_t *slot = arg;
+  _query_dnsrec_cb(slot->owner, slot->index, status, timeouts, dnsrec);
+}
+
+static void pycares_addrinfo_cb(void *arg, int status, int timeouts,
+                                struct ares_addrinfo *res)
+{
+  pycares_slot_t *slot = arg;
+  _addrinfo_cb(slot->owner, slot->index, status, timeouts, res);
+}
+
+static size_t pycares_ring_pop(pycares_ring_t *ring, pycares_completion_t *out,
+                               size_t max)
+{
+  long long head = ring->head;
+  long long tail = PYCARES_LOAD_ACQUIRE(&ring->tail);
+  size_t    n    = (size_t)(tail - head);
+  size_t    i;
+
+  if (n > max) {
+    n = max;
+  }
+
+  for (i = 0; i < n; i++) {
+    out[i] = ring->entries[(size_t)(head + (long long)i) & ring->mask];
+  }
+
+  PYCARES_STORE_RELEASE(&ring->head, head + (long long)n);
+  return n;
+}
+
+static size_t pycares_ring_size(pycares_ring_t *ring)
+{
+  return (size_t)(PYCARES_LOAD_ACQUIRE(&ring->tail) -
+                  PYCARES_LOAD_ACQUIRE(&ring->head));
+}
 """
 
 
 ffi = cffi.FFI()
 ffi.cdef(PLATFORM_TYPES + TYPES + FUNCTIONS + CALLBACKS)
-ffi.set_source('_cares', INCLUDES)
+ffi.set_source('_cares', INCLUDES + HELPERS + COMPLETION_RING)
@@ -12,14 +12,36 @@ from . import errno
 from .utils import ascii_bytes, maybe_str, parse_name
 from ._version import __version__
 
+import array
+import collections
+import copy
+import functools
+import hashlib
+import ipaddress
+import itertools
 import math
+import mmap
+import os
+import random
+import select
 import socket
+import struct
+import sys
+import tempfile
 import threading
-from collections.abc import Callable, Iterable
-from dataclasses import dataclass
+import time
+import traceback
+from collections.abc import Callable, Iterable, Iterator, Sequence
+from dataclasses import dataclass, fields, is_dataclass
 from typing import Any, Callable, Literal, Optional, Dict, Union
 from queue import SimpleQueue
 
+try:
+    import fcntl
+except ImportError:
+    # Windows
+    fcntl = None
+
 IP4 = tuple[str, int]
 IP6 = tuple[str, int, int, int]
 
@@ -79,6 +101,19 @@ QUERY_CLASS_HS = _lib.ARES_CLASS_HESOID
 QUERY_CLASS_NONE = _lib.ARES_CLASS_NONE
 QUERY_CLASS_ANY = _lib.ARES_CLASS_ANY
 
+# Result sections
+SECTION_ANSWER = _lib.ARES_SECTION_ANSWER
+SECTION_AUTHORITY = _lib.ARES_SECTION_AUTHORITY
+SECTION_ADDITIONAL = _lib.ARES_SECTION_ADDITIONAL
+_ALL_SECTIONS = frozenset((SECTION_ANSWER, SECTION_AUTHORITY, SECTION_ADDITIONAL))
+
+# Address formats
+ADDRESS_FORMAT_TEXT = 0
+ADDRESS_FORMAT_PACKED = 1
+ADDRESS_FORMAT_INT = 2
+ADDRESS_FORMAT_IPADDRESS = 3
+_ADDRESS_FORMATS = frozenset((ADDRESS_FORMAT_TEXT, ADDRESS_FORMAT_PACKED, ADDRESS_FORMAT_INT, ADDRESS_FORMAT_IPADDRESS))
+
 ARES_VERSION = maybe_str(_ffi.string(_lib.ares_version(_ffi.NULL)))
 PYCARES_ADDRTTL_SIZE = 256
 
@@ -89,89 +124,1495 @@ class AresError(Exception):
 
 # callback helpers
 
-_handle_to_channel: Dict[Any, "Channel"] = {}  # Maps handle to channel to prevent use-after-free
+# In-flight tables of the open channels
+_in_flight_tables: set = set()
+
+
+class _InFlightTable:
+    """
+    Callback data of the queries in flight on a Channel.
+
+    Each query gets a preallocated pycares_slot_t, which is passed to c-ares as
+    the callback argument, and its data is stored at the slot index. Slots are
+    reused once the callback ran, and allocated in chunks which never move
+    while the channel is alive.
+
+    Tables are referenced from _in_flight_tables until their channel is
+    closed, and they reference the channel of each query in flight, so a
+    channel stays alive while it has queries in flight.
+
+    The submit time of each query is kept too, and the completions counted
+    by finish(), see Channel.query_stats().
+    """
+
+    _MIN_CHUNK_SIZE = 64
+
+    # Callback data of the slot of a query which failed at submit time,
+    # while its completion is still in the completion ring
+    _ABANDONED = object()
+
+    def __init__(self, completions: Optional["_CompletionRing"] = None) -> None:
+        self.handle = _ffi.new_handle(self)
+        self.completions = completions
+        self._ring = completions.ring if completions is not None else _ffi.NULL
+        self._grow_lock = threading.Lock()
+        self._chunks: list = []
+        self._slots: list = []
+        self._data: list = []
+        self._channels: list = []
+        self._started: list = []
+        self._free: list = []
+        # Give the callbacks a QueryInfo, see Channel(query_info=True)
+        self.query_info = False
+        self._stats_lock = threading.Lock()
+        self.completed = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.timed_out = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+
+    def __len__(self) -> int:
+        return len(self._data) - len(self._free)
+
+    def _grow(self) -> None:
+        with self._grow_lock:
+            if self._free:
+                # Grown by another thread meanwhile
+                return
+            # Double the number of slots
+            size = max(self._MIN_CHUNK_SIZE, len(self._slots))
+            chunk = _ffi.new("pycares_slot_t[]", size)
+            first = len(self._slots)
+            for i in range(size):
+                slot = chunk + i
+                slot.ring = self._ring
+                slot.owner = self.handle
+                slot.index = first + i
+                self._slots.append(slot)
+            self._chunks.append(chunk)
+            self._data.extend([None] * size)
+            self._channels.extend([None] * size)
+            self._started.extend([0.0] * size)
+            self._free.extend(range(first + size - 1, first - 1, -1))
+
+    def acquire(self, channel: "Channel", data: Any):
+        """Store the callback data of a new query, returns its slot"""
+        while True:
+            try:
+                index = self._free.pop()
+                break
+            except IndexError:
+                self._grow()
+        self._data[index] = data
+        self._channels[index] = channel
+        self._started[index] = time.monotonic()
+        return self._slots[index]
+
+    def acquire_many(self, channel: "Channel", data: list) -> list:
+        """Store the callback data of several new queries, returns their slots"""
+        slots = self._slots
+        free = self._free
+        now = time.monotonic()
+        result = []
+        for item in data:
+            while True:
+                try:
+                    index = free.pop()
+                    break
+                except IndexError:
+                    self._grow()
+            self._data[index] = item
+            self._channels[index] = channel
+            self._started[index] = now
+            result.append(slots[index])
+        return result
+
+    def release(self, index: int, data: Any = None) -> Any:
+        """
+        Free the slot of a query, returns its callback data. If data is given,
+        only if the slot still belongs to it.
+        """
+        current = self._data[index]
+        if current is None or (data is not None and current is not data):
+            return None
+        self._data[index] = None
+        self._channels[index] = None
+        self._free.append(index)
+        return current
+
+    def abandon(self, index: int, data: Any, status: int) -> tuple:
+        """
+        Count a query which failed at submit time, while its completion is
+        still in the completion ring. Returns its callback data, for the
+        callback to run right away, None if the completion was processed
+        already, and its QueryInfo if query_info is set.
+
+        The slot is only freed when the completion is processed, otherwise
+        the completion would be delivered to the next query of the slot.
+        """
+        if self._data[index] is not data:
+            return None, None
+        self._data[index] = self._ABANDONED
+        self._channels[index] = None
+        return data, self._count(self._started[index], status, 0)
+
+    def finish(self, index: int, status: int, timeouts: int) -> tuple:
+        """
+        Free the slot of a completed query and count it. Returns its
+        callback data, None if it was released or abandoned already, and
+        its QueryInfo if query_info is set.
+        """
+        # The slot can be reused as soon as it's released
+        started = self._started[index]
+        data = self.release(index)
+        if data is None or data is self._ABANDONED:
+            return None, None
+        return data, self._count(started, status, timeouts)
+
+    def _count(self, started: float, status: int, timeouts: int) -> Optional["QueryInfo"]:
+        latency = time.monotonic() - started
+        with self._stats_lock:
+            self.completed += 1
+            if status != _lib.ARES_SUCCESS:
+                self.errors += 1
+            if timeouts:
+                self.timeouts += timeouts
+                self.timed_out += 1
+            self.latency_total += latency
+            if latency > self.latency_max:
+                self.latency_max = latency
+        return QueryInfo(timeouts, latency, False) if self.query_info else None
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            return {
+                'completed': self.completed,
+                'errors': self.errors,
+                'timeouts': self.timeouts,
+                'timed_out': self.timed_out,
+                'latency_mean': self.latency_total / self.completed if self.completed else 0.0,
+                'latency_max': self.latency_max,
+            }
+
+
+class _CompletionInfo(threading.local):
+    # QueryInfo of the query whose callback is running on this thread
+    info: Optional["QueryInfo"] = None
+
+
+_completion_info = _CompletionInfo()
+
+
+def _run_callback(callback: Callable, result: Any, status: Optional[int], info: Optional["QueryInfo"]) -> None:
+    """
+    Run the callback of a completed query. The QueryInfo, if any, is handed
+    to the user callback (a _QueryInfoCallback) through _completion_info,
+    past the callbacks of the response cache and of the coalescer which
+    may wrap it.
+    """
+    if info is None:
+        callback(result, status)
+        return
+    previous = _completion_info.info
+    _completion_info.info = info
+    try:
+        callback(result, status)
+    finally:
+        _completion_info.info = previous
+
+
+class _QueryInfoCallback:
+    """Callback of a channel with query_info, which also gets the QueryInfo of the query"""
+
+    __slots__ = ('callback',)
+
+    def __init__(self, callback: Callable) -> None:
+        self.callback = callback
+
+    def __call__(self, result: Any, status: Optional[int]) -> None:
+        info = _completion_info.info
+        # Hits of the response cache, also for queries made by the callback
+        _completion_info.info = None
+        try:
+            self.callback(result, status, info if info is not None else QueryInfo(0, 0.0, True))
+        finally:
+            _completion_info.info = info
+
+
+class _QueryCoalescer:
+    """
+    Identical queries in flight on a Channel. The first query for a key goes
+    to c-ares, later ones wait for its answer, and every waiter gets its own
+    copy of the result.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._waiters: dict = {}
+        self.coalesced = 0
+
+    def join(self, key: tuple, callback: Callable) -> Optional[list]:
+        """
+        Add a waiter for key. Returns the list of waiters if the caller must
+        submit the query, None if it's waiting for one in flight.
+        """
+        with self._lock:
+            waiters = self._waiters.get(key)
+            if waiters is not None:
+                waiters.append(callback)
+                self.coalesced += 1
+                return None
+            waiters = self._waiters[key] = [callback]
+            return waiters
+
+    def _pop(self, key: tuple, waiters: list) -> bool:
+        with self._lock:
+            if self._waiters.get(key) is not waiters:
+                return False
+            del self._waiters[key]
+            return True
+
+    def complete(self, key: tuple, waiters: list, result: Any, status: Optional[int]) -> None:
+        """Callback of the submitted query, hands its result to every waiter"""
+        self._pop(key, waiters)
+        for i, callback in enumerate(waiters):
+            try:
+                callback(result if i == 0 else _copy_result(result), status)
+            except Exception:
+                traceback.print_exc()
+
+    def abandon(self, key: tuple, waiters: list, status: int) -> None:
+        """The query could not be submitted, fail the waiters other than the submitter"""
+        if self._pop(key, waiters):
+            self.complete(key, waiters[1:], None, status)
+
+
+# Values which results can share with their copies
+_IMMUTABLE_TYPES = frozenset((type(None), bool, int, float, str, bytes, tuple, ipaddress.IPv4Address, ipaddress.IPv6Address))
+# Field names of the result types of this module, by type
+_copy_fields: Dict[type, tuple] = {}
+
+
+def _copy_records(records: list) -> list:
+    return [DNSRecord(r.name, r.type, r.record_class, r.ttl, _copy_value(r.data)) for r in records]
+
+
+def _copy_value(value: Any) -> Any:
+    cls = type(value)
+    if cls in _IMMUTABLE_TYPES:
+        return value
+    if cls is DNSResult:
+        return DNSResult(_copy_records(value.answer), _copy_records(value.authority), _copy_records(value.additional))
+    if cls is list:
+        return [_copy_value(item) for item in value]
+    names = _copy_fields.get(cls)
+    if names is None:
+        if cls.__module__ != __name__ or not is_dataclass(cls):
+            # Record data of registered extractors
+            return copy.deepcopy(value)
+        names = _copy_fields[cls] = tuple(f.name for f in fields(cls))
+    return cls(*[_copy_value(getattr(value, name)) for name in names])
+
+
+def _copy_result(result: Any) -> Any:
+    """
+    Copy of a result which several callbacks get, so that each of them can
+    change its own, or release() it.
+    """
+    if isinstance(result, LazyDNSResult):
+        dnsrec = _lib.ares_dns_record_duplicate(result._get_dnsrec())
+        if dnsrec == _ffi.NULL:
+            raise MemoryError()
+        return LazyDNSResult(dnsrec, result._sections, result._address_format)
+    return _copy_value(result)
+
+
+class _CacheEntry:
+    __slots__ = ('result', 'errorno', 'wire', 'expires', 'stale_until', 'prefetch_at', 'retry_at', 'hits', 'refreshing')
+
+    def __init__(self, result: Any, errorno: Optional[int], wire: Optional[bytes], expires: float, stale_until: float, prefetch_at: float) -> None:
+        self.result = result
+        self.errorno = errorno
+        # Response in wire format, for snapshots
+        self.wire = wire
+        self.expires = expires
+        self.stale_until = stale_until
+        self.prefetch_at = prefetch_at
+        self.retry_at = 0.0
+        self.hits = 0
+        self.refreshing = False
+
+
+_CACHE_COUNTERS = ('hits', 'negative_hits', 'stale_hits', 'snapshot_hits', 'shared_hits', 'misses', 'evictions',
+                   'rejections', 'prefetches', 'refreshes', 'refresh_failures')
+
+
+class _FrequencySketch:
+    """
+    Count-min sketch of the popularity of cache keys, for TinyLFU: 4 rows of
+    counters saturating at 15, all halved every 10 * capacity increments so
+    that the popularity of keys which are not looked up anymore fades.
+    """
+
+    __slots__ = ('_table', '_width', '_mask', '_additions', '_sample_size')
+
+    SEEDS = (0x9E3779B97F4A7C15, 0xC2B2AE3D27D4EB4F, 0x165667B19E3779F9, 0xD6E8FEB86659FD93)
+
+    def __init__(self, capacity: int) -> None:
+        width = 16
+        while width < capacity:
+            width *= 2
+        self._table = bytearray(width * len(self.SEEDS))
+        self._width = width
+        self._mask = width - 1
+        self._additions = 0
+        self._sample_size = 10 * capacity
+
+    def _indexes(self, key: tuple) -> list:
+        h = hash(key) & 0xffffffffffffffff
+        return [row * self._width + ((((h * seed) & 0xffffffffffffffff) >> 32) & self._mask)
+                for row, seed in enumerate(self.SEEDS)]
+
+    def increment(self, key: tuple) -> None:
+        table = self._table
+        added = False
+        for i in self._indexes(key):
+            if table[i] < 15:
+                table[i] += 1
+                added = True
+        if added:
+            self._additions += 1
+            if self._additions >= self._sample_size:
+                self._table = bytearray(c >> 1 for c in table)
+                self._additions //= 2
+
+    def frequency(self, key: tuple) -> int:
+        table = self._table
+        return min(table[i] for i in self._indexes(key))
+
+
+def _cache_key_name(key: tuple) -> bytes:
+    return key[1] if key[0] == 'getaddrinfo' else key[0]
+
+
+def _name_labels(name: bytes) -> list:
+    """Labels of name, from the top level domain down"""
+    labels = name.rstrip(b'.').split(b'.')
+    labels.reverse()
+    return labels
+
+
+class _LabelIndex:
+    """
+    Cache keys by name, in a tree of the labels of the names from the top
+    level domain down, so the keys of a domain and all its subdomains are
+    found without going over the whole cache.
+    """
+
+    __slots__ = ('_root',)
+
+    def __init__(self) -> None:
+        # Nodes are [children by label, keys]
+        self._root: list = [{}, set()]
+
+    def __bool__(self) -> bool:
+        return bool(self._root[0] or self._root[1])
+
+    def add(self, name: bytes, key: tuple) -> None:
+        node = self._root
+        for label in _name_labels(name):
+            child = node[0].get(label)
+            if child is None:
+                child = node[0][label] = [{}, set()]
+            node = child
+        node[1].add(key)
+
+    def remove(self, name: bytes, key: tuple) -> None:
+        path = []
+        node = self._root
+        for label in _name_labels(name):
+            path.append((node, label))
+            node = node[0].get(label)
+            if node is None:
+                return
+        node[1].discard(key)
+        # Prune the nodes left empty
+        while path and not node[0] and not node[1]:
+            node, label = path.pop()
+            del node[0][label]
+
+    def find_domains(self, name: bytes) -> list:
+        """Keys of name and of the domains above it"""
+        keys = []
+        node = self._root
+        for label in _name_labels(name):
+            node = node[0].get(label)
+            if node is None:
+                break
+            keys.extend(node[1])
+        return keys
+
+    def find(self, name: bytes, subdomains: bool = False) -> list:
+        """Keys of name, and of its subdomains if subdomains is True"""
+        node = self._root
+        for label in _name_labels(name):
+            node = node[0].get(label)
+            if node is None:
+                return []
+        if not subdomains:
+            return list(node[1])
+        keys = []
+        nodes = [node]
+        while nodes:
+            node = nodes.pop()
+            keys.extend(node[1])
+            nodes.extend(node[0].values())
+        return keys
+
+
+class _CacheShard:
+    """
+    Entries of the response cache whose key hashes to the same shard,
+    guarded by their own lock, and indexed by name.
+
+    With the lru policy, the least recently used entry is evicted when the
+    shard is full. With tinylfu (W-TinyLFU), new entries go to a small LRU
+    window, 1% of the shard. The entries evicted from the window only
+    replace the least recently used entry of the main LRU list if their key
+    is more popular according to a frequency sketch of the lookups,
+    otherwise they are dropped (rejected). A burst of one-off lookups then
+    can't evict the popular entries.
+    """
+
+    def __init__(self, maxsize: int, tinylfu: bool) -> None:
+        self.lock = threading.Lock()
+        self.maxsize = maxsize
+        # Least recently used first
+        self.main: collections.OrderedDict = collections.OrderedDict()
+        self.window: Optional[collections.OrderedDict] = collections.OrderedDict() if tinylfu else None
+        self.window_size = max(1, maxsize // 100) if tinylfu else 0
+        self.sketch = _FrequencySketch(maxsize) if tinylfu else None
+        self.names = _LabelIndex()
+        self.negative = 0
+        # Size of the responses in wire format
+        self.bytes = 0
+        self.counters = dict.fromkeys(_CACHE_COUNTERS, 0)
+
+    def __len__(self) -> int:
+        return len(self.main) + (len(self.window) if self.window is not None else 0)
+
+    def items(self) -> Iterator[tuple]:
+        yield from self.main.items()
+        if self.window is not None:
+            yield from self.window.items()
+
+    def find(self, key: tuple) -> Optional[_CacheEntry]:
+        entry = self.main.get(key)
+        if entry is None and self.window is not None:
+            entry = self.window.get(key)
+        return entry
+
+    def touch(self, key: tuple) -> None:
+        if key in self.main:
+            self.main.move_to_end(key)
+        else:
+            self.window.move_to_end(key)
+
+    def _account(self, entry: _CacheEntry, sign: int) -> None:
+        if entry.errorno is not None:
+            self.negative += sign
+        if entry.wire is not None:
+            self.bytes += sign * len(entry.wire)
+
+    def _removed(self, key: tuple, entry: _CacheEntry) -> None:
+        self._account(entry, -1)
+        self.names.remove(_cache_key_name(key), key)
+
+    def discard(self, key: tuple) -> None:
+        entry = self.main.pop(key, None)
+        if entry is None:
+            entry = self.window.pop(key)
+        self._removed(key, entry)
+
+    def clear(self) -> int:
+        count = len(self)
+        self.main.clear()
+        if self.window is not None:
+            self.window.clear()
+        self.names = _LabelIndex()
+        self.negative = 0
+        self.bytes = 0
+        return count
+
+    def insert(self, key: tuple, entry: _CacheEntry) -> None:
+        self._account(entry, 1)
+        # Updated entries stay where they are
+        for entries in (self.main, self.window):
+            if entries is not None and key in entries:
+                self._account(entries[key], -1)
+                entries[key] = entry
+                entries.move_to_end(key)
+                return
+        self.names.add(_cache_key_name(key), key)
+
+        if self.window is None:
+            self.main[key] = entry
+            if len(self.main) > self.maxsize:
+                self.discard(next(iter(self.main)))
+                self.counters['evictions'] += 1
+            return
+
+        self.window[key] = entry
+        if len(self.window) <= self.window_size:
+            return
+        candidate_key, candidate = self.window.popitem(last=False)
+        if len(self.main) < self.maxsize - self.window_size:
+            self.main[candidate_key] = candidate
+            return
+        victim_key = next(iter(self.main), None)
+        if victim_key is not None and self.sketch.frequency(candidate_key) > self.sketch.frequency(victim_key):
+            self.discard(victim_key)
+            self.main[candidate_key] = candidate
+            self.counters['evictions'] += 1
+        else:
+            self._removed(candidate_key, candidate)
+            self.counters['rejections'] += 1
+
+
+class _ResponseCache:
+    """
+    Parsed query results of a Channel, kept until the lowest TTL of their
+    answers expires. Entries are spread over shards, by key hash, each with
+    its own lock and its own eviction policy (see _CacheShard), so threads
+    using the same Channel don't all wait for a single lock.
+
+    Negative answers (NXDOMAIN and NODATA) are cached too, for the TTL given
+    by the SOA record of their authority section as per RFC 2308, capped at
+    max_negative_ttl. Answers without a SOA record are not cached.
+
+    Expired entries are served for stale_ttl more seconds as per RFC 8767,
+    while a single refresh is in flight. Entries with prefetch_hits hits are
+    refreshed before they expire, on a hit in the last prefetch fraction of
+    their TTL. Refresh times are spread by a random jitter.
+
+    On misses, and for expired entries, the shared cache and a snapshot
+    loaded with load_snapshot() are looked up. The entries found there are
+    parsed with the parse function and moved to the cache. Answers are also
+    stored in the shared cache.
+    """
+
+    # Time before a failed refresh of a stale entry is retried (RFC 8767)
+    STALE_REFRESH_INTERVAL = 30.0
+
+    def __init__(self,
+                 maxsize: int,
+                 max_negative_ttl: int,
+                 stale_ttl: int = 0,
+                 prefetch: float = 0.0,
+                 prefetch_hits: int = 2,
+                 jitter: float = 0.1,
+                 *,
+                 shards: int = 1,
+                 policy: str = 'lru',
+                 keep_wire: bool = False,
+                 parse: Optional[Callable[[tuple, bytes], Any]] = None,
+                 shared: Optional["_SharedCache"] = None) -> None:
+        if maxsize < 1:
+            raise ValueError('cache_size must be a positive number')
+        if max_negative_ttl < 0:
+            raise ValueError('negative_cache_max_ttl cannot be negative')
+        if stale_ttl < 0:
+            raise ValueError('cache_stale_ttl cannot be negative')
+        if not 0.0 <= prefetch < 1.0:
+            raise ValueError('cache_prefetch must be between 0 and 1')
+        if not 0.0 <= jitter < 1.0:
+            raise ValueError('cache_jitter must be between 0 and 1')
+        if not 1 <= shards <= maxsize:
+            raise ValueError('cache_shards must be between 1 and cache_size')
+        if policy not in ('lru', 'tinylfu'):
+            raise ValueError('cache_policy must be lru or tinylfu')
+        self.maxsize = maxsize
+        self.max_negative_ttl = max_negative_ttl
+        self.stale_ttl = stale_ttl
+        self.prefetch = prefetch
+        self.prefetch_hits = prefetch_hits
+        self.jitter = jitter
+        self._shards = [_CacheShard(maxsize // shards + (1 if i < maxsize % shards else 0), policy == 'tinylfu')
+                        for i in range(shards)]
+        self._parse = parse
+        # Keep the responses in wire format, which snapshots and the shared
+        # cache are made of. It takes a serialization per cached response.
+        self.keep_wire = keep_wire or shared is not None
+        self._snapshot: Optional[_CacheSnapshot] = None
+        # Names and domains flushed since the snapshot was loaded
+        self._snapshot_flushed = _LabelIndex()
+        self._shared = shared
+
+    def __len__(self) -> int:
+        return sum(len(shard) for shard in self._shards)
+
+    def _shard(self, key: tuple) -> _CacheShard:
+        shards = self._shards
+        return shards[hash(key) % len(shards)] if len(shards) > 1 else shards[0]
+
+    def _jittered(self, value: float) -> float:
+        return value * random.uniform(1.0 - self.jitter, 1.0 + self.jitter)
+
+    def get(self, key: tuple) -> Optional[tuple]:
+        """
+        Cached (result, errorno, refresh) for key, None if there is none or
+        it expired. If refresh is True, the caller must refresh the entry,
+        and call refreshed() with the outcome. The result is the cached one,
+        callbacks get a copy of it (_copy_result()).
+        """
+        now = time.monotonic()
+        shard = self._shard(key)
+        with shard.lock:
+            if shard.sketch is not None:
+                shard.sketch.increment(key)
+            counters = shard.counters
+            entry = shard.find(key)
+            if (entry is None or entry.expires <= now) and key[0] != 'getaddrinfo':
+                entry = self._take(shard, key, now, entry)
+            if entry is not None:
+                if entry.expires > now:
+                    shard.touch(key)
+                    entry.hits += 1
+                    if entry.errorno is None:
+                        counters['hits'] += 1
+                    else:
+                        counters['negative_hits'] += 1
+                    refresh = now >= entry.prefetch_at and entry.hits >= self.prefetch_hits and not entry.refreshing
+                    if refresh:
+                        entry.refreshing = True
+                        counters['prefetches'] += 1
+                    return entry.result, entry.errorno, refresh
+                if entry.stale_until > now:
+                    shard.touch(key)
+                    counters['stale_hits'] += 1
+                    refresh = now >= entry.retry_at and not entry.refreshing
+                    if refresh:
+                        entry.refreshing = True
+                        counters['refreshes'] += 1
+                    return entry.result, entry.errorno, refresh
+                shard.discard(key)
+            counters['misses'] += 1
+            return None
+
+    def _prefetch_at(self, expires: float, ttl: float, errorno: Optional[int]) -> float:
+        if self.prefetch and errorno is None:
+            return expires - self._jittered(ttl * self.prefetch)
+        return math.inf
+
+    def put(self, key: tuple, result: Any, errorno: Optional[int], ttl: int, wire: Optional[bytes] = None) -> None:
+        expires = time.monotonic() + ttl
+        entry = _CacheEntry(result, errorno, wire, expires, expires + self.stale_ttl, self._prefetch_at(expires, ttl, errorno))
+        shard = self._shard(key)
+        with shard.lock:
+            shard.insert(key, entry)
+        if self._shared is not None and key[0] != 'getaddrinfo' and (wire is not None or errorno is not None):
+            expires = time.time() + ttl
+            self._shared.store(key, expires, expires + self.stale_ttl, errorno, wire)
+
+    def _store(self, key: tuple, result: Any, status: Optional[int]) -> Any:
+        """Cache the outcome of a query, returns its result for the callback"""
+        if status is None:
+            result, ttl, wire = result
+            if ttl > 0:
+                self.put(key, result, None, ttl, wire)
+                return result
+        elif result is not None:
+            if status in _NEGATIVE_STATUSES:
+                ttl = min(result, self.max_negative_ttl)
+                if ttl > 0:
+                    self.put(key, None, status, ttl)
+                    return None
+            result = None
+        self._refresh_failed(key)
+        return result
+
+    def _refresh_failed(self, key: tuple) -> None:
+        # Keep serving the entry, if it's stale, and retry later
+        shard = self._shard(key)
+        with shard.lock:
+            entry = shard.find(key)
+            if entry is not None and entry.refreshing:
+                entry.refreshing = False
+                entry.retry_at = time.monotonic() + self._jittered(self.STALE_REFRESH_INTERVAL)
+                shard.counters['refresh_failures'] += 1
+
+    def complete(self, key: tuple, callback: Callable, result: Any, status: Optional[int]) -> None:
+        """
+        Callback of a query sent on a cache miss. The result comes from a
+        _TTLParser: a (result, ttl, wire) tuple on success, the negative TTL
+        (or None) on failure.
+        """
+        # The cached result stays private to the cache
+        callback(_copy_result(self._store(key, result, status)), status)
+
+    def refreshed(self, key: tuple, result: Any, status: Optional[int]) -> None:
+        """Callback of a query sent to refresh an entry, see complete()"""
+        self._store(key, result, status)
+
+    def _lock_all(self) -> None:
+        for shard in self._shards:
+            shard.lock.acquire()
+
+    def _unlock_all(self) -> None:
+        for shard in self._shards:
+            shard.lock.release()
+
+    def load_snapshot(self, snapshot: "_CacheSnapshot") -> None:
+        self._lock_all()
+        try:
+            old, self._snapshot = self._snapshot, snapshot
+            self._snapshot_flushed = _LabelIndex()
+        finally:
+            self._unlock_all()
+        if old is not None:
+            old.close()
+
+    def _flushed_from_snapshot(self, name: bytes) -> bool:
+        # Flushed names are marked 'name', flushed domains 'suffix'
+        flushed = self._snapshot_flushed
+        return bool(flushed) and ('suffix' in flushed.find_domains(name) or 'name' in flushed.find(name))
+
+    def _take(self, shard: _CacheShard, key: tuple, now: float, entry: Optional[_CacheEntry]) -> Optional[_CacheEntry]:
+        """
+        Move the entry of key from the shared cache or the snapshot to the
+        shard. An expired entry is only replaced by one which isn't.
+        Called with the lock of the shard held.
+        """
+        if self._shared is not None:
+            found = self._take_from(self._shared, shard, key, now, entry)
+            if found is not None:
+                shard.counters['shared_hits'] += 1
+                return found
+        if self._snapshot is not None and not self._flushed_from_snapshot(key[0]):
+            found = self._take_from(self._snapshot, shard, key, now, entry)
+            if found is not None:
+                shard.counters['snapshot_hits'] += 1
+                return found
+        return entry
+
+    def _take_from(self, source: Any, shard: _CacheShard, key: tuple, now: float, entry: Optional[_CacheEntry]) -> Optional[_CacheEntry]:
+        record = source.lookup(key)
+        if record is None:
+            return None
+        # Expiry times are saved as wall clock times, the cache uses the
+        # monotonic clock
+        expires, stale_until, errorno, wire = record
+        offset = now - time.time()
+        expires += offset
+        stale_until += offset
+        if stale_until <= now or (entry is not None and expires <= now):
+            return None
+        result = None
+        if errorno is None:
+            result = self._parse(key, wire)
+            if result is None:
+                return None
+        else:
+            wire = None
+        entry = _CacheEntry(result, errorno, wire, expires, stale_until, self._prefetch_at(expires, expires - now, errorno))
+        shard.insert(key, entry)
+        return entry
+
+    def save_snapshot(self, path: Union[str, bytes, os.PathLike]) -> int:
+        now = time.monotonic()
+        offset = time.time() - now
+        records = {}
+        self._lock_all()
+        try:
+            snapshot = self._snapshot
+            if snapshot is not None:
+                # Entries of the loaded snapshot which were not used yet
+                for key, expires, stale_until, errorno, wire in snapshot.records():
+                    if stale_until - offset > now and not self._flushed_from_snapshot(key[0]):
+                        records[key] = (expires, stale_until, errorno, wire)
+            for shard in self._shards:
+                for key, entry in shard.items():
+                    if key[0] == 'getaddrinfo' or entry.stale_until <= now:
+                        continue
+                    if entry.errorno is None and entry.wire is None:
+                        continue
+                    records[key[:3]] = (entry.expires + offset, entry.stale_until + offset, entry.errorno, entry.wire)
+        finally:
+            self._unlock_all()
+        _CacheSnapshot.write(path, records)
+        return len(records)
+
+    def flush(self, name: Optional[bytes] = None, suffix: Optional[bytes] = None) -> int:
+        """
+        Remove the entries of name, or of suffix and its subdomains, or all
+        of them, from the cache, the shared cache and the loaded snapshot.
+        Returns the number of entries removed from the cache.
+        """
+        count = 0
+        self._lock_all()
+        try:
+            for shard in self._shards:
+                if name is None and suffix is None:
+                    count += shard.clear()
+                    continue
+                keys = shard.names.find(name) if name is not None else shard.names.find(suffix, subdomains=True)
+                for key in keys:
+                    shard.discard(key)
+                count += len(keys)
+
+            if name is None and suffix is None:
+                snapshot, self._snapshot = self._snapshot, None
+                if snapshot is not None:
+                    snapshot.close()
+            elif self._snapshot is not None:
+                # Snapshots are read-only, remember what to skip
+                self._snapshot_flushed.add(name if name is not None else suffix, 'name' if name is not None else 'suffix')
+            shared = self._shared
+        finally:
+            self._unlock_all()
+
+        if shared is not None:
+            if name is not None:
+                shared.flush(lambda n: n.rstrip(b'.') == name)
+            elif suffix is not None:
+                dotted = b'.' + suffix
+                shared.flush(lambda n: n.rstrip(b'.') == suffix or n.rstrip(b'.').endswith(dotted))
+            else:
+                shared.flush()
+        return count
+
+    def entries(self) -> list:
+        """(key, entry) of the entries which can still be served"""
+        now = time.monotonic()
+        entries = []
+        for shard in self._shards:
+            with shard.lock:
+                entries.extend((key, entry) for key, entry in shard.items() if entry.stale_until > now)
+        return entries
+
+    def close(self) -> None:
+        self._lock_all()
+        try:
+            snapshot, self._snapshot = self._snapshot, None
+            shared, self._shared = self._shared, None
+        finally:
+            self._unlock_all()
+        if snapshot is not None:
+            snapshot.close()
+        if shared is not None:
+            shared.close()
+
+    def stats(self) -> dict:
+        stats = dict.fromkeys(_CACHE_COUNTERS, 0)
+        size = negative = nbytes = 0
+        for shard in self._shards:
+            with shard.lock:
+                for name, value in shard.counters.items():
+                    stats[name] += value
+                size += len(shard)
+                negative += shard.negative
+                nbytes += shard.bytes
+        stats['size'] = size
+        stats['negative_size'] = negative
+        stats['bytes'] = nbytes
+        stats['maxsize'] = self.maxsize
+        return stats
+
+
+def _addrinfo_with_ttl(callback: Callable, result: Any, status: Optional[int]) -> None:
+    """Callback of a cached getaddrinfo(), which adds the TTL to cache the result for"""
+    if status is None:
+        result = (result, min((node.ttl for node in result.nodes), default=0), None)
+    callback(result, status)
+
+
+class _CacheSnapshot:
+    """
+    Response cache entries saved to a file, see Channel.cache_save().
+
+    The file is an open addressing hash table of fixed size records, keyed
+    on a hash of the cache key, followed by the keys and responses the
+    records point to. It's memory-mapped and probed on cache misses, so
+    loading a snapshot takes the same time whatever its size, and its pages
+    are only read when they are used.
+    """
+
+    MAGIC = b'PYCARES\x00'
+    VERSION = 1
+    # magic, version, number of slots (a power of 2), number of records
+    HEADER = struct.Struct('<8sIII')
+    # key hash (0 for empty slots), expiry and stale expiry (wall clock),
+    # errorno (0 for answers), key length, response length, data offset
+    RECORD = struct.Struct('<QddhHIQ')
+    KEY = struct.Struct('<HH')
+
+    def __init__(self, path: Union[str, bytes, os.PathLike]) -> None:
+        self._mmap = None
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            magic, version, nslots, self._count = self.HEADER.unpack_from(self._mmap, 0)
+        except struct.error:
+            magic = version = nslots = None
+        if magic != self.MAGIC or version != self.VERSION or not nslots or nslots & (nslots - 1) or \
+                len(self._mmap) < self.HEADER.size + nslots * self.RECORD.size:
+            self.close()
+            raise ValueError('not a pycares cache snapshot')
+        self._mask = nslots - 1
+        self._valid = True
+
+    def __len__(self) -> int:
+        return self._count
+
+    def close(self) -> None:
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+
+    @classmethod
+    def _encode_key(cls, key: tuple) -> bytes:
+        # Responses are saved in wire format, so the parse options of the
+        # cache key don't matter
+        name, query_type, query_class = key[:3]
+        return cls.KEY.pack(query_type, query_class) + name
+
+    @classmethod
+    def _decode_key(cls, data: bytes) -> tuple:
+        query_type, query_class = cls.KEY.unpack_from(data)
+        return (data[cls.KEY.size:], query_type, query_class)
+
+    @staticmethod
+    def _hash(data: bytes) -> int:
+        # Stable across processes, unlike hash(), and never 0
+        return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), 'little') | 1
+
+    def _record(self, slot: int) -> tuple:
+        return self.RECORD.unpack_from(self._mmap, self.HEADER.size + slot * self.RECORD.size)
+
+    def _unpack(self, record: tuple) -> tuple:
+        _, expires, stale_until, errorno, key_len, wire_len, offset = record
+        wire = self._mmap[offset + key_len:offset + key_len + wire_len] if not errorno else None
+        return expires, stale_until, errorno or None, wire
+
+    def lookup(self, key: tuple) -> Optional[tuple]:
+        """Saved (expires, stale_until, errorno, wire) of key, or None"""
+        if not self._valid:
+            return None
+        data = self._encode_key(key)
+        h = self._hash(data)
+        slot = h & self._mask
+        for _ in range(self._mask + 1):
+            record = self._record(slot)
+            if record[0] == 0:
+                return None
+            if record[0] == h:
+                offset, key_len = record[6], record[4]
+                if self._mmap[offset:offset + key_len] == data:
+                    return self._unpack(record)
+            slot = (slot + 1) & self._mask
+        # Snapshots are written with free slots, this one is corrupt
+        self._valid = False
+        return None
+
+    def records(self) -> Iterator[tuple]:
+        """All the saved ((name, type, class), expires, stale_until, errorno, wire)"""
+        if not self._valid:
+            return
+        for slot in range(self._mask + 1):
+            record = self._record(slot)
+            if record[0]:
+                offset, key_len = record[6], record[4]
+                yield (self._decode_key(self._mmap[offset:offset + key_len]),) + self._unpack(record)
+
+    @classmethod
+    def write(cls, path: Union[str, bytes, os.PathLike], records: dict) -> None:
+        """
+        Write a snapshot, records maps (name, type, class) tuples to
+        (expires, stale_until, errorno, wire) tuples. The file is replaced
+        atomically.
+        """
+        nslots = 16
+        while nslots < len(records) * 2:
+            nslots *= 2
+        mask = nslots - 1
+
+        table = bytearray(cls.HEADER.size + nslots * cls.RECORD.size)
+        cls.HEADER.pack_into(table, 0, cls.MAGIC, cls.VERSION, nslots, len(records))
+        data = []
+        offset = len(table)
+        for key, (expires, stale_until, errorno, wire) in records.items():
+            encoded = cls._encode_key(key)
+            wire = wire if errorno is None else b''
+            h = cls._hash(encoded)
+            slot = h & mask
+            while cls.RECORD.unpack_from(table, cls.HEADER.size + slot * cls.RECORD.size)[0]:
+                slot = (slot + 1) & mask
+            cls.RECORD.pack_into(table, cls.HEADER.size + slot * cls.RECORD.size,
+                                 h, expires, stale_until, errorno or 0, len(encoded), len(wire), offset)
+            data.append(encoded)
+            data.append(wire)
+            offset += len(encoded) + len(wire)
+
+        # A file of its own for each writer, next to the snapshot
+        path = os.fsdecode(path)
+        directory, name = os.path.split(path)
+        fd, tmp = tempfile.mkstemp(prefix=name + '.', suffix='.tmp', dir=directory or None)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(table)
+                f.writelines(data)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+
+class _SharedCache:
+    """
+    Response cache shared by the processes of a host, see the shared_cache
+    option of Channel.
+
+    The file is memory-mapped, and holds a fixed size open addressing hash
+    table of (name, type, class) -> (expiry, response in wire format) slots,
+    in the key encoding of _CacheSnapshot. A key lives in one of the PROBES
+    slots after its hash, and writers replace the slot which expires first
+    when they are all taken.
+
+    Readers don't lock. Writers make the sequence number of a slot odd while
+    they update it, under a lock on the file (a seqlock), and readers which
+    see it odd, or changed after they copied the slot, try again.
+    """
+
+    MAGIC = b'PYCARESM'
+    VERSION = 1
+    # magic, version, number of slots (a power of 2), slot size
+    HEADER = struct.Struct('<8sIII')
+    HEADER_SIZE = 64
+    # sequence number, key hash (0 for empty slots), expiry and stale expiry
+    # (wall clock), errorno (0 for answers), key length, response length
+    SLOT = struct.Struct('<IQddhHI')
+    SEQ = struct.Struct('<I')
+    SLOT_SIZE = 512
+    PROBES = 8
+    RETRIES = 4
+
+    def __init__(self, path: Union[str, bytes, os.PathLike], nslots: int) -> None:
+        if fcntl is None:
+            raise RuntimeError('shared caches are not supported on this platform')
+        if nslots < self.PROBES or nslots & (nslots - 1):
+            raise ValueError('shared_cache_size must be a power of 2, at least %d' % self.PROBES)
+
+        self._mmap = None
+        self._lock = threading.Lock()
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                if os.fstat(self._fd).st_size == 0:
+                    os.ftruncate(self._fd, self.HEADER_SIZE + nslots * self.SLOT_SIZE)
+                    os.pwrite(self._fd, self.HEADER.pack(self.MAGIC, self.VERSION, nslots, self.SLOT_SIZE), 0)
+                self._mmap = mmap.mmap(self._fd, 0)
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+            magic, version, nslots, slot_size = self.HEADER.unpack_from(self._mmap, 0)
+            if magic != self.MAGIC or version != self.VERSION or slot_size != self.SLOT_SIZE or \
+                    len(self._mmap) < self.HEADER_SIZE + nslots * slot_size:
+                raise ValueError('not a pycares shared cache')
+        except BaseException:
+            self.close()
+            raise
+        # The size of an existing cache wins
+        self._mask = nslots - 1
+
+    def close(self) -> None:
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def _slots(self, h: int) -> Iterator[int]:
+        for i in range(self.PROBES):
+            yield self.HEADER_SIZE + ((h + i) & self._mask) * self.SLOT_SIZE
+
+    def lookup(self, key: tuple) -> Optional[tuple]:
+        """Shared (expires, stale_until, errorno, wire) of key, or None"""
+        data = _CacheSnapshot._encode_key(key)
+        h = _CacheSnapshot._hash(data)
+        buf = self._mmap
+        for offset in self._slots(h):
+            for _ in range(self.RETRIES):
+                seq, slot_hash, expires, stale_until, errorno, key_len, wire_len = self.SLOT.unpack_from(buf, offset)
+                if seq & 1:
+                    # Being written
+                    continue
+                if slot_hash != h:
+                    break
+                start = offset + self.SLOT.size
+                stored = buf[start:start + min(key_len + wire_len, self.SLOT_SIZE - self.SLOT.size)]
+                if self.SEQ.unpack_from(buf, offset)[0] != seq:
+                    continue
+                if stored[:key_len] != data:
+                    break
+                return expires, stale_until, errorno or None, stored[key_len:] if not errorno else None
+        return None
+
+    def store(self, key: tuple, expires: float, stale_until: float, errorno: Optional[int], wire: Optional[bytes]) -> bool:
+        """Store the response (or the error) of key, False if it's too large"""
+        data = _CacheSnapshot._encode_key(key)
+        h = _CacheSnapshot._hash(data)
+        key_len = len(data)
+        wire = wire if errorno is None else b''
+        if key_len + len(wire) > self.SLOT_SIZE - self.SLOT.size:
+            return False
+
+        buf = self._mmap
+        now = time.time()
+        with self._lock:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                # The slot of the key, or else the first free or expired
+                # one, or else the one which expires first
+                target = None
+                target_until = math.inf
+                for offset in self._slots(h):
+                    _, slot_hash, _, slot_until, _, slot_key_len, _ = self.SLOT.unpack_from(buf, offset)
+                    start = offset + self.SLOT.size
+                    if slot_hash == h and slot_key_len == key_len and buf[start:start + key_len] == data:
+                        target = offset
+                        break
+                    if slot_hash == 0 or slot_until <= now:
+                        slot_until = -math.inf
+                    if slot_until < target_until:
+                        target, target_until = offset, slot_until
+
+                # A writer which died while it held the lock leaves an odd
+                # sequence number behind
+                seq = self.SEQ.unpack_from(buf, target)[0] | 1
+                self.SEQ.pack_into(buf, target, seq)
+                start = target + self.SLOT.size
+                buf[start:start + key_len + len(wire)] = data + wire
+                self.SLOT.pack_into(buf, target, seq, h, expires, stale_until, errorno or 0, key_len, len(wire))
+                self.SEQ.pack_into(buf, target, (seq + 1) & 0xffffffff)
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+        return True
+
+    def flush(self, match: Optional[Callable[[bytes], bool]] = None) -> int:
+        """Empty the slots whose name matches, or all of them"""
+        count = 0
+        buf = self._mmap
+        key_size = _CacheSnapshot.KEY.size
+        with self._lock:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                for slot in range(self._mask + 1):
+                    offset = self.HEADER_SIZE + slot * self.SLOT_SIZE
+                    seq, slot_hash, _, _, _, key_len, _ = self.SLOT.unpack_from(buf, offset)
+                    if slot_hash == 0:
+                        continue
+                    start = offset + self.SLOT.size
+                    if match is not None and not match(buf[start + key_size:start + key_len]):
+                        continue
+                    seq |= 1
+                    self.SEQ.pack_into(buf, offset, seq)
+                    self.SLOT.pack_into(buf, offset, seq, 0, 0.0, 0.0, 0, 0, 0)
+                    self.SEQ.pack_into(buf, offset, (seq + 1) & 0xffffffff)
+                    count += 1
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+        return count
+
+
+_NEGATIVE_STATUSES = frozenset((_lib.ARES_ENOTFOUND, _lib.ARES_ENODATA))
+
+
+class _TTLParser:
+    """
+    Query result parser for the response cache, which also returns the TTL to
+    cache the result for, and the response in wire format if keep_wire is
+    set (for snapshots and the shared cache). See _ResponseCache.complete().
+    """
+
+    __slots__ = ('parser', 'keep_wire')
+
+    def __init__(self, parser, keep_wire: bool = False) -> None:
+        self.parser = parser
+        self.keep_wire = keep_wire
+
+    def __call__(self, dnsrec):
+        result, status = self.parser(dnsrec)
+        if status is None:
+            wire = None
+            if self.parser is parse_dnsrec_raw:
+                wire = result
+            elif self.keep_wire:
+                wire, _ = parse_dnsrec_raw(dnsrec)
+            result = (result, _lib.pycares_answer_ttl(dnsrec), wire)
+        return result, status
+
+    @staticmethod
+    def negative_ttl(dnsrec) -> int:
+        return _lib.pycares_negative_ttl(dnsrec)
+
+
+def _run_parser(parser: Any, dnsrec) -> tuple:
+    """
+    Parse the response of a query. A failing record extractor (see
+    register_record_extractor()) fails the query with ARES_EBADRESP rather
+    than escaping from the c-ares callback, which would leave the query
+    without an answer.
+    """
+    try:
+        return parser(dnsrec)
+    except Exception:
+        traceback.print_exc()
+        return None, _lib.ARES_EBADRESP
 
 
 @_ffi.def_extern()
 def _sock_state_cb(data, socket_fd, readable, writable):
-    # Note: sock_state_cb handle is not tracked in _handle_to_channel
-    # because it has a different lifecycle (tied to the channel, not individual queries)
+    # Note: sock_state_cb handle is not an in-flight slot because it has a
+    # different lifecycle (tied to the channel, not individual queries)
     sock_state_cb = _ffi.from_handle(data)
     sock_state_cb(socket_fd, readable, writable)
 
 @_ffi.def_extern()
-def _host_cb(arg, status, timeouts, hostent):
-    # Get callback data without removing the reference yet
-    if arg not in _handle_to_channel:
+def _host_cb(owner, index, status, timeouts, hostent):
+    callback, info = _ffi.from_handle(owner).finish(index, status, timeouts)
+    if callback is None:
         return
 
-    callback = _ffi.from_handle(arg)
-
     if status != _lib.ARES_SUCCESS:
         result = None
     else:
         result = parse_hostent(hostent)
         status = None
 
-    callback(result, status)
-    _handle_to_channel.pop(arg, None)
+    _run_callback(callback, result, status, info)
 
 @_ffi.def_extern()
-def _nameinfo_cb(arg, status, timeouts, node, service):
-    # Get callback data without removing the reference yet
-    if arg not in _handle_to_channel:
+def _nameinfo_cb(owner, index, status, timeouts, node, service):
+    callback, info = _ffi.from_handle(owner).finish(index, status, timeouts)
+    if callback is None:
         return
 
-    callback = _ffi.from_handle(arg)
-
     if status != _lib.ARES_SUCCESS:
         result = None
     else:
         result = parse_nameinfo(node, service)
         status = None
 
-    callback(result, status)
-    _handle_to_channel.pop(arg, None)
+    _run_callback(callback, result, status, info)
 
 @_ffi.def_extern()
-def _query_dnsrec_cb(arg, status, timeouts, dnsrec):
+def _query_dnsrec_cb(owner, index, status, timeouts, dnsrec):
     """Callback for new DNS record API queries"""
-    # Get callback data without removing the reference yet
-    if arg not in _handle_to_channel:
+    data, info = _ffi.from_handle(owner).finish(index, status, timeouts)
+    if data is None:
         return
 
-    callback = _ffi.from_handle(arg)
+    callback, parser = data
 
     if status != _lib.ARES_SUCCESS:
         result = None
+        if dnsrec != _ffi.NULL and type(parser) is _TTLParser:
+            result = parser.negative_ttl(dnsrec)
     else:
-        result, parse_status = parse_dnsrec(dnsrec)
+        result, parse_status = _run_parser(parser, dnsrec)
         if parse_status is not None:
             status = parse_status
         else:
             # Success - set status to None
             status = None
 
-    callback(result, status)
-    _handle_to_channel.pop(arg, None)
+    _run_callback(callback, result, status, info)
 
 
 @_ffi.def_extern()
-def _addrinfo_cb(arg, status, timeouts, res):
-    # Get callback data without removing the reference yet
-    if arg not in _handle_to_channel:
+def _addrinfo_cb(owner, index, status, timeouts, res):
+    data, info = _ffi.from_handle(owner).finish(index, status, timeouts)
+    if data is None:
         return
 
-    callback = _ffi.from_handle(arg)
+    callback, address_format = data
 
     if status != _lib.ARES_SUCCESS:
         result = None
     else:
-        result = parse_addrinfo(res)
+        result = parse_addrinfo(res, address_format)
         status = None
 
-    callback(result, status)
-    _handle_to_channel.pop(arg, None)
+    _run_callback(callback, result, status, info)
+
+
+@_ffi.def_extern()
+def _completion_overflow_cb(owner, index, kind, status, timeouts, result):
+    # The completion ring of the channel is full, queue it on the Python side
+    completions = _ffi.from_handle(owner).completions
+    completions.overflow.append((index, kind, status, timeouts, result))
+    completions.notify()
+
+
+def _free_completion_result(kind, result):
+    if result == _ffi.NULL:
+        return
+    if kind == _lib.PYCARES_COMPLETION_DNSREC:
+        _lib.ares_dns_record_destroy(_ffi.cast("ares_dns_record_t *", result))
+    else:
+        _lib.ares_freeaddrinfo(_ffi.cast("struct ares_addrinfo *", result))
+
+
+def _deliver_completion(table, index, kind, status, timeouts, result):
+    """Run the callback of a query completed through a completion ring"""
+    data, info = table.finish(index, status, timeouts)
+    if data is None:
+        _free_completion_result(kind, result)
+        return
+
+    callback, data = data
+
+    if status != _lib.ARES_SUCCESS:
+        ttl = None
+        if result != _ffi.NULL and type(data) is _TTLParser:
+            ttl = data.negative_ttl(_ffi.cast("ares_dns_record_t *", result))
+        _free_completion_result(kind, result)
+        result = ttl
+    elif kind == _lib.PYCARES_COMPLETION_DNSREC:
+        # data is the parser, see _query_dnsrec_cb
+        dnsrec = _ffi.cast("ares_dns_record_t *", result)
+        try:
+            result, status = _run_parser(data, dnsrec)
+        finally:
+            _lib.ares_dns_record_destroy(dnsrec)
+    else:
+        # data is the address format, see _addrinfo_cb
+        result = parse_addrinfo(_ffi.cast("struct ares_addrinfo *", result), data)
+        status = None
+
+    _run_callback(callback, result, status, info)
+
+
+class _CompletionRing:
+    """
+    Completions of the queries of a Channel created with completion_ring, see
+    Channel.process_completions() and COMPLETION_RING in build_cares.py.
+    """
+
+    _BATCH_SIZE = 256
+
+    # Notification descriptors, see fileno()
+    _notify_r = None
+    _notify_w = None
+
+    def __init__(self, size: int) -> None:
+        if size < 1:
+            raise ValueError('completion_ring must be a positive number')
+
+        # The ring size must be a power of 2
+        size = 1 << (size - 1).bit_length()
+        self._entries = _ffi.new("pycares_completion_t[]", size)
+        self.ring = _ffi.new("pycares_ring_t *")
+        _lib.pycares_ring_init(self.ring, self._entries, size)
+        self._batch = _ffi.new("pycares_completion_t[]", min(size, self._BATCH_SIZE))
+        self._lock = threading.Lock()
+        # Completions which didn't fit in the ring
+        self.overflow: collections.deque = collections.deque()
+
+    def __del__(self) -> None:
+        # The channel is destroyed by now, nothing writes to the descriptors
+        if self._notify_r is None:
+            return
+        if isinstance(self._notify_r, socket.socket):
+            self._notify_r.close()
+            self._notify_w.close()
+        else:
+            os.close(self._notify_r)
+            if self._notify_w != self._notify_r:
+                os.close(self._notify_w)
+
+    def __len__(self) -> int:
+        return _lib.pycares_ring_size(self.ring) + len(self.overflow)
+
+    def fileno(self) -> int:
+        """
+        Get the descriptor which becomes readable when there are completions
+        to process, it's created on first use.
+        """
+        with self._lock:
+            if self._notify_r is None:
+                if hasattr(os, 'eventfd'):
+                    self._notify_r = self._notify_w = os.eventfd(0, os.EFD_NONBLOCK | os.EFD_CLOEXEC)
+                    write_fd = self._notify_w
+                elif sys.platform == 'win32':
+                    self._notify_r, self._notify_w = socket.socketpair()
+                    self._notify_r.setblocking(False)
+                    self._notify_w.setblocking(False)
+                    write_fd = self._notify_w.fileno()
+                else:
+                    self._notify_r, self._notify_w = os.pipe()
+                    os.set_blocking(self._notify_r, False)
+                    os.set_blocking(self._notify_w, False)
+                    write_fd = self._notify_w
+                _lib.pycares_ring_set_notify(self.ring, write_fd)
+                if len(self):
+                    _lib.pycares_ring_notify(self.ring)
+
+        if isinstance(self._notify_r, socket.socket):
+            return self._notify_r.fileno()
+        return self._notify_r
+
+    def notify(self) -> None:
+        _lib.pycares_ring_notify(self.ring)
+
+    def _clear_notification(self) -> None:
+        try:
+            if isinstance(self._notify_r, socket.socket):
+                self._notify_r.recv(4096)
+            else:
+                os.read(self._notify_r, 4096)
+        except (BlockingIOError, InterruptedError):
+            pass
+
+    def process(self, table: _InFlightTable, max_completions: Optional[int] = None) -> int:
+        # Callbacks of a batch all run even if one of them raises, the first
+        # exception is raised afterwards
+        error = None
+        processed = 0
+        with self._lock:
+            if self._notify_r is not None:
+                self._clear_notification()
+
+            while max_completions is None or processed < max_completions:
+                max_batch = len(self._batch)
+                if max_completions is not None:
+                    max_batch = min(max_batch, max_completions - processed)
+                n = _lib.pycares_ring_pop(self.ring, self._batch, max_batch)
+                if n == 0:
+                    if not self.overflow:
+                        break
+                    completions = [self.overflow.popleft()]
+                else:
+                    completions = [(e.index, e.kind, e.status, e.timeouts, e.result) for e in self._batch[0:n]]
+
+                for completion in completions:
+                    try:
+                        _deliver_completion(table, *completion)
+                    except Exception as e:
+                        if error is None:
+                            error = e
+                processed += len(completions)
+
+            # Completions pushed after the ring was last drained didn't notify,
+            # make sure the next call isn't missed
+            if self._notify_r is not None and (_lib.pycares_ring_arm(self.ring) or self.overflow):
+                _lib.pycares_ring_notify(self.ring)
+
+        if error is not None:
+            raise error
+        return processed
 
 
 def _extract_opt_params(rr, key):
@@ -192,240 +1633,567 @@ def _extract_opt_params(rr, key):
         params.append((opt_key, val))
     return params
 
-def _extract_str_data(rr, key):
-    """Reterives a point to a string"""
-    value = _lib.ares_dns_rr_get_str(rr, key)
-    return maybe_str(_ffi.string(value)) if value != _ffi.NULL else "" 
 
-def _extract_bin_data_as_str(rr, key):
-    """Reterives a pointer to binary data as a string"""
-    length = _ffi.new("size_t *")
-    value = _lib.ares_dns_rr_get_bin(rr, key, length)
-    return maybe_str(_ffi.buffer(value, length[0])) if value != _ffi.NULL else ""
+def _info_str(value):
+    """Converts a string pointer of a pycares_rr_t to str"""
+    return maybe_str(_ffi.string(value)) if value != _ffi.NULL else ""
+
+
+def _info_bytes(info):
+    """Returns the binary field of a pycares_rr_t as bytes"""
+    return _ffi.buffer(info.bin, info.bin_len)[:] if info.bin != _ffi.NULL else b''
+
+
+# The extractors below get a pycares_rr_t, filled with all the fields of the
+# record by a single call to pycares_rr_fill (see build_cares.py). The raw
+# record is still available as info.rr.
+
+
+def _extract_a(info):
+    return ARecordData(addr=maybe_str(_ffi.string(info.addr)))
+
+
+def _extract_aaaa(info):
+    return AAAARecordData(addr=maybe_str(_ffi.string(info.addr)))
+
+
+def _extract_mx(info):
+    return MXRecordData(priority=info.ints[0], exchange=_info_str(info.strs[0]))
+
+
+def _extract_txt(info):
+    return TXTRecordData(data=_info_bytes(info))
+
+
+def _extract_caa(info):
+    return CAARecordData(
+        critical=info.ints[0],
+        tag=_info_str(info.strs[0]),
+        value=maybe_str(_info_bytes(info))
+    )
+
+
+def _extract_cname(info):
+    return CNAMERecordData(cname=_info_str(info.strs[0]))
+
+
+def _extract_naptr(info):
+    strs = info.strs
+    return NAPTRRecordData(
+        order=info.ints[0],
+        preference=info.ints[1],
+        flags=_info_str(strs[0]),
+        service=_info_str(strs[1]),
+        regexp=_info_str(strs[2]),
+        replacement=_info_str(strs[3])
+    )
+
+
+def _extract_ns(info):
+    return NSRecordData(nsdname=_info_str(info.strs[0]))
+
+
+def _extract_ptr(info):
+    return PTRRecordData(dname=_info_str(info.strs[0]))
+
+
+def _extract_soa(info):
+    ints = info.ints
+    return SOARecordData(
+        mname=_info_str(info.strs[0]),
+        rname=_info_str(info.strs[1]),
+        serial=ints[0],
+        refresh=ints[1],
+        retry=ints[2],
+        expire=ints[3],
+        minimum=ints[4]
+    )
+
+
+def _extract_srv(info):
+    ints = info.ints
+    return SRVRecordData(
+        priority=ints[0],
+        weight=ints[1],
+        port=ints[2],
+        target=_info_str(info.strs[0])
+    )
+
+
+def _extract_tlsa(info):
+    ints = info.ints
+    return TLSARecordData(
+        cert_usage=ints[0],
+        selector=ints[1],
+        matching_type=ints[2],
+        cert_association_data=_info_bytes(info)
+    )
+
+
+def _extract_https(info):
+    return HTTPSRecordData(
+        priority=info.ints[0],
+        target=_info_str(info.strs[0]),
+        params=_extract_opt_params(info.rr, _lib.ARES_RR_HTTPS_PARAMS)
+    )
+
+
+def _extract_uri(info):
+    return URIRecordData(
+        priority=info.ints[0],
+        weight=info.ints[1],
+        target=_info_str(info.strs[0])
+    )
+
+
+# Maps ARES_REC_TYPE_* values to the function which extracts the record data
+_record_extractors: Dict[int, Callable[[Any], Any]] = {
+    _lib.ARES_REC_TYPE_A: _extract_a,
+    _lib.ARES_REC_TYPE_AAAA: _extract_aaaa,
+    _lib.ARES_REC_TYPE_MX: _extract_mx,
+    _lib.ARES_REC_TYPE_TXT: _extract_txt,
+    _lib.ARES_REC_TYPE_CAA: _extract_caa,
+    _lib.ARES_REC_TYPE_CNAME: _extract_cname,
+    _lib.ARES_REC_TYPE_NAPTR: _extract_naptr,
+    _lib.ARES_REC_TYPE_NS: _extract_ns,
+    _lib.ARES_REC_TYPE_PTR: _extract_ptr,
+    _lib.ARES_REC_TYPE_SOA: _extract_soa,
+    _lib.ARES_REC_TYPE_SRV: _extract_srv,
+    _lib.ARES_REC_TYPE_TLSA: _extract_tlsa,
+    _lib.ARES_REC_TYPE_HTTPS: _extract_https,
+    _lib.ARES_REC_TYPE_URI: _extract_uri,
+}
+
+
+def _check_address_format(address_format):
+    if address_format not in _ADDRESS_FORMATS:
+        raise ValueError('invalid address format specified')
+
+
+def _format_address(packed, address_format):
+    """Convert a packed IPv4 or IPv6 address to the given (non text) address format"""
+    if address_format == ADDRESS_FORMAT_PACKED:
+        return packed
+    if address_format == ADDRESS_FORMAT_INT:
+        return int.from_bytes(packed, 'big')
+    return ipaddress.ip_address(packed)
+
+
+_ADDRESS_SIZES = {socket.AF_INET: 4, socket.AF_INET6: 16}
+
+
+def _pack_address(addr, family):
+    """Convert an address in any of the address formats to its packed form"""
+    if isinstance(addr, str):
+        return socket.inet_pton(family, addr)
+    if isinstance(addr, bytes):
+        # Text from getaddrinfo, unless it can only be a packed address
+        try:
+            return socket.inet_pton(family, addr.decode('ascii'))
+        except (UnicodeDecodeError, OSError):
+            if len(addr) != _ADDRESS_SIZES[family]:
+                raise ValueError(f"invalid address: {addr!r}") from None
+            return addr
+    if isinstance(addr, int):
+        return addr.to_bytes(_ADDRESS_SIZES[family], 'big')
+    return addr.packed
+
+
+def _check_address_family(family):
+    if family not in _ADDRESS_SIZES:
+        raise ValueError('invalid address family specified')
+
+
+def _fill_addresses(dnsrec, section, family, addrs, ttls):
+    """
+    Append the addresses of the given family in a section of dnsrec, and their
+    TTLs, to the addrs and ttls bytearrays. Returns the number of addresses.
+    """
+    count = _lib.ares_dns_record_rr_cnt(dnsrec, section)
+    if count == 0:
+        return 0
+
+    size = _ADDRESS_SIZES[family]
+    start = len(ttls) // 4
+    addrs.extend(bytes(count * size))
+    ttls.extend(bytes(count * 4))
+
+    addrs_buf = _ffi.from_buffer("unsigned char[]", addrs)
+    ttls_buf = _ffi.from_buffer("unsigned int[]", ttls)
+    try:
+        n = _lib.pycares_section_addrs(dnsrec, section, family, addrs_buf + start * size, ttls_buf + start, count)
+    finally:
+        # The bytearrays cannot be resized while their buffers are exported
+        _ffi.release(addrs_buf)
+        _ffi.release(ttls_buf)
+
+    del addrs[(start + n) * size:]
+    del ttls[(start + n) * 4:]
+    return n
+
+
+def _address_arrays(family, addrs, ttls):
+    """Build the arrays returned by the export_addresses() methods"""
+    ttls_array = array.array('I')
+    ttls_array.frombytes(ttls)
+    if family == socket.AF_INET6:
+        return addrs, ttls_array
+    addrs_array = array.array('I')
+    addrs_array.frombytes(addrs)
+    return addrs_array, ttls_array
+
+
+def _export_packed_addresses(family, items):
+    """Export (packed address, TTL) pairs as arrays, see DNSResult.export_addresses()"""
+    addrs = array.array('I') if family == socket.AF_INET else bytearray()
+    ttls = array.array('I')
+    for packed, ttl in items:
+        if family == socket.AF_INET:
+            addrs.append(int.from_bytes(packed, 'big'))
+        else:
+            addrs.extend(packed)
+        ttls.append(ttl)
+    return addrs, ttls
+
+
+def parse_wire_addresses(messages, family: int = socket.AF_INET, *, offsets=None, section: int = SECTION_ANSWER) -> tuple:
+    """
+    Export the addresses in many DNS messages in wire format, without creating
+    any per record objects.
+
+    Args:
+        messages: Iterable of DNS messages (objects supporting the buffer protocol), or a
+            single buffer holding all of them if offsets is given
+        family: socket.AF_INET for the A records, socket.AF_INET6 for the AAAA ones
+        offsets: Sequence of (offset, length) tuples locating each message in messages
+        section: Section to take the records from
+
+    Returns an (addresses, ttls, counts) tuple, see DNSResult.export_addresses() for the
+    first two. counts is an array('I') with the number of addresses of each message;
+    messages which cannot be parsed have none.
+    """
+    _check_address_family(family)
+    if section not in _ALL_SECTIONS:
+        raise ValueError('invalid section specified')
+
+    if offsets is not None:
+        view = memoryview(messages)
+        messages = (view[offset:offset + length] for offset, length in offsets)
+
+    addrs = bytearray()
+    ttls = bytearray()
+    counts = array.array('I')
+
+    def parser(dnsrec):
+        return _fill_addresses(dnsrec, section, family, addrs, ttls), None
+
+    for buf in messages:
+        count, status = _parse_wire(buf, parser)
+        counts.append(count if status is None else 0)
+
+    return _address_arrays(family, addrs, ttls) + (counts,)
+
+
+# A and AAAA extractors for the address formats other than text. The packed
+# address is in the binary field and, for A records, its integer value in ints[0].
+
+
+def _extract_a_packed(info):
+    return ARecordData(addr=_ffi.buffer(info.bin, 4)[:])
+
+
+def _extract_aaaa_packed(info):
+    return AAAARecordData(addr=_ffi.buffer(info.bin, 16)[:])
 
-def _extract_bin_data_as_bytes(rr, key):
-    """Reterives a pointer to binary data as bytes"""
-    length = _ffi.new("size_t *")
-    value = _lib.ares_dns_rr_get_bin(rr, key, length)
-    return bytes(_ffi.buffer(value, length[0])) if value != _ffi.NULL else b''
+
+def _extract_a_int(info):
+    return ARecordData(addr=info.ints[0])
+
+
+def _extract_aaaa_int(info):
+    return AAAARecordData(addr=int.from_bytes(_ffi.buffer(info.bin, 16), 'big'))
+
+
+def _extract_a_ipaddress(info):
+    return ARecordData(addr=ipaddress.IPv4Address(info.ints[0]))
+
+
+def _extract_aaaa_ipaddress(info):
+    return AAAARecordData(addr=ipaddress.IPv6Address(_ffi.buffer(info.bin, 16)[:]))
+
+
+_address_extractors = {
+    ADDRESS_FORMAT_PACKED: {_lib.ARES_REC_TYPE_A: _extract_a_packed, _lib.ARES_REC_TYPE_AAAA: _extract_aaaa_packed},
+    ADDRESS_FORMAT_INT: {_lib.ARES_REC_TYPE_A: _extract_a_int, _lib.ARES_REC_TYPE_AAAA: _extract_aaaa_int},
+    ADDRESS_FORMAT_IPADDRESS: {_lib.ARES_REC_TYPE_A: _extract_a_ipaddress, _lib.ARES_REC_TYPE_AAAA: _extract_aaaa_ipaddress},
+}
+
+# Extractors for each address format, cleared when an extractor is registered
+_extractors_by_format: Dict[int, Dict[int, Callable[[Any], Any]]] = {}
+
+
+def _get_extractors(address_format):
+    """Get the record extractors to use for the given address format"""
+    if address_format == ADDRESS_FORMAT_TEXT:
+        return _record_extractors
+
+    extractors = _extractors_by_format.get(address_format)
+    if extractors is None:
+        extractors = {**_record_extractors, **_address_extractors[address_format]}
+        _extractors_by_format[address_format] = extractors
+    return extractors
+
+
+def _fill_flags(address_format):
+    """Get the pycares_rr_fill flags for the given address format"""
+    return _lib.PYCARES_RR_FILL_ADDR_TEXT if address_format == ADDRESS_FORMAT_TEXT else 0
+
+
+def register_record_extractor(record_type: int, extractor: Callable[[Any], Any]) -> None:
+    """
+    Register the function used to extract the data of records of the given type.
+
+    The extractor is called with a ``pycares_rr_t *`` for each resource record
+    of that type and must return the object stored in ``DNSRecord.data``. The
+    record itself (``const ares_dns_rr_t *``) is available as its ``rr`` field.
+    Registering an extractor for an already supported type replaces it.
+    """
+    if not callable(extractor):
+        raise TypeError('a callable is required')
+
+    _record_extractors[record_type] = extractor
+    _extractors_by_format.clear()
 
 
 def extract_record_data(rr, record_type):
     """Extract type-specific data from a DNS resource record and return appropriate dataclass"""
-    if record_type == _lib.ARES_REC_TYPE_A:
-        addr = _lib.ares_dns_rr_get_addr(rr, _lib.ARES_RR_A_ADDR)
-        buf = _ffi.new("char[]", _lib.INET6_ADDRSTRLEN)
-        _lib.ares_inet_ntop(socket.AF_INET, addr, buf, _lib.INET6_ADDRSTRLEN)
-        return ARecordData(addr=maybe_str(_ffi.string(buf)))
+    try:
+        extractor = _record_extractors[record_type]
+    except KeyError:
+        raise ValueError(f"Unsupported DNS record type: {record_type}") from None
+    info = _ffi.new("pycares_rr_t *")
+    if rr:
+        _lib.pycares_rr_fill(rr, info, _lib.PYCARES_RR_FILL_ADDR_TEXT)
+    return extractor(info)
+
+
+def _parse_rr(info, extractor):
+    """Parse a single filled pycares_rr_t into a DNSRecord object"""
+    return DNSRecord(
+        name=_info_str(info.name),
+        type=info.type,
+        record_class=info.rclass,
+        ttl=info.ttl,
+        data=extractor(info)
+    )
 
-    elif record_type == _lib.ARES_REC_TYPE_AAAA:
-        addr = _lib.ares_dns_rr_get_addr6(rr, _lib.ARES_RR_AAAA_ADDR)
-        buf = _ffi.new("char[]", _lib.INET6_ADDRSTRLEN)
-        _lib.ares_inet_ntop(socket.AF_INET6, addr, buf, _lib.INET6_ADDRSTRLEN)
-        return AAAARecordData(addr=maybe_str(_ffi.string(buf)))
-
-    elif record_type == _lib.ARES_REC_TYPE_MX:
-        priority = _lib.ares_dns_rr_get_u16(rr, _lib.ARES_RR_MX_PREFERENCE)
-        exchange = _extract_str_data(rr, _lib.ARES_RR_MX_EXCHANGE)
-        return MXRecordData(priority=priority, exchange=exchange)
-
-    elif record_type == _lib.ARES_REC_TYPE_TXT:
-        # TXT records use ABIN (array of binary) for chunks
-        cnt = _lib.ares_dns_rr_get_abin_cnt(rr, _lib.ARES_RR_TXT_DATA)
-        chunks = []
-        for i in range(cnt):
-            length = _ffi.new("size_t *")
-            data = _lib.ares_dns_rr_get_abin(rr, _lib.ARES_RR_TXT_DATA, i, length)
-            if data != _ffi.NULL:
-                chunks.append(_ffi.buffer(data, length[0])[:])
-        return TXTRecordData(data=b''.join(chunks))
-
-    elif record_type == _lib.ARES_REC_TYPE_CAA:
-        critical = _lib.ares_dns_rr_get_u8(rr, _lib.ARES_RR_CAA_CRITICAL)
-        tag = _extract_bin_data_as_str(rr, _lib.ARES_RR_CAA_TAG)
-        value_str = _extract_str_data(rr, _lib.ARES_RR_CAA_VALUE) 
-        return CAARecordData(critical=critical, tag=tag, value=value_str)
-
-    elif record_type == _lib.ARES_REC_TYPE_CNAME:
-        cname = _extract_str_data(rr, _lib.ARES_RR_CNAME_CNAME)
-        return CNAMERecordData(cname=cname)
-
-    elif record_type == _lib.ARES_REC_TYPE_NAPTR:
-        order = _lib.ares_dns_rr_get_u16(rr, _lib.ARES_RR_NAPTR_ORDER)
-        preference = _lib.ares_dns_rr_get_u16(rr, _lib.ARES_RR_NAPTR_PREFERENCE)
-        flags = _extract_str_data(rr, _lib.ARES_RR_NAPTR_FLAGS)
-        service = _extract_str_data(rr, _lib.ARES_RR_NAPTR_SERVICES)
-        regexp = _extract_str_data(rr, _lib.ARES_RR_NAPTR_REGEXP)
-        replacement = _extract_str_data(rr, _lib.ARES_RR_NAPTR_REPLACEMENT)
-        return NAPTRRecordData(
-            order=order,
-            preference=preference,
-            flags=flags,
-            service=service,
-            regexp=regexp,
-            replacement=replacement
-        )
 
-    elif record_type == _lib.ARES_REC_TYPE_NS:
-        nsdname = _extract_str_data(rr, _lib.ARES_RR_NS_NSDNAME)
-        return NSRecordData(nsdname=nsdname)
-
-    elif record_type == _lib.ARES_REC_TYPE_PTR:
-        dname = _extract_str_data(rr, _lib.ARES_RR_PTR_DNAME)
-        return PTRRecordData(dname=dname)
-
-    elif record_type == _lib.ARES_REC_TYPE_SOA:
-        mname = _extract_str_data(rr, _lib.ARES_RR_SOA_MNAME)
-        rname = _extract_str_data(rr, _lib.ARES_RR_SOA_RNAME)
-        serial = _lib.ares_dns_rr_get_u32(rr, _lib.ARES_RR_SOA_SERIAL)
-        refresh = _lib.ares_dns_rr_get_u32(rr, _lib.ARES_RR_SOA_REFRESH)
-        retry = _lib.ares_dns_rr_get_u32(rr, _lib.ARES_RR_SOA_RETRY)
-        expire = _lib.ares_dns_rr_get_u32(rr, _lib.ARES_RR_SOA_EXPIRE)
-        minimum = _lib.ares_dns_rr_get_u32(rr, _lib.ARES_RR_SOA_MINIMUM)
-        return SOARecordData(
-            mname=mname,
-            rname=rname,
-            serial=serial,
-            refresh=refresh,
-            retry=retry,
-            expire=expire,
-            minimum=minimum
-        )
+def _parse_section(dnsrec, section, address_format=ADDRESS_FORMAT_TEXT):
+    """Parse all the resource records in the given section into DNSRecord objects"""
+    count = _lib.ares_dns_record_rr_cnt(dnsrec, section)
+    if count == 0:
+        return []
 
-    elif record_type == _lib.ARES_REC_TYPE_SRV:
-        priority = _lib.ares_dns_rr_get_u16(rr, _lib.ARES_RR_SRV_PRIORITY)
-        weight = _lib.ares_dns_rr_get_u16(rr, _lib.ARES_RR_SRV_WEIGHT)
-        port = _lib.ares_dns_rr_get_u16(rr, _lib.ARES_RR_SRV_PORT)
-        target = _extract_str_data(rr, _lib.ARES_RR_SRV_TARGET)
-        return SRVRecordData(
-            priority=priority,
-            weight=weight,
-            port=port,
-            target=target
-        )
+    infos = _ffi.new("pycares_rr_t[]", count)
+    count = _lib.pycares_section_fill(dnsrec, section, infos, count, _fill_flags(address_format))
 
-    elif record_type == _lib.ARES_REC_TYPE_TLSA:
-        cert_usage = _lib.ares_dns_rr_get_u8(rr, _lib.ARES_RR_TLSA_CERT_USAGE)
-        selector = _lib.ares_dns_rr_get_u8(rr, _lib.ARES_RR_TLSA_SELECTOR)
-        matching_type = _lib.ares_dns_rr_get_u8(rr, _lib.ARES_RR_TLSA_MATCH)
-        cert_data = _extract_bin_data_as_bytes(rr, _lib.ARES_RR_TLSA_DATA)
-        return TLSARecordData(
-            cert_usage=cert_usage,
-            selector=selector,
-            matching_type=matching_type,
-            cert_association_data=cert_data
-        )
+    records = []
+    extractors = _get_extractors(address_format)
+    for i in range(count):
+        info = infos[i]
+        extractor = extractors.get(info.type)
+        if extractor is None:
+            # Skip unsupported record types
+            continue
 
-    elif record_type == _lib.ARES_REC_TYPE_HTTPS:
-        priority = _lib.ares_dns_rr_get_u16(rr, _lib.ARES_RR_HTTPS_PRIORITY)
-        target = _extract_str_data(rr, _lib.ARES_RR_HTTPS_TARGET)
-        params = _extract_opt_params(rr, _lib.ARES_RR_HTTPS_PARAMS)
-        return HTTPSRecordData(
-            priority=priority,
-            target=target,
-            params=params
-        )
+        records.append(_parse_rr(info, extractor))
+    return records
 
-    elif record_type == _lib.ARES_REC_TYPE_URI:
-        priority = _lib.ares_dns_rr_get_u16(rr, _lib.ARES_RR_URI_PRIORITY)
-        weight = _lib.ares_dns_rr_get_u16(rr, _lib.ARES_RR_URI_WEIGHT)
-        target = _extract_str_data(rr, _lib.ARES_RR_URI_TARGET)
-        return URIRecordData(
-            priority=priority,
-            weight=weight,
-            target=target
-        )
 
-    else:
-        # Unknown record type - return None or raise error
-        raise ValueError(f"Unsupported DNS record type: {record_type}")
+def parse_dnsrec(dnsrec, sections=None, address_format=ADDRESS_FORMAT_TEXT):
+    """
+    Parse ares_dns_record_t into DNSResult.
 
+    Only the sections given in ``sections`` (SECTION_* values) are parsed, the
+    other ones are left empty. All sections are parsed by default. The addresses
+    of A and AAAA records are given in ``address_format`` (ADDRESS_FORMAT_* value).
+    """
+    if dnsrec == _ffi.NULL:
+        return None, _lib.ARES_EBADRESP
+
+    if sections is None:
+        sections = _ALL_SECTIONS
+
+    result = DNSResult(
+        answer=_parse_section(dnsrec, SECTION_ANSWER, address_format) if SECTION_ANSWER in sections else [],
+        authority=_parse_section(dnsrec, SECTION_AUTHORITY, address_format) if SECTION_AUTHORITY in sections else [],
+        additional=_parse_section(dnsrec, SECTION_ADDITIONAL, address_format) if SECTION_ADDITIONAL in sections else []
+    )
+
+    return result, None
 
-def parse_dnsrec(dnsrec):
-    """Parse ares_dns_record_t into DNSResult with all sections"""
+
+def parse_dnsrec_lazy(dnsrec, sections=None, address_format=ADDRESS_FORMAT_TEXT):
+    """
+    Copy ares_dns_record_t into a LazyDNSResult, the records are parsed when accessed.
+
+    See parse_dnsrec() for the meaning of ``sections`` and ``address_format``.
+    """
     if dnsrec == _ffi.NULL:
         return None, _lib.ARES_EBADRESP
 
-    answer_records = []
-    authority_records = []
-    additional_records = []
+    dup = _lib.ares_dns_record_duplicate(dnsrec)
+    if dup == _ffi.NULL:
+        return None, _lib.ARES_ENOMEM
 
-    # Parse answer section
-    answer_count = _lib.ares_dns_record_rr_cnt(dnsrec, _lib.ARES_SECTION_ANSWER)
-    for i in range(answer_count):
-        rr = _lib.ares_dns_record_rr_get_const(dnsrec, _lib.ARES_SECTION_ANSWER, i)
-        if rr != _ffi.NULL:
-            name = maybe_str(_ffi.string(_lib.ares_dns_rr_get_name(rr)))
-            rec_type = _lib.ares_dns_rr_get_type(rr)
-            rec_class = _lib.ares_dns_rr_get_class(rr)
-            ttl = _lib.ares_dns_rr_get_ttl(rr)
+    return LazyDNSResult(dup, sections, address_format), None
 
-            try:
-                data = extract_record_data(rr, rec_type)
-                answer_records.append(DNSRecord(
-                    name=name,
-                    type=rec_type,
-                    record_class=rec_class,
-                    ttl=ttl,
-                    data=data
-                ))
-            except (ValueError, Exception):
-                # Skip unsupported record types
-                pass
 
-    # Parse authority section
-    authority_count = _lib.ares_dns_record_rr_cnt(dnsrec, _lib.ARES_SECTION_AUTHORITY)
-    for i in range(authority_count):
-        rr = _lib.ares_dns_record_rr_get_const(dnsrec, _lib.ARES_SECTION_AUTHORITY, i)
-        if rr != _ffi.NULL:
-            name = maybe_str(_ffi.string(_lib.ares_dns_rr_get_name(rr)))
-            rec_type = _lib.ares_dns_rr_get_type(rr)
-            rec_class = _lib.ares_dns_rr_get_class(rr)
-            ttl = _lib.ares_dns_rr_get_ttl(rr)
+def parse_dnsrec_raw(dnsrec):
+    """Write ares_dns_record_t as a DNS message in wire format (bytes)"""
+    if dnsrec == _ffi.NULL:
+        return None, _lib.ARES_EBADRESP
 
-            try:
-                data = extract_record_data(rr, rec_type)
-                authority_records.append(DNSRecord(
-                    name=name,
-                    type=rec_type,
-                    record_class=rec_class,
-                    ttl=ttl,
-                    data=data
-                ))
-            except (ValueError, Exception):
-                # Skip unsupported record types
-                pass
+    buf = _ffi.new("unsigned char **")
+    buf_len = _ffi.new("size_t *")
+    status = _lib.ares_dns_write(dnsrec, buf, buf_len)
+    if status != _lib.ARES_SUCCESS:
+        return None, status
 
-    # Parse additional section
-    additional_count = _lib.ares_dns_record_rr_cnt(dnsrec, _lib.ARES_SECTION_ADDITIONAL)
-    for i in range(additional_count):
-        rr = _lib.ares_dns_record_rr_get_const(dnsrec, _lib.ARES_SECTION_ADDITIONAL, i)
-        if rr != _ffi.NULL:
-            name = maybe_str(_ffi.string(_lib.ares_dns_rr_get_name(rr)))
-            rec_type = _lib.ares_dns_rr_get_type(rr)
-            rec_class = _lib.ares_dns_rr_get_class(rr)
-            ttl = _lib.ares_dns_rr_get_ttl(rr)
+    data = _ffi.unpack(_ffi.cast("char *", buf[0]), buf_len[0])
+    _lib.ares_free_string(buf[0])
 
-            try:
-                data = extract_record_data(rr, rec_type)
-                additional_records.append(DNSRecord(
-                    name=name,
-                    type=rec_type,
-                    record_class=rec_class,
-                    ttl=ttl,
-                    data=data
-                ))
-            except (ValueError, Exception):
-                # Skip unsupported record types
-                pass
+    return data, None
 
-    result = DNSResult(
-        answer=answer_records,
-        authority=authority_records,
-        additional=additional_records
+
+def _dnsrec_parser(sections, lazy, raw, address_format=ADDRESS_FORMAT_TEXT):
+    """Get the function used to turn the ares_dns_record_t of a query into its result"""
+    if raw:
+        if sections is not None or lazy:
+            raise ValueError('raw results cannot be combined with sections or lazy')
+        return parse_dnsrec_raw
+
+    parser = parse_dnsrec_lazy if lazy else parse_dnsrec
+    kwargs = {}
+    if sections is not None:
+        sections = frozenset(sections)
+        if not sections <= _ALL_SECTIONS:
+            raise ValueError('invalid section specified')
+        kwargs['sections'] = sections
+    if address_format != ADDRESS_FORMAT_TEXT:
+        kwargs['address_format'] = address_format
+
+    return functools.partial(parser, **kwargs) if kwargs else parser
+
+
+def _parse_wire(buf, parser):
+    data = _ffi.from_buffer(buf)
+    dnsrec_p = _ffi.new("ares_dns_record_t **")
+    status = _lib.ares_dns_parse(_ffi.cast("unsigned char *", data), len(data), 0, dnsrec_p)
+    if status != _lib.ARES_SUCCESS:
+        return None, status
+
+    try:
+        return parser(dnsrec_p[0])
+    finally:
+        _lib.ares_dns_record_destroy(dnsrec_p[0])
+
+
+def _parse_cached(address_format, key, wire):
+    """Parse a response of the shared cache or of a snapshot for the query options of key"""
+    _, _, _, sections, lazy, raw = key
+    if raw:
+        return wire
+    result, status = _parse_wire(wire, _dnsrec_parser(sections, lazy, raw, address_format))
+    return result if status is None else None
+
+
+def _parse_wire_chunk(messages, sections):
+    parser = _dnsrec_parser(sections, False, False)
+    return [_parse_wire(buf, parser) for buf in messages]
+
+
+def parse_wire(buf, *, sections: Optional[Iterable[int]] = None, lazy: bool = False, address_format: int = ADDRESS_FORMAT_TEXT) -> "DNSResult":
+    """
+    Parse a DNS message in wire format, without a Channel.
+
+    Args:
+        buf: DNS message, any object supporting the buffer protocol
+        sections: Sections to parse (e.g., [SECTION_ANSWER]), all of them if None
+        lazy: Return a LazyDNSResult, which only parses records when they are accessed
+        address_format: Format of the A and AAAA addresses (ADDRESS_FORMAT_* value)
+
+    Raises AresError if the message cannot be parsed.
+    """
+    _check_address_format(address_format)
+    result, status = _parse_wire(buf, _dnsrec_parser(sections, lazy, False, address_format))
+    if status is not None:
+        raise AresError(status, errno.strerror(status))
+    return result
+
+
+def parse_wire_many(messages, *, offsets=None, sections: Optional[Iterable[int]] = None, executor=None, chunksize: int = 1000) -> list:
+    """
+    Parse many DNS messages in wire format, without a Channel.
+
+    Args:
+        messages: Iterable of DNS messages (objects supporting the buffer protocol), or a
+            single buffer holding all of them if offsets is given
+        offsets: Sequence of (offset, length) tuples locating each message in messages
+        sections: Sections to parse (e.g., [SECTION_ANSWER]), all of them if None
+        executor: concurrent.futures.Executor (e.g. a ProcessPoolExecutor) to spread the
+            work on, messages are parsed in the calling thread if None
+        chunksize: Number of messages submitted to the executor at a time
+
+    Returns a list with a (result, errno) tuple per message, in order. errno is None
+    if the message was parsed, result is None otherwise.
+    """
+    if offsets is not None:
+        view = memoryview(messages)
+        messages = (view[offset:offset + length] for offset, length in offsets)
+
+    if executor is None:
+        return _parse_wire_chunk(messages, sections)
+
+    if chunksize < 1:
+        raise ValueError('chunksize must be a positive number')
+
+    # Messages are copied to bytes so they can be sent to other processes
+    messages = iter(messages)
+    chunks = iter(lambda: [bytes(buf) for buf in itertools.islice(messages, chunksize)], [])
+    results = []
+    for chunk_results in executor.map(_parse_wire_chunk, chunks, itertools.repeat(sections)):
+        results.extend(chunk_results)
+    return results
+
+
+def _create_query_dnsrec(name, query_type, query_class, recursion_desired):
+    """Create an ares_dns_record_t holding a query, it must be destroyed by the caller"""
+    dnsrec_p = _ffi.new("ares_dns_record_t **")
+    status = _lib.ares_dns_record_create(
+        dnsrec_p,
+        0,  # id (will be set by c-ares)
+        _lib.ARES_FLAG_RD if recursion_desired else 0,
+        _lib.ARES_OPCODE_QUERY,
+        _lib.ARES_RCODE_NOERROR
     )
+    if status != _lib.ARES_SUCCESS:
+        raise AresError(status, errno.strerror(status))
 
-    return result, None
+    dnsrec = dnsrec_p[0]
+
+    # Add the query to the DNS record
+    status = _lib.ares_dns_record_query_add(
+        dnsrec,
+        parse_name(name),
+        query_type,
+        query_class
+    )
+    if status != _lib.ARES_SUCCESS:
+        _lib.ares_dns_record_destroy(dnsrec)
+        raise AresError(status, errno.strerror(status))
+
+    return dnsrec
 
 
 class _ChannelShutdownManager:
@@ -440,7 +2208,7 @@ class _ChannelShutdownManager:
         """Process channel destruction requests from the queue."""
         while True:
             # Block forever until we get a channel to destroy
-            channel, _ = self._queue.get()
+            channel, _, in_flight = self._queue.get()
 
             # Cancel all pending queries - this will trigger callbacks with ARES_ECANCELLED
             _lib.ares_cancel(channel[0])
@@ -452,6 +2220,13 @@ class _ChannelShutdownManager:
             if channel is not None:
                 _lib.ares_destroy(channel[0])
 
+            # Deliver the cancellations which went through the completion ring
+            if in_flight.completions is not None:
+                try:
+                    in_flight.completions.process(in_flight)
+                except Exception:
+                    traceback.print_exc()
+
     def start(self) -> None:
         """Start the background thread if not already started."""
         if self._thread is not None:
@@ -463,19 +2238,21 @@ class _ChannelShutdownManager:
             self._thread = threading.Thread(target=self._run_safe_shutdown_loop, daemon=True)
             self._thread.start()
 
-    def destroy_channel(self, channel, sock_state_cb_handle) -> None:
+    def destroy_channel(self, channel, sock_state_cb_handle, in_flight) -> None:
         """
         Schedule channel destruction on the background thread.
 
         The socket state callback handle is passed along to ensure it remains
-        alive until the channel is destroyed.
+        alive until the channel is destroyed. So is the in-flight table, whose
+        slots c-ares references, and its completion ring, if any, which is
+        drained once the channel is gone.
 
         Thread Safety and Synchronization:
         This method uses SimpleQueue which is thread-safe for putting items
         from multiple threads. The background thread processes channels
         sequentially waiting for queries to end before each destruction.
         """
-        self._queue.put((channel, sock_state_cb_handle))
+        self._queue.put((channel, sock_state_cb_handle, in_flight))
 
 
 # Global shutdown manager instance
@@ -503,7 +2280,23 @@ class Channel:
                  rotate: bool = False,
                  local_ip: Union[str, bytes, None] = None,
                  local_dev: Optional[str] = None,
-                 resolvconf_path: Union[str, bytes, None] = None) -> None:
+                 resolvconf_path: Union[str, bytes, None] = None,
+                 address_format: int = ADDRESS_FORMAT_TEXT,
+                 completion_ring: Optional[int] = None,
+                 coalesce_queries: bool = False,
+                 cache_size: Optional[int] = None,
+                 negative_cache_max_ttl: int = 900,
+                 cache_stale_ttl: int = 0,
+                 cache_prefetch: float = 0.0,
+                 cache_prefetch_hits: int = 2,
+                 cache_jitter: float = 0.1,
+                 cache_shards: Optional[int] = None,
+                 cache_policy: str = 'lru',
+                 cache_snapshots: bool = False,
+                 shared_cache: Union[str, bytes, os.PathLike, None] = None,
+                 shared_cache_size: int = 16384,
+                 query_info: bool = False,
+                 qcache_max_ttl: Optional[int] = None) -> None:
 
         # Initialize _channel to None first to ensure __del__ doesn't fail
         self._channel = None
@@ -511,6 +2304,15 @@ class Channel:
         # Store flags for later use (default is 0 if not specified)
         self._flags = flags if flags is not None else 0
 
+        _check_address_format(address_format)
+        self._address_format = address_format
+
+        self._completions = _CompletionRing(completion_ring) if completion_ring is not None else None
+        self._in_flight = _InFlightTable(self._completions)
+        self._in_flight.query_info = query_info
+        self._coalescer = _QueryCoalescer() if coalesce_queries else None
+        self._cache = None
+
         channel = _ffi.new("ares_channel *")
         options = _ffi.new("struct ares_options *")
         optmask = 0
@@ -547,6 +2349,10 @@ class Channel:
             options.socket_receive_buffer_size = socket_receive_buffer_size
             optmask = optmask |  _lib.ARES_OPT_SOCK_RCVBUF
 
+        if qcache_max_ttl is not None:
+            options.qcache_max_ttl = qcache_max_ttl
+            optmask = optmask |  _lib.ARES_OPT_QUERY_CACHE
+
         if sock_state_cb:
             if not callable(sock_state_cb):
                 raise TypeError("sock_state_cb is not callable")
@@ -589,6 +2395,27 @@ class Channel:
         if r != _lib.ARES_SUCCESS:
             raise AresError('Failed to initialize c-ares channel')
 
+        # The response cache and the in-flight table are only set up once
+        # the c-ares channel is, close() releases them from then on
+        shared = None
+        try:
+            if cache_size is not None:
+                shared = _SharedCache(shared_cache, shared_cache_size) if shared_cache is not None else None
+                if cache_shards is None:
+                    cache_shards = min(16, max(1, cache_size // 4096))
+                self._cache = _ResponseCache(cache_size, negative_cache_max_ttl, cache_stale_ttl, cache_prefetch, cache_prefetch_hits, cache_jitter,
+                                             shards=cache_shards, policy=cache_policy, keep_wire=cache_snapshots,
+                                             parse=functools.partial(_parse_cached, address_format), shared=shared)
+            elif shared_cache is not None:
+                raise ValueError('shared_cache requires cache_size')
+        except BaseException:
+            if shared is not None:
+                shared.close()
+            # Nothing was submitted to the channel yet
+            _lib.ares_destroy(channel[0])
+            raise
+
+        _in_flight_tables.add(self._in_flight)
         self._channel = channel
         if servers:
             self.servers = servers
@@ -608,17 +2435,17 @@ class Channel:
 
     def _create_callback_handle(self, callback_data):
         """
-        Create a callback handle and register it for tracking.
+        Register the callback data of a new query in the in-flight table.
 
-        This ensures that:
-        1. The callback data is wrapped in a CFFI handle
-        2. The handle is mapped to this channel to keep it alive
+        The channel is kept alive while it has queries in flight, see
+        _InFlightTable.
 
         Args:
             callback_data: The data to pass to the callback (usually a callable or tuple)
 
         Returns:
-            The CFFI handle that can be passed to C functions
+            The pycares_slot_t of the query, which is passed to c-ares as the
+            callback argument
 
         Raises:
             RuntimeError: If the channel is destroyed
@@ -627,9 +2454,188 @@ class Channel:
         if self._channel is None:
             raise RuntimeError("Channel is destroyed, no new queries allowed")
 
-        userdata = _ffi.new_handle(callback_data)
-        _handle_to_channel[userdata] = self
-        return userdata
+        return self._in_flight.acquire(self, callback_data)
+
+    def _create_completion_handle(self, callback, data, python_cb, ring_cb):
+        """
+        Register a query which can complete through the completion ring.
+
+        Returns a (c-ares callback, callback argument, callback data) tuple.
+        """
+        callback_data = (callback, data)
+        cb = python_cb if self._completions is None else ring_cb
+        return cb, self._create_callback_handle(callback_data), callback_data
+
+    def _submit_failed(self, index: int, callback_data: tuple, status: int) -> None:
+        """
+        Complete a query which c-ares failed to submit. c-ares ran its
+        callback already, with a completion ring it's run here too, so that
+        the callback always ran when AresError is raised.
+        """
+        if self._completions is None:
+            self._in_flight.release(index, callback_data)
+            return
+        data, info = self._in_flight.abandon(index, callback_data, status)
+        if data is None:
+            return
+        try:
+            _run_callback(data[0], None, status, info)
+        except Exception:
+            # AresError is raised regardless, as without a completion ring
+            traceback.print_exc()
+
+    def process_completions(self, max_completions: Optional[int] = None) -> int:
+        """
+        Run the callbacks of the queries completed so far, on the calling thread.
+        Only for channels created with completion_ring.
+
+        Args:
+            max_completions: Maximum number of callbacks to run, all of them if None
+
+        Returns the number of callbacks which ran.
+        """
+        if self._completions is None:
+            raise RuntimeError('the channel has no completion ring')
+        return self._completions.process(self._in_flight, max_completions)
+
+    def completion_fd(self) -> int:
+        """
+        Get a file descriptor which becomes readable when there are completions
+        to process, for channels created with completion_ring. It's signaled
+        once per burst of completions, process_completions() resets it.
+        """
+        if self._completions is None:
+            raise RuntimeError('the channel has no completion ring')
+        return self._completions.fileno()
+
+    @property
+    def pending_completions(self) -> int:
+        """Number of completed queries whose callback didn't run yet (completion ring only)"""
+        return len(self._completions) if self._completions is not None else 0
+
+    @property
+    def queries_in_flight(self) -> int:
+        """Number of queries whose callback didn't run yet"""
+        return len(self._in_flight)
+
+    def query_stats(self) -> dict:
+        """
+        Counters of the queries completed by the channel: completed, errors
+        (completed with an error, including cancelled queries), timeouts
+        (total number of timeouts), timed_out (queries which had at least
+        one timeout), latency_mean and latency_max (in seconds, from the
+        submission of a query to its callback). Hits of the response cache
+        are not counted.
+        """
+        return self._in_flight.stats()
+
+    def _wrap_callback(self, callback: Callable) -> Callable:
+        if self._in_flight.query_info:
+            return _QueryInfoCallback(callback)
+        return callback
+
+    def cache_stats(self) -> dict:
+        """
+        Counters of the response cache (cache_size only): hits,
+        negative_hits, stale_hits, snapshot_hits (entries taken from a
+        snapshot loaded with cache_load()), shared_hits (entries taken from
+        the shared cache), misses, evictions, rejections (entries not
+        admitted by the tinylfu policy), prefetches, refreshes,
+        refresh_failures, size (number of entries), negative_size (number of
+        negative entries), bytes (size of the cached responses in wire
+        format) and maxsize.
+        """
+        if self._cache is None:
+            raise RuntimeError('the channel has no response cache')
+        return self._cache.stats()
+
+    def cache_flush(self, name: Union[str, bytes, None] = None, suffix: Union[str, bytes, None] = None) -> int:
+        """
+        Remove entries from the response cache: those of name (query() and
+        getaddrinfo() results of any type), or those of suffix and of all the
+        names below it, or all of them if neither is given. Entries are found
+        with an index of the names by label, so flushing a domain only takes
+        time for the entries it removes.
+
+        The entries are also removed from the shared cache, and skipped in
+        the loaded snapshot (which is detached when everything is flushed).
+        The c-ares query cache (qcache_max_ttl) is flushed by reinit().
+
+        Returns the number of entries removed from the response cache.
+        """
+        if self._cache is None:
+            raise RuntimeError('the channel has no response cache')
+        if name is not None and suffix is not None:
+            raise ValueError('name and suffix cannot be combined')
+        if name is not None:
+            name = parse_name(name).lower().rstrip(b'.')
+        if suffix is not None:
+            # The root domain matches every name
+            suffix = parse_name(suffix).lower().rstrip(b'.') or None
+        return self._cache.flush(name, suffix)
+
+    def cache_entries(self) -> Iterator["CacheEntryInfo"]:
+        """
+        Iterate over the entries of the response cache which can still be
+        served, stale ones included. The entries are copied when the
+        iteration starts.
+        """
+        if self._cache is None:
+            raise RuntimeError('the channel has no response cache')
+        now = time.monotonic()
+        for key, entry in self._cache.entries():
+            if key[0] == 'getaddrinfo':
+                name, query_type, query_class = key[1], None, None
+            else:
+                name, query_type, query_class = key[:3]
+            yield CacheEntryInfo(
+                name=maybe_str(name),
+                query_type=query_type,
+                query_class=query_class,
+                ttl=entry.expires - now,
+                errorno=entry.errorno,
+                hits=entry.hits,
+                size=len(entry.wire) if entry.wire is not None else 0,
+                result=_copy_result(entry.result),
+            )
+
+    def cache_save(self, path: Union[str, bytes, os.PathLike]) -> int:
+        """
+        Save the response cache to a snapshot file, which can be loaded with
+        cache_load() to start another channel with a warm cache. Expiry
+        times are saved as wall clock times, so loaded entries only live for
+        the rest of their TTL. getaddrinfo() results are not saved.
+
+        The file is replaced atomically. Returns the number of saved entries.
+        The channel must be created with cache_snapshots (or shared_cache).
+        """
+        if self._cache is None:
+            raise RuntimeError('the channel has no response cache')
+        if not self._cache.keep_wire:
+            raise RuntimeError('the channel was created without cache_snapshots')
+        return self._cache.save_snapshot(path)
+
+    def cache_load(self, path: Union[str, bytes, os.PathLike]) -> int:
+        """
+        Load a snapshot saved with cache_save(). The file is memory-mapped
+        and its entries are only read and parsed on cache misses, so loading
+        is fast whatever the size of the snapshot. Loading a snapshot
+        replaces the previously loaded one, entries already in the cache are
+        kept.
+
+        Raises ValueError if the file is not a snapshot. Returns the number
+        of entries in the snapshot, expired ones included.
+        """
+        if self._cache is None:
+            raise RuntimeError('the channel has no response cache')
+        snapshot = _CacheSnapshot(path)
+        self._cache.load_snapshot(snapshot)
+        return len(snapshot)
+
+    @property
+    def queries_coalesced(self) -> int:
+        """Number of queries which were answered by an identical query in flight (coalesce_queries only)"""
+        return self._coalescer.coalesced if self._coalescer is not None else 0
 
     def cancel(self) -> None:
         _lib.ares_cancel(self._channel[0])
@@ -693,6 +2699,7 @@ class Channel:
     def gethostbyaddr(self, addr: str, *, callback: Callable[[Any, int], None]) -> None:
         if not callable(callback):
             raise TypeError("a callable is required")
+        callback = self._wrap_callback(callback)
 
         addr4 = _ffi.new("struct in_addr*")
         addr6 = _ffi.new("struct ares_in6_addr*")
@@ -706,7 +2713,7 @@ class Channel:
             raise ValueError("invalid IP address")
 
         userdata = self._create_callback_handle(callback)
-        _lib.ares_gethostbyaddr(self._channel[0], address, _ffi.sizeof(address[0]), family, _lib._host_cb, userdata)
+        _lib.ares_gethostbyaddr(self._channel[0], address, _ffi.sizeof(address[0]), family, _lib.pycares_host_cb, userdata)
 
     def getaddrinfo(
         self,
@@ -721,6 +2728,7 @@ class Channel:
     ) -> None:
         if not callable(callback):
             raise TypeError("a callable is required")
+        callback = self._wrap_callback(callback)
 
         if port is None:
             service = _ffi.NULL
@@ -729,16 +2737,33 @@ class Channel:
         else:
             service = ascii_bytes(port)
 
-        userdata = self._create_callback_handle(callback)
+        host = parse_name(host)
+        cache = self._cache
+        if cache is not None:
+            if self._channel is None:
+                raise RuntimeError("Channel is destroyed, no new queries allowed")
+            key = ('getaddrinfo', host.lower(), service, family, type, proto, flags)
+
+            def submit(refreshed):
+                self._getaddrinfo(host, service, family, type, proto, flags, functools.partial(_addrinfo_with_ttl, refreshed))
+
+            if self._cache_lookup(key, callback, submit):
+                return
+            callback = functools.partial(_addrinfo_with_ttl, functools.partial(cache.complete, key, callback))
+
+        self._getaddrinfo(host, service, family, type, proto, flags, callback)
+
+    def _getaddrinfo(self, host: bytes, service: Any, family: int, type: int, proto: int, flags: int, callback: Callable[[Any, int], None]) -> None:
+        cb, arg, _ = self._create_completion_handle(callback, self._address_format, _lib.pycares_addrinfo_cb, _lib.pycares_ring_addrinfo_cb)
 
         hints = _ffi.new('struct ares_addrinfo_hints*')
         hints.ai_flags = flags
         hints.ai_family = family
         hints.ai_socktype = type
         hints.ai_protocol = proto
-        _lib.ares_getaddrinfo(self._channel[0], parse_name(host), service, hints, _lib._addrinfo_cb, userdata)
+        _lib.ares_getaddrinfo(self._channel[0], host, service, hints, cb, arg)
 
-    def query(self, name: str, query_type: int, *, query_class: int = QUERY_CLASS_IN, callback: Callable[[Any, int], None]) -> None:
+    def query(self, name: str, query_type: int, *, query_class: int = QUERY_CLASS_IN, sections: Optional[Iterable[int]] = None, lazy: bool = False, raw: bool = False, callback: Callable[[Any, int], None]) -> None:
         """
         Perform a DNS query.
 
@@ -746,12 +2771,17 @@ class Channel:
             name: Domain name to query
             query_type: Type of query (e.g., QUERY_TYPE_A, QUERY_TYPE_AAAA, etc.)
             query_class: Query class (default: QUERY_CLASS_IN)
+            sections: Sections to parse (e.g., [SECTION_ANSWER]), all of them if None
+            lazy: Return a LazyDNSResult, which only parses records when they are accessed
+            raw: Return the response as a DNS message in wire format (bytes)
             callback: Callback function that receives (result, errno)
 
         The callback will receive a DNSResult object containing answer, authority, and additional sections.
+        Sections which were not requested are empty.
         """
         if not callable(callback):
             raise TypeError('a callable is required')
+        callback = self._wrap_callback(callback)
 
         if query_type not in self.__qtypes__:
             raise ValueError('invalid query type specified')
@@ -759,22 +2789,74 @@ class Channel:
         if query_class not in self.__qclasses__:
             raise ValueError('invalid query class specified')
 
-        userdata = self._create_callback_handle(callback)
+        parser = _dnsrec_parser(sections, lazy, raw, self._address_format)
+        name = parse_name(name)
+
+        cache = self._cache
+        coalescer = self._coalescer
+        if cache is not None or coalescer is not None:
+            if self._channel is None:
+                raise RuntimeError("Channel is destroyed, no new queries allowed")
+            key = (name.lower(), query_type, query_class, frozenset(sections) if sections is not None else None, lazy, raw)
+
+        if cache is not None:
+            parser = _TTLParser(parser, cache.keep_wire)
+            submit = functools.partial(self._query_dnsrec, name, query_type, query_class, parser)
+            if self._cache_lookup(key, callback, submit):
+                return
+
+        if coalescer is not None:
+            waiters = coalescer.join(key, callback)
+            if waiters is None:
+                return
+            callback = functools.partial(coalescer.complete, key, waiters)
+
+        if cache is not None:
+            callback = functools.partial(cache.complete, key, callback)
+
+        try:
+            self._query_dnsrec(name, query_type, query_class, parser, callback)
+        except AresError as e:
+            if coalescer is not None:
+                coalescer.abandon(key, waiters, e.args[0])
+            raise
+
+    def _query_dnsrec(self, name: bytes, query_type: int, query_class: int, parser: Any, callback: Callable[[Any, int], None]) -> None:
+        cb, arg, callback_data = self._create_completion_handle(callback, parser, _lib.pycares_query_dnsrec_cb, _lib.pycares_ring_dnsrec_cb)
         qid = _ffi.new("unsigned short *")
         status = _lib.ares_query_dnsrec(
             self._channel[0],
-            parse_name(name),
+            name,
             query_class,
             query_type,
-            _lib._query_dnsrec_cb,
-            userdata,
+            cb,
+            arg,
             qid
         )
         if status != _lib.ARES_SUCCESS:
-            _handle_to_channel.pop(userdata, None)
+            self._submit_failed(arg.index, callback_data, status)
             raise AresError(status, errno.strerror(status))
 
-    def search(self, name: str, query_type: int, *, query_class: int = QUERY_CLASS_IN, callback: Callable[[Any, int], None]) -> None:
+    def _cache_lookup(self, key: tuple, callback: Callable[[Any, int], None], submit: Callable[[Callable], None]) -> bool:
+        """
+        Answer a query from the response cache, returns False on a miss.
+        submit(callback) sends the query again, to refresh the entry in the
+        background.
+        """
+        cached = self._cache.get(key)
+        if cached is None:
+            return False
+        result, errorno, refresh = cached
+        if refresh:
+            refreshed = functools.partial(self._cache.refreshed, key)
+            try:
+                submit(refreshed)
+            except AresError as e:
+                refreshed(None, e.args[0])
+        callback(_copy_result(result), errorno)
+        return True
+
+    def search(self, name: str, query_type: int, *, query_class: int = QUERY_CLASS_IN, sections: Optional[Iterable[int]] = None, lazy: bool = False, raw: bool = False, callback: Callable[[Any, int], None]) -> None:
         """
         Perform a DNS search (honors resolv.conf search domains).
 
@@ -782,12 +2864,17 @@ class Channel:
             name: Domain name to search
             query_type: Type of query (e.g., QUERY_TYPE_A, QUERY_TYPE_AAAA, etc.)
             query_class: Query class (default: QUERY_CLASS_IN)
+            sections: Sections to parse (e.g., [SECTION_ANSWER]), all of them if None
+            lazy: Return a LazyDNSResult, which only parses records when they are accessed
+            raw: Return the response as a DNS message in wire format (bytes)
             callback: Callback function that receives (result, errno)
 
         The callback will receive a DNSResult object containing answer, authority, and additional sections.
+        Sections which were not requested are empty.
         """
         if not callable(callback):
             raise TypeError('a callable is required')
+        callback = self._wrap_callback(callback)
 
         if query_type not in self.__qtypes__:
             raise ValueError('invalid query type specified')
@@ -795,56 +2882,154 @@ class Channel:
         if query_class not in self.__qclasses__:
             raise ValueError('invalid query class specified')
 
-        # Create a DNS record for the search query
+        parser = _dnsrec_parser(sections, lazy, raw, self._address_format)
+
         # Set RD (Recursion Desired) flag unless ARES_FLAG_NORECURSE is set
-        dns_flags = 0 if (self._flags & _lib.ARES_FLAG_NORECURSE) else _lib.ARES_FLAG_RD
-
-        dnsrec_p = _ffi.new("ares_dns_record_t **")
-        status = _lib.ares_dns_record_create(
-            dnsrec_p,
-            0,  # id (will be set by c-ares)
-            dns_flags,  # flags - include RD for recursive queries
-            _lib.ARES_OPCODE_QUERY,
-            _lib.ARES_RCODE_NOERROR
-        )
+        dnsrec = _create_query_dnsrec(name, query_type, query_class, not (self._flags & _lib.ARES_FLAG_NORECURSE))
+
+        # c-ares makes its own copy of the DNS record, so it can go right away
+        try:
+            cb, arg, callback_data = self._create_completion_handle(callback, parser, _lib.pycares_query_dnsrec_cb, _lib.pycares_ring_dnsrec_cb)
+            status = _lib.ares_search_dnsrec(
+                self._channel[0],
+                dnsrec,
+                cb,
+                arg
+            )
+        finally:
+            _lib.ares_dns_record_destroy(dnsrec)
         if status != _lib.ARES_SUCCESS:
+            self._submit_failed(arg.index, callback_data, status)
             raise AresError(status, errno.strerror(status))
 
-        dnsrec = dnsrec_p[0]
+    def send(self, query: "PreparedQuery", *, search: bool = False, sections: Optional[Iterable[int]] = None, lazy: bool = False, raw: bool = False, callback: Callable[[Any, int], None]) -> None:
+        """
+        Submit a PreparedQuery.
 
-        # Add the query to the DNS record
-        status = _lib.ares_dns_record_query_add(
-            dnsrec,
-            parse_name(name),
-            query_type,
-            query_class
-        )
-        if status != _lib.ARES_SUCCESS:
-            _lib.ares_dns_record_destroy(dnsrec)
-            raise AresError(status, errno.strerror(status))
+        Args:
+            query: The PreparedQuery to submit, it can be submitted any number of times
+            search: Honor resolv.conf search domains, like search() does
+            sections: Sections to parse (e.g., [SECTION_ANSWER]), all of them if None
+            lazy: Return a LazyDNSResult, which only parses records when they are accessed
+            raw: Return the response as a DNS message in wire format (bytes)
+            callback: Callback function that receives (result, errno)
 
-        # Wrap callback to destroy DNS record after it's called
-        original_callback = callback
-        def cleanup_callback(result, error):
-            try:
-                original_callback(result, error)
-            finally:
-                # Clean up the DNS record after the callback completes
-                _lib.ares_dns_record_destroy(dnsrec)
+        The callback receives the same result as with query() and search().
+        """
+        if not callable(callback):
+            raise TypeError('a callable is required')
+        callback = self._wrap_callback(callback)
 
-        # Perform the search with the created DNS record
-        userdata = self._create_callback_handle(cleanup_callback)
-        status = _lib.ares_search_dnsrec(
-            self._channel[0],
-            dnsrec,
-            _lib._query_dnsrec_cb,
-            userdata
-        )
+        if not isinstance(query, PreparedQuery):
+            raise TypeError('a PreparedQuery is required')
+
+        parser = _dnsrec_parser(sections, lazy, raw, self._address_format)
+
+        cb, arg, callback_data = self._create_completion_handle(callback, parser, _lib.pycares_query_dnsrec_cb, _lib.pycares_ring_dnsrec_cb)
+        if search:
+            status = _lib.ares_search_dnsrec(self._channel[0], query._dnsrec, cb, arg)
+        else:
+            # c-ares assigns a fresh id to each copy it sends
+            status = _lib.ares_send_dnsrec(self._channel[0], query._dnsrec, cb, arg, _ffi.NULL)
         if status != _lib.ARES_SUCCESS:
-            _handle_to_channel.pop(userdata, None)
-            _lib.ares_dns_record_destroy(dnsrec)
+            self._submit_failed(arg.index, callback_data, status)
             raise AresError(status, errno.strerror(status))
 
+    def _create_batch_handles(self, batch: "QueryBatch", data: Any):
+        """Register the queries of a batch, returns the array of their callback arguments"""
+        if self._channel is None:
+            raise RuntimeError("Channel is destroyed, no new queries allowed")
+
+        on_result = batch._on_result
+        callback_data = [(functools.partial(on_result, i), data) for i in range(len(batch))]
+        return _ffi.new("void *[]", self._in_flight.acquire_many(self, callback_data))
+
+    def query_many(self, names: Iterable[Union[str, bytes]], query_type: int, *, query_class: int = QUERY_CLASS_IN, sections: Optional[Iterable[int]] = None, lazy: bool = False, raw: bool = False, callback: Optional[Callable[[Union[str, bytes], Any, Optional[int]], None]] = None) -> "QueryBatch":
+        """
+        Perform a DNS query for each of the given names.
+
+        The arguments are validated once for the whole batch, which is
+        submitted to c-ares in a single call.
+
+        Args:
+            names: Domain names to query
+            query_type: Type of query (e.g., QUERY_TYPE_A, QUERY_TYPE_AAAA, etc.)
+            query_class: Query class (default: QUERY_CLASS_IN)
+            sections: Sections to parse (e.g., [SECTION_ANSWER]), all of them if None
+            lazy: Return LazyDNSResult objects, which only parse records when they are accessed
+            raw: Return the responses as DNS messages in wire format (bytes)
+            callback: Callback function that receives (name, result, errno) for
+                each name. If None, the results are collected in QueryBatch.results
+
+        Returns a QueryBatch to wait for or cancel the queries.
+        """
+        if callback is not None and not callable(callback):
+            raise TypeError('a callable is required')
+
+        if query_type not in self.__qtypes__:
+            raise ValueError('invalid query type specified')
+
+        if query_class not in self.__qclasses__:
+            raise ValueError('invalid query class specified')
+
+        parser = _dnsrec_parser(sections, lazy, raw, self._address_format)
+
+        names = list(names)
+        encoded = _encode_names(names)
+        batch = QueryBatch(names, callback)
+        if not names:
+            return batch
+
+        args = self._create_batch_handles(batch, parser)
+        cb = _lib.pycares_query_dnsrec_cb if self._completions is None else _lib.pycares_ring_dnsrec_cb
+        _lib.pycares_query_many(self._channel[0], encoded, len(names), query_class, query_type, cb, args)
+        return batch
+
+    def getaddrinfo_many(
+        self,
+        hosts: Iterable[Union[str, bytes]],
+        port: Optional[int] = None,
+        *,
+        family: socket.AddressFamily = 0,
+        type: int = 0,
+        proto: int = 0,
+        flags: int = 0,
+        callback: Optional[Callable[[Union[str, bytes], Any, Optional[int]], None]] = None
+    ) -> "QueryBatch":
+        """
+        Perform getaddrinfo() for each of the given hosts, with the same
+        port and hints for all of them.
+
+        The callback, if any, receives (host, result, errno) for each host.
+        Returns a QueryBatch, see query_many().
+        """
+        if callback is not None and not callable(callback):
+            raise TypeError('a callable is required')
+
+        if port is None:
+            service = _ffi.NULL
+        elif isinstance(port, int):
+            service = str(port).encode('ascii')
+        else:
+            service = ascii_bytes(port)
+
+        hosts = list(hosts)
+        encoded = _encode_names(hosts)
+        batch = QueryBatch(hosts, callback)
+        if not hosts:
+            return batch
+
+        args = self._create_batch_handles(batch, self._address_format)
+        cb = _lib.pycares_addrinfo_cb if self._completions is None else _lib.pycares_ring_addrinfo_cb
+
+        hints = _ffi.new('struct ares_addrinfo_hints*')
+        hints.ai_flags = flags
+        hints.ai_family = family
+        hints.ai_socktype = type
+        hints.ai_protocol = proto
+        _lib.pycares_getaddrinfo_many(self._channel[0], encoded, len(hosts), service, hints, cb, args)
+        return batch
+
     def set_local_ip(self, ip):
         addr4 = _ffi.new("struct in_addr*")
         addr6 = _ffi.new("struct ares_in6_addr*")
@@ -858,6 +3043,7 @@ class Channel:
     def getnameinfo(self, address: Union[IP4, IP6], flags: int, *, callback: Callable[[Any, int], None]) -> None:
         if not callable(callback):
             raise TypeError("a callable is required")
+        callback = self._wrap_callback(callback)
 
         if len(address) == 2:
             (ip, port) = address
@@ -881,7 +3067,7 @@ class Channel:
             raise ValueError("Invalid address argument")
 
         userdata = self._create_callback_handle(callback)
-        _lib.ares_getnameinfo(self._channel[0], _ffi.cast("struct sockaddr*", sa), _ffi.sizeof(sa[0]), flags, _lib._nameinfo_cb, userdata)
+        _lib.ares_getnameinfo(self._channel[0], _ffi.cast("struct sockaddr*", sa), _ffi.sizeof(sa[0]), flags, _lib.pycares_nameinfo_cb, userdata)
 
     def set_local_dev(self, dev):
         _lib.ares_set_local_dev(self._channel[0], dev)
@@ -907,7 +3093,10 @@ class Channel:
 
         # Schedule channel destruction
         channel, self._channel = self._channel, None
-        _shutdown_manager.destroy_channel(channel, self._sock_state_cb_handle)
+        if self._cache is not None:
+            self._cache.close()
+        _in_flight_tables.discard(self._in_flight)
+        _shutdown_manager.destroy_channel(channel, self._sock_state_cb_handle, self._in_flight)
 
     def wait(self, timeout: float=None) -> bool:
         """
@@ -925,43 +3114,351 @@ class Channel:
             raise AresError(r, errno.strerror(r))
 
 
+def _encode_names(names: list) -> bytes:
+    """Encode names for pycares_query_many(): NUL terminated, back to back"""
+    encoded = b''.join([parse_name(name) + b'\0' for name in names])
+    if encoded.count(b'\0') != len(names):
+        raise ValueError('names cannot contain NUL characters')
+    return encoded
+
+
+class QueryBatch:
+    """
+    Queries submitted together with Channel.query_many() or
+    Channel.getaddrinfo_many().
+
+    The batch completes when every query did, or when it's cancelled.
+    """
+
+    def __init__(self, names: list, callback: Optional[Callable[[Union[str, bytes], Any, Optional[int]], None]] = None) -> None:
+        self.names = names
+        self._callback = callback
+        # Results in the order of names, when there is no callback. Failed
+        # queries have an AresError.
+        self.results: Optional[list] = [None] * len(names) if callback is None else None
+        self._completed = bytearray(len(names))
+        self._pending = len(names)
+        self._cancelled = False
+        self._finished = not names
+        self._lock = threading.Lock()
+        self._event = threading.Event()
+        self._done_callbacks: list = []
+        if not names:
+            self._event.set()
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def __repr__(self) -> str:
+        return f"<QueryBatch queries={len(self.names)} pending={self._pending} cancelled={self._cancelled}>"
+
+    @property
+    def pending(self) -> int:
+        """Number of queries which didn't complete yet"""
+        return self._pending
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled
+
+    def done(self) -> bool:
+        return self._event.is_set()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """
+        Wait until the batch completes, returns False on timeout. Only for
+        channels which process their queries on another thread (the
+        default), or with a completion ring processed on another thread.
+        """
+        return self._event.wait(timeout)
+
+    def add_done_callback(self, fn: Callable[["QueryBatch"], None]) -> None:
+        """Call fn(batch) when the batch completes, right away if it did already"""
+        with self._lock:
+            if not self._finished:
+                self._done_callbacks.append(fn)
+                return
+        fn(self)
+
+    def cancel(self) -> int:
+        """
+        Complete the pending queries of the batch with ARES_ECANCELLED, on the
+        calling thread. Their answers are discarded if they arrive later.
+
+        Returns the number of queries which were cancelled.
+        """
+        with self._lock:
+            if self._pending == 0:
+                return 0
+            self._cancelled = True
+            indexes = [i for i, completed in enumerate(self._completed) if not completed]
+            for i in indexes:
+                self._completed[i] = 1
+            self._pending = 0
+
+        try:
+            for i in indexes:
+                self._deliver(i, None, _lib.ARES_ECANCELLED)
+        finally:
+            self._finish()
+        return len(indexes)
+
+    def _on_result(self, index: int, result: Any, errorno: Optional[int]) -> None:
+        with self._lock:
+            if self._completed[index]:
+                # Cancelled
+                return
+            self._completed[index] = 1
+            self._pending -= 1
+            done = self._pending == 0
+
+        try:
+            self._deliver(index, result, errorno)
+        finally:
+            if done:
+                self._finish()
+
+    def _deliver(self, index: int, result: Any, errorno: Optional[int]) -> None:
+        if self._callback is not None:
+            self._callback(self.names[index], result, errorno)
+        elif errorno is not None:
+            self.results[index] = AresError(errorno, errno.strerror(errorno))
+        else:
+            self.results[index] = result
+
+    def _finish(self) -> None:
+        with self._lock:
+            self._finished = True
+            callbacks, self._done_callbacks = self._done_callbacks, []
+        try:
+            for fn in callbacks:
+                fn(self)
+        finally:
+            # Waiters are released once the done callbacks ran
+            self._event.set()
+
+
+def resolve_stream(
+    channel: Channel,
+    names: Iterable[Union[str, bytes]],
+    qtypes: Union[int, Iterable[int]],
+    *,
+    max_in_flight: int = 100,
+    query_class: int = QUERY_CLASS_IN,
+    sections: Optional[Iterable[int]] = None,
+    lazy: bool = False,
+    raw: bool = False
+) -> Iterator[tuple]:
+    """
+    Resolve the names of an iterable, keeping max_in_flight queries
+    outstanding, and yield (name, result, errorno) as the answers arrive.
+
+    Each name is queried for every type in qtypes, which can also be a
+    single query type. Queries are refilled from the completion callbacks,
+    and names are only pulled from the iterable when there is room in the
+    window, so memory use doesn't depend on the length of the input. At most
+    max_in_flight answers are kept until they are consumed.
+
+    The channel must use the event thread (no sock_state_cb). With a
+    completion ring, the generator processes the completions itself.
+    """
+    stream = _ResolveStream(channel, names, qtypes, max_in_flight,
+                            dict(query_class=query_class, sections=sections, lazy=lazy, raw=raw))
+    try:
+        while True:
+            item = stream.next()
+            if item is None:
+                return
+            yield item
+    finally:
+        stream.close()
+
+
+class _ResolveStream:
+    """State of a resolve_stream() generator, shared with the query callbacks"""
+
+    def __init__(self, channel: Channel, names: Iterable[Union[str, bytes]], qtypes: Union[int, Iterable[int]], max_in_flight: int, query_kwargs: dict) -> None:
+        if channel._sock_state_cb_handle is not None:
+            raise ValueError('the channel must use the event thread')
+
+        if max_in_flight < 1:
+            raise ValueError('max_in_flight must be at least 1')
+
+        qtypes = (qtypes,) if isinstance(qtypes, int) else tuple(qtypes)
+        if not qtypes or any(qtype not in Channel.__qtypes__ for qtype in qtypes):
+            raise ValueError('invalid query type specified')
+
+        self._channel = channel
+        self._queries = ((name, qtype) for name in names for qtype in qtypes)
+        self._max_in_flight = max_in_flight
+        self._query_kwargs = query_kwargs
+        self._lock = threading.Lock()
+        self._results: SimpleQueue = SimpleQueue()
+        # Answers which were not consumed yet, the window isn't refilled
+        # past max_in_flight of them
+        self._buffered = 0
+        self._in_flight = 0
+        # Set while some thread fills the window, see _submit()
+        self._submitting = False
+        self._exhausted = False
+        self._closed = False
+        self._error: Optional[BaseException] = None
+
+    def close(self) -> None:
+        # Queries still in flight complete, their answers are discarded
+        with self._lock:
+            self._closed = True
+            self._exhausted = True
+
+    def next(self) -> Optional[tuple]:
+        """Next answer, or None once every query completed"""
+        completions = self._channel._completions
+        while self._results.empty():
+            self._submit()
+            with self._lock:
+                if self._exhausted and self._in_flight == 0 and self._buffered == 0:
+                    if self._error is not None:
+                        error, self._error = self._error, None
+                        raise error
+                    return None
+            if completions is None:
+                # Some query is in flight or answered, so this doesn't block forever
+                break
+            if self._results.empty():
+                select.select([completions.fileno()], [], [], 0.1)
+                self._channel.process_completions()
+
+        item = self._results.get()
+        with self._lock:
+            self._buffered -= 1
+        self._submit()
+        return item
+
+    def _submit(self) -> None:
+        """
+        Fill the window, from the consumer or from a query callback. Only one
+        thread fills it at a time: callbacks which run meanwhile, such as
+        those of cache hits, which run from query() itself, leave it to the
+        loop which is running, which checks the window again after each
+        query.
+        """
+        with self._lock:
+            if self._submitting:
+                return
+            self._submitting = True
+        while True:
+            with self._lock:
+                if self._exhausted or self._in_flight >= self._max_in_flight or self._buffered >= self._max_in_flight:
+                    self._submitting = False
+                    return
+                try:
+                    name, qtype = next(self._queries)
+                except StopIteration:
+                    self._exhausted = True
+                    self._submitting = False
+                    return
+                except BaseException as e:
+                    self._exhausted = True
+                    self._error = e
+                    self._submitting = False
+                    return
+                self._in_flight += 1
+
+            try:
+                self._channel.query(name, qtype, callback=functools.partial(self._on_result, name), **self._query_kwargs)
+            except AresError:
+                # c-ares ran the callback with the error already
+                pass
+            except BaseException as e:
+                with self._lock:
+                    self._in_flight -= 1
+                    self._exhausted = True
+                    self._error = e
+                    self._submitting = False
+                return
+
+    def _on_result(self, name: Union[str, bytes], result: Any, errorno: Optional[int], *info: "QueryInfo") -> None:
+        # The QueryInfo of channels with query_info isn't part of the stream
+        with self._lock:
+            self._in_flight -= 1
+            if self._closed:
+                return
+            self._buffered += 1
+            self._results.put((name, result, errorno))
+        self._submit()
+
+
+class PreparedQuery:
+    """
+    DNS query which is built once and can be submitted any number of times
+    with Channel.send().
+    """
+
+    def __init__(self, name: Union[str, bytes], query_type: int, *, query_class: int = QUERY_CLASS_IN, recursion_desired: bool = True) -> None:
+        # Initialize _dnsrec to None first to ensure __del__ doesn't fail
+        self._dnsrec = None
+
+        if query_type not in Channel.__qtypes__:
+            raise ValueError('invalid query type specified')
+
+        if query_class not in Channel.__qclasses__:
+            raise ValueError('invalid query class specified')
+
+        self._dnsrec = _create_query_dnsrec(name, query_type, query_class, recursion_desired)
+        self.name = name
+        self.query_type = query_type
+        self.query_class = query_class
+
+    def __del__(self) -> None:
+        if self._dnsrec is not None:
+            dnsrec, self._dnsrec = self._dnsrec, None
+            _lib.ares_dns_record_destroy(dnsrec)
+
+    def __repr__(self) -> str:
+        return f"PreparedQuery(name={self.name!r}, query_type={self.query_type}, query_class={self.query_class})"
+
+
 # DNS query result types - New dataclass-based API
 #
 
-@dataclass
+# Result objects are kept around in large numbers (e.g. in caches), so they
+# use slots where available to avoid a per-instance __dict__.
+_DATACLASS_OPTIONS = {'slots': True} if sys.version_info >= (3, 10) else {}
+
+@dataclass(**_DATACLASS_OPTIONS)
 class ARecordData:
     """Data for A (IPv4 address) record"""
     addr: str
 
-@dataclass
+@dataclass(**_DATACLASS_OPTIONS)
 class AAAARecordData:
     """Data for AAAA (IPv6 address) record"""
     addr: str
 
-@dataclass
+@dataclass(**_DATACLASS_OPTIONS)
 class MXRecordData:
     """Data for MX (mail exchange) record"""
     priority: int
     exchange: str
 
-@dataclass
+@dataclass(**_DATACLASS_OPTIONS)
 class TXTRecordData:
     """Data for TXT (text) record"""
     data: bytes
 
-@dataclass
+@dataclass(**_DATACLASS_OPTIONS)
 class CAARecordData:
     """Data for CAA (certification authority authorization) record"""
     critical: int
     tag: str
     value: str
 
-@dataclass
+@dataclass(**_DATACLASS_OPTIONS)
 class CNAMERecordData:
     """Data for CNAME (canonical name) record"""
     cname: str
 
-@dataclass
+@dataclass(**_DATACLASS_OPTIONS)
 class NAPTRRecordData:
     """Data for NAPTR (naming authority pointer) record"""
     order: int
@@ -971,17 +3468,17 @@ class NAPTRRecordData:
     regexp: str
     replacement: str
 
-@dataclass
+@dataclass(**_DATACLASS_OPTIONS)
 class NSRecordData:
     """Data for NS (name server) record"""
     nsdname: str
 
-@dataclass
+@dataclass(**_DATACLASS_OPTIONS)
 class PTRRecordData:
     """Data for PTR (pointer) record"""
     dname: str
 
-@dataclass
+@dataclass(**_DATACLASS_OPTIONS)
 class SOARecordData:
     """Data for SOA (start of authority) record"""
     mname: str
@@ -992,7 +3489,7 @@ class SOARecordData:
     expire: int
     minimum: int
 
-@dataclass
+@dataclass(**_DATACLASS_OPTIONS)
 class SRVRecordData:
     """Data for SRV (service) record"""
     priority: int
@@ -1000,7 +3497,7 @@ class SRVRecordData:
     port: int
     target: str
 
-@dataclass
+@dataclass(**_DATACLASS_OPTIONS)
 class TLSARecordData:
     """Data for TLSA (DANE TLS authentication) record - RFC 6698"""
     cert_usage: int
@@ -1008,21 +3505,21 @@ class TLSARecordData:
     matching_type: int
     cert_association_data: bytes
 
-@dataclass
+@dataclass(**_DATACLASS_OPTIONS)
 class HTTPSRecordData:
     """Data for HTTPS (service binding) record - RFC 9460"""
     priority: int
     target: str
     params: list  # List of (key: int, value: bytes) tuples
 
-@dataclass
+@dataclass(**_DATACLASS_OPTIONS)
 class URIRecordData:
     """Data for URI (Uniform Resource Identifier) record - RFC 7553"""
     priority: int
     weight: int
     target: str
 
-@dataclass
+@dataclass(**_DATACLASS_OPTIONS)
 class DNSRecord:
     """Represents a single DNS resource record"""
     name: str
@@ -1034,30 +3531,211 @@ class DNSRecord:
                 NSRecordData, PTRRecordData, SOARecordData, SRVRecordData,
                 TLSARecordData, URIRecordData]
 
-@dataclass
+@dataclass(**_DATACLASS_OPTIONS)
 class DNSResult:
     """Represents a complete DNS query result with all sections"""
     answer: list[DNSRecord]
     authority: list[DNSRecord]
     additional: list[DNSRecord]
 
+    def _get_records(self, section):
+        if section == SECTION_ANSWER:
+            return self.answer
+        if section == SECTION_AUTHORITY:
+            return self.authority
+        if section == SECTION_ADDITIONAL:
+            return self.additional
+        raise ValueError('invalid section specified')
+
+    def export_addresses(self, family: int = socket.AF_INET, section: int = SECTION_ANSWER) -> tuple:
+        """
+        Export the addresses of the A (socket.AF_INET) or AAAA (socket.AF_INET6)
+        records in a section as contiguous arrays.
+
+        Returns an (addresses, ttls) tuple. IPv4 addresses are an array('I') of integers
+        (like ADDRESS_FORMAT_INT), IPv6 addresses a bytearray of 16 byte packed values,
+        ttls an array('I') with the TTL of each address. All of them support the buffer
+        protocol, e.g. numpy.frombuffer() can wrap them without a copy.
+        """
+        _check_address_family(family)
+        rec_type = _lib.ARES_REC_TYPE_A if family == socket.AF_INET else _lib.ARES_REC_TYPE_AAAA
+        return _export_packed_addresses(family, (
+            (_pack_address(record.data.addr, family), record.ttl)
+            for record in self._get_records(section) if record.type == rec_type
+        ))
+
+
+class _LazyRecordList(Sequence):
+    """Read-only list of the records in a section of a LazyDNSResult, parsed on access"""
+
+    __slots__ = ('_result', '_section', '_extractors', '_indexes', '_records')
+
+    def __init__(self, result: "LazyDNSResult", section: int) -> None:
+        dnsrec = result._get_dnsrec()
+        self._result = result
+        self._section = section
+        self._extractors = _get_extractors(result._address_format)
+        # Only the record types are looked at here, to skip unsupported ones
+        self._indexes = []
+        for i in range(_lib.ares_dns_record_rr_cnt(dnsrec, section)):
+            rr = _lib.ares_dns_record_rr_get_const(dnsrec, section, i)
+            if rr != _ffi.NULL and _lib.ares_dns_rr_get_type(rr) in self._extractors:
+                self._indexes.append(i)
+        self._records: list[Optional[DNSRecord]] = [None] * len(self._indexes)
+
+    def __len__(self) -> int:
+        return len(self._indexes)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+
+        record = self._records[index]
+        if record is None:
+            rr = _lib.ares_dns_record_rr_get_const(self._result._get_dnsrec(), self._section, self._indexes[index])
+            info = _ffi.new("pycares_rr_t *")
+            _lib.pycares_rr_fill(rr, info, _fill_flags(self._result._address_format))
+            record = self._records[index] = _parse_rr(info, self._extractors[info.type])
+        return record
+
+    def __eq__(self, other):
+        if isinstance(other, (list, _LazyRecordList)):
+            return list(self) == list(other)
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return repr(list(self))
+
+
+class LazyDNSResult(DNSResult):
+    """
+    DNSResult which keeps its own copy of the c-ares DNS record and only
+    creates the DNSRecord objects when they are accessed.
+
+    The copy is freed when the result is garbage collected, or right away
+    by calling release() (or using the result as a context manager).
+    """
+
+    __slots__ = ('_dnsrec', '_sections', '_address_format', '_answer', '_authority', '_additional')
+
+    def __init__(self, dnsrec, sections: Optional[Iterable[int]] = None, address_format: int = ADDRESS_FORMAT_TEXT) -> None:
+        # Takes ownership of dnsrec
+        self._dnsrec = dnsrec
+        self._sections = _ALL_SECTIONS if sections is None else sections
+        self._address_format = address_format
+        self._answer = None
+        self._authority = None
+        self._additional = None
+
+    def __del__(self) -> None:
+        self.release()
+
+    def __enter__(self) -> "LazyDNSResult":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.release()
+
+    def _get_dnsrec(self):
+        if self._dnsrec is None:
+            raise RuntimeError('result was released')
+        return self._dnsrec
+
+    def _get_section(self, section):
+        if section not in self._sections:
+            return []
+        return _LazyRecordList(self, section)
+
+    @property
+    def answer(self) -> Sequence[DNSRecord]:
+        if self._answer is None:
+            self._answer = self._get_section(SECTION_ANSWER)
+        return self._answer
+
+    @property
+    def authority(self) -> Sequence[DNSRecord]:
+        if self._authority is None:
+            self._authority = self._get_section(SECTION_AUTHORITY)
+        return self._authority
+
+    @property
+    def additional(self) -> Sequence[DNSRecord]:
+        if self._additional is None:
+            self._additional = self._get_section(SECTION_ADDITIONAL)
+        return self._additional
+
+    def export_addresses(self, family: int = socket.AF_INET, section: int = SECTION_ANSWER) -> tuple:
+        """
+        Export the addresses in a section as arrays, see DNSResult.export_addresses().
+        They are read straight from the DNS record, no DNSRecord objects are created.
+        """
+        _check_address_family(family)
+        if section not in _ALL_SECTIONS:
+            raise ValueError('invalid section specified')
+        if section not in self._sections:
+            return _address_arrays(family, bytearray(), bytearray())
+
+        addrs = bytearray()
+        ttls = bytearray()
+        _fill_addresses(self._get_dnsrec(), section, family, addrs, ttls)
+        return _address_arrays(family, addrs, ttls)
+
+    def to_wire(self) -> bytes:
+        """Get the response as a DNS message in wire format"""
+        data, status = parse_dnsrec_raw(self._get_dnsrec())
+        if status is not None:
+            raise AresError(status, errno.strerror(status))
+        return data
+
+    def release(self) -> None:
+        """
+        Free the c-ares DNS record. Records which were already accessed remain
+        valid, accessing any other one raises RuntimeError.
+        """
+        if self._dnsrec is not None:
+            dnsrec, self._dnsrec = self._dnsrec, None
+            _lib.ares_dns_record_destroy(dnsrec)
+
+
+# Response cache introspection
+
+@dataclass(**_DATACLASS_OPTIONS)
+class CacheEntryInfo:
+    """Entry of the response cache, from Channel.cache_entries()"""
+    name: str
+    query_type: Optional[int]  # None for getaddrinfo() results
+    query_class: Optional[int]
+    ttl: float  # Remaining TTL in seconds, negative when stale
+    errorno: Optional[int]  # Error of negative answers
+    hits: int
+    size: int  # Size of the response in wire format
+    result: Any
+
+# Query outcome
+
+@dataclass(**_DATACLASS_OPTIONS)
+class QueryInfo:
+    """Outcome of a query, for the callbacks of channels created with query_info"""
+    timeouts: int  # Number of times a server didn't answer in time
+    latency: float  # Seconds from the submission of the query to its callback
+    cached: bool  # Answered by the response cache (no timeouts, latency 0)
 
 # Host/AddrInfo result types
 
-@dataclass
+@dataclass(**_DATACLASS_OPTIONS)
 class HostResult:
     """Result from gethostbyaddr() operation"""
     name: str
     aliases: list[str]
     addresses: list[str]
 
-@dataclass
+@dataclass(**_DATACLASS_OPTIONS)
 class NameInfoResult:
     """Result from getnameinfo() operation"""
     node: str
     service: Optional[str]
 
-@dataclass
+@dataclass(**_DATACLASS_OPTIONS)
 class AddrInfoNode:
     """Single address node from getaddrinfo() result"""
     ttl: int
@@ -1067,19 +3745,30 @@ class AddrInfoNode:
     protocol: int
     addr: tuple  # (ip, port) or (ip, port, flowinfo, scope_id)
 
-@dataclass
+@dataclass(**_DATACLASS_OPTIONS)
 class AddrInfoCname:
     """CNAME information from getaddrinfo() result"""
     ttl: int
     alias: str
     name: str
 
-@dataclass
+@dataclass(**_DATACLASS_OPTIONS)
 class AddrInfoResult:
     """Complete result from getaddrinfo() operation"""
     cnames: list[AddrInfoCname]
     nodes: list[AddrInfoNode]
 
+    def export_addresses(self, family: int = socket.AF_INET) -> tuple:
+        """
+        Export the addresses of the nodes of the given family as arrays,
+        see DNSResult.export_addresses().
+        """
+        _check_address_family(family)
+        return _export_packed_addresses(family, (
+            (_pack_address(node.addr[0], family), node.ttl)
+            for node in self.nodes if node.family == family
+        ))
+
 
 # Parser functions for Host/AddrInfo results
 
@@ -1111,7 +3800,7 @@ def parse_nameinfo(node, service) -> NameInfoResult:
     return NameInfoResult(node=node_str, service=service_str)
 
 
-def parse_addrinfo_node(ares_node) -> AddrInfoNode:
+def parse_addrinfo_node(ares_node, address_format: int = ADDRESS_FORMAT_TEXT) -> AddrInfoNode:
     """Parse a single c-ares addrinfo node into AddrInfoNode"""
     ttl = ares_node.ai_ttl
     flags = ares_node.ai_flags
@@ -1120,6 +3809,23 @@ def parse_addrinfo_node(ares_node) -> AddrInfoNode:
 
     addr_struct = ares_node.ai_addr
     assert addr_struct.sa_family == ares_node.ai_family
+
+    if address_format != ADDRESS_FORMAT_TEXT:
+        # Skip the conversion to text, the packed address is in the sockaddr
+        if addr_struct.sa_family == socket.AF_INET:
+            family = socket.AF_INET
+            s = _ffi.cast("struct sockaddr_in*", addr_struct)
+            packed = _ffi.buffer(_ffi.addressof(s.sin_addr), 4)[:]
+            addr = (_format_address(packed, address_format), socket.ntohs(s.sin_port))
+        elif addr_struct.sa_family == socket.AF_INET6:
+            family = socket.AF_INET6
+            s = _ffi.cast("struct sockaddr_in6*", addr_struct)
+            packed = _ffi.buffer(_ffi.addressof(s.sin6_addr), 16)[:]
+            addr = (_format_address(packed, address_format), socket.ntohs(s.sin6_port), s.sin6_flowinfo, s.sin6_scope_id)
+        else:
+            raise ValueError("invalid sockaddr family")
+        return AddrInfoNode(ttl=ttl, flags=flags, family=family, socktype=socktype, protocol=protocol, addr=addr)
+
     ip = _ffi.new("char []", _lib.INET6_ADDRSTRLEN)
 
     if addr_struct.sa_family == socket.AF_INET:
@@ -1153,7 +3859,7 @@ def parse_addrinfo_cname(ares_cname) -> AddrInfoCname:
     )
 
 
-def parse_addrinfo(ares_addrinfo) -> AddrInfoResult:
+def parse_addrinfo(ares_addrinfo, address_format: int = ADDRESS_FORMAT_TEXT) -> AddrInfoResult:
     """Parse c-ares addrinfo structure into AddrInfoResult"""
     cnames = []
     nodes = []
@@ -1165,7 +3871,7 @@ def parse_addrinfo(ares_addrinfo) -> AddrInfoResult:
 
     node_ptr = ares_addrinfo.nodes
     while node_ptr != _ffi.NULL:
-        nodes.append(parse_addrinfo_node(node_ptr))
+        nodes.append(parse_addrinfo_node(node_ptr, address_format))
         node_ptr = node_ptr.ai_next
 
     _lib.ares_freeaddrinfo(ares_addrinfo)
@@ -1230,15 +3936,34 @@ __all__ = (
     "QUERY_CLASS_NONE",
     "QUERY_CLASS_ANY",
 
+    # Result sections
+    "SECTION_ANSWER",
+    "SECTION_AUTHORITY",
+    "SECTION_ADDITIONAL",
+
+    # Address formats
+    "ADDRESS_FORMAT_TEXT",
+    "ADDRESS_FORMAT_PACKED",
+    "ADDRESS_FORMAT_INT",
+    "ADDRESS_FORMAT_IPADDRESS",
+
     # Core stuff
     "ARES_VERSION",
     "AresError",
     "Channel",
+    "PreparedQuery",
+    "QueryBatch",
     "errno",
+    "parse_wire",
+    "parse_wire_many",
+    "parse_wire_addresses",
+    "register_record_extractor",
+    "resolve_stream",
     "__version__",
 
     # DNS record result types
     "DNSResult",
+    "LazyDNSResult",
     "DNSRecord",
     "ARecordData",
     "AAAARecordData",
@@ -1261,4 +3986,10 @@ __all__ = (
     "AddrInfoResult",
     "AddrInfoNode",
     "AddrInfoCname",
+
+    # Response cache types
+    "CacheEntryInfo",
+
+    # Query outcome
+    "QueryInfo",
 )
@@ -0,0 +1,370 @@
+"""
+asyncio support for pycares.
+
+By default the sockets of the channel are watched by the event loop itself,
+through the socket state callback, and c-ares timeouts are driven by a loop
+timer armed from :meth:`pycares.Channel.timeout`. Every callback then runs on
+the loop thread.
+
+Alternatively the channel can use the c-ares event thread with a completion
+ring: the loop is woken up once per burst of completed queries through
+:meth:`pycares.Channel.completion_fd`, and the callbacks of the whole burst
+run on the loop thread, so futures are resolved in bulk instead of with one
+``call_soon_threadsafe`` per answer.
+"""
+
+import asyncio
+import collections
+import functools
+from collections.abc import AsyncIterator, Iterable
+from typing import Any, Optional, Union
+
+from . import (
+    ARES_SOCKET_BAD,
+    IP4,
+    IP6,
+    AresError,
+    Channel,
+    PreparedQuery,
+    QueryBatch,
+    QUERY_CLASS_IN,
+    errno,
+)
+
+__all__ = ('DNSResolver', 'resolve_stream')
+
+
+class DNSResolver:
+    """
+    Asynchronous resolver for asyncio. Every query method returns an awaitable
+    future with the result of the query, or which raises AresError.
+
+    The event loop must support add_reader() and add_writer(), which the
+    Windows proactor loop doesn't. uvloop is supported.
+    """
+
+    def __init__(self,
+                 *,
+                 loop: Optional[asyncio.AbstractEventLoop] = None,
+                 event_thread: bool = False,
+                 completion_ring: int = 16384,
+                 **kwargs: Any) -> None:
+        """
+        Args:
+            loop: Event loop to use, the running loop if None
+            event_thread: Use the c-ares event thread instead of watching the
+                sockets from the loop
+            completion_ring: Size of the completion ring of the channel, only
+                with event_thread
+            **kwargs: Any other argument supported by pycares.Channel, except
+                query_info (the counters of channel.query_stats() are kept)
+        """
+        if kwargs.get('query_info'):
+            raise ValueError('query_info is not supported, use channel.query_stats()')
+        self._loop = loop if loop is not None else asyncio.get_running_loop()
+        if isinstance(self._loop, getattr(asyncio, 'ProactorEventLoop', ())):
+            raise RuntimeError('the proactor event loop does not support add_reader(), use asyncio.SelectorEventLoop')
+        self._closed = False
+        self._event_thread = event_thread
+        # Sockets watched by the loop, fd -> (readable, writable)
+        self._fds: dict = {}
+        # uvloop doesn't give the handles of timers which are due already a
+        # when() method, so the deadline is kept aside
+        self._timer: Optional[asyncio.Handle] = None
+        self._timer_when = 0.0
+        self._pending = 0
+
+        if event_thread:
+            self._channel = Channel(completion_ring=completion_ring, **kwargs)
+            self._completion_fd = self._channel.completion_fd()
+            self._loop.add_reader(self._completion_fd, self._process_completions)
+        else:
+            self._channel = Channel(sock_state_cb=self._sock_state_cb, **kwargs)
+            self._completion_fd = None
+
+    @property
+    def channel(self) -> Channel:
+        """The underlying pycares.Channel"""
+        return self._channel
+
+    def _process_completions(self) -> None:
+        self._channel.process_completions()
+
+    def _sock_state_cb(self, fd: int, readable: bool, writable: bool) -> None:
+        if self._closed:
+            # Sockets closed while the channel is destroyed, on the shutdown thread
+            return
+
+        was_readable, was_writable = self._fds.get(fd, (False, False))
+        if readable != was_readable:
+            if readable:
+                self._loop.add_reader(fd, self._process_read, fd)
+            else:
+                self._loop.remove_reader(fd)
+        if writable != was_writable:
+            if writable:
+                self._loop.add_writer(fd, self._process_write, fd)
+            else:
+                self._loop.remove_writer(fd)
+
+        if readable or writable:
+            self._fds[fd] = (readable, writable)
+        else:
+            self._fds.pop(fd, None)
+
+    def _process_read(self, fd: int) -> None:
+        self._channel.process_fd(fd, ARES_SOCKET_BAD)
+        self._update_timer()
+
+    def _process_write(self, fd: int) -> None:
+        self._channel.process_fd(ARES_SOCKET_BAD, fd)
+        self._update_timer()
+
+    def _process_timeouts(self) -> None:
+        self._timer = None
+        self._channel.process_fd(ARES_SOCKET_BAD, ARES_SOCKET_BAD)
+        self._update_timer()
+
+    def _update_timer(self) -> None:
+        """Arm the timer for the next c-ares timeout, if it's earlier than the armed one"""
+        if not self._pending:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            return
+
+        when = self._loop.time() + self._channel.timeout()
+        if self._timer is not None:
+            if self._timer_when <= when:
+                return
+            self._timer.cancel()
+        self._timer = self._loop.call_at(when, self._process_timeouts)
+        self._timer_when = when
+
+    def _callback(self, future: asyncio.Future, result: Any, error: Optional[int]) -> None:
+        if self._closed:
+            # Queries cancelled by close() complete on the shutdown thread
+            try:
+                self._loop.call_soon_threadsafe(_set_future, future, result, error)
+            except RuntimeError:
+                # The loop is closed already
+                pass
+            return
+        self._pending -= 1
+        _set_future(future, result, error)
+
+    def _threadsafe_callback(self, future: asyncio.Future, result: Any, error: Optional[int]) -> None:
+        # Callbacks which don't go through the completion ring run on the
+        # event thread
+        try:
+            self._loop.call_soon_threadsafe(_set_future, future, result, error)
+        except RuntimeError:
+            pass
+
+    def _submit(self, method, *args, **kwargs) -> asyncio.Future:
+        if self._closed:
+            raise RuntimeError('the resolver is closed')
+        future = self._loop.create_future()
+        self._pending += 1
+        try:
+            method(*args, callback=functools.partial(self._callback, future), **kwargs)
+        except BaseException:
+            if future.done():
+                # The query failed right away, c-ares ran its callback
+                # already, which accounted for it. The error is raised
+                # instead of being left in a future nobody awaits.
+                future.exception()
+            else:
+                self._pending -= 1
+            raise
+        if not self._event_thread:
+            self._update_timer()
+        return future
+
+    def _submit_threadsafe(self, method, *args, **kwargs) -> asyncio.Future:
+        if not self._event_thread:
+            return self._submit(method, *args, **kwargs)
+        if self._closed:
+            raise RuntimeError('the resolver is closed')
+        future = self._loop.create_future()
+        method(*args, callback=functools.partial(self._threadsafe_callback, future), **kwargs)
+        return future
+
+    def query(self, name: str, query_type: int, *, query_class: int = QUERY_CLASS_IN, **kwargs: Any) -> asyncio.Future:
+        """Same as Channel.query(), see its documentation for the arguments"""
+        return self._submit(self._channel.query, name, query_type, query_class=query_class, **kwargs)
+
+    def search(self, name: str, query_type: int, *, query_class: int = QUERY_CLASS_IN, **kwargs: Any) -> asyncio.Future:
+        """Same as Channel.search(), see its documentation for the arguments"""
+        return self._submit(self._channel.search, name, query_type, query_class=query_class, **kwargs)
+
+    def send(self, query: PreparedQuery, **kwargs: Any) -> asyncio.Future:
+        """Same as Channel.send(), see its documentation for the arguments"""
+        return self._submit(self._channel.send, query, **kwargs)
+
+    def getaddrinfo(self, host: Union[str, bytes, None], port: Union[str, int, None], **kwargs: Any) -> asyncio.Future:
+        """Same as Channel.getaddrinfo(), see its documentation for the arguments"""
+        return self._submit(self._channel.getaddrinfo, host, port, **kwargs)
+
+    def _submit_batch(self, method, *args, **kwargs) -> asyncio.Future:
+        if self._closed:
+            raise RuntimeError('the resolver is closed')
+        future = self._loop.create_future()
+        self._pending += 1
+        try:
+            batch = method(*args, **kwargs)
+        except BaseException:
+            self._pending -= 1
+            raise
+        future.add_done_callback(functools.partial(_cancel_batch, batch))
+        batch.add_done_callback(functools.partial(self._batch_done, future))
+        if not self._event_thread:
+            self._update_timer()
+        return future
+
+    def _batch_done(self, future: asyncio.Future, batch: QueryBatch) -> None:
+        self._callback(future, batch.results, None)
+
+    def query_many(self, names: Iterable[Union[str, bytes]], query_type: int, *, query_class: int = QUERY_CLASS_IN, **kwargs: Any) -> asyncio.Future:
+        """
+        Same as Channel.query_many(), without callback. The future resolves
+        to the list of results, in the order of names, with an AresError for
+        each query which failed. Cancelling the future cancels the batch.
+        """
+        return self._submit_batch(self._channel.query_many, names, query_type, query_class=query_class, **kwargs)
+
+    def getaddrinfo_many(self, hosts: Iterable[Union[str, bytes]], port: Union[str, int, None] = None, **kwargs: Any) -> asyncio.Future:
+        """Same as Channel.getaddrinfo_many(), without callback, see query_many()"""
+        return self._submit_batch(self._channel.getaddrinfo_many, hosts, port, **kwargs)
+
+    def gethostbyaddr(self, addr: str) -> asyncio.Future:
+        """Same as Channel.gethostbyaddr(), see its documentation for the arguments"""
+        return self._submit_threadsafe(self._channel.gethostbyaddr, addr)
+
+    def getnameinfo(self, address: Union[IP4, IP6], flags: int) -> asyncio.Future:
+        """Same as Channel.getnameinfo(), see its documentation for the arguments"""
+        return self._submit_threadsafe(self._channel.getnameinfo, address, flags)
+
+    def cancel(self) -> None:
+        """Cancel all pending queries, their futures raise AresError(ARES_ECANCELLED)"""
+        self._channel.cancel()
+
+    def close(self) -> None:
+        """
+        Close the resolver. Pending queries are cancelled, their futures raise
+        AresError(ARES_ECANCELLED).
+        """
+        if self._closed:
+            return
+        self._closed = True
+
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        for fd in self._fds:
+            self._loop.remove_reader(fd)
+            self._loop.remove_writer(fd)
+        self._fds.clear()
+
+        if self._completion_fd is not None:
+            self._loop.remove_reader(self._completion_fd)
+            # Run the callbacks which are ready before the ring is handed over
+            self._channel.process_completions()
+
+        self._channel.close()
+
+    async def __aenter__(self) -> 'DNSResolver':
+        return self
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        self.close()
+
+
+async def resolve_stream(resolver: DNSResolver,
+                         names: Iterable[Union[str, bytes]],
+                         qtypes: Union[int, Iterable[int]],
+                         *,
+                         max_in_flight: int = 100,
+                         **kwargs: Any) -> AsyncIterator[tuple]:
+    """
+    Asynchronous version of pycares.resolve_stream(), the queries are
+    submitted with the resolver. Any other argument is passed to
+    DNSResolver.query().
+    """
+    if max_in_flight < 1:
+        raise ValueError('max_in_flight must be at least 1')
+
+    qtypes = (qtypes,) if isinstance(qtypes, int) else tuple(qtypes)
+    if not qtypes or any(qtype not in Channel.__qtypes__ for qtype in qtypes):
+        raise ValueError('invalid query type specified')
+
+    queries = ((name, qtype) for name in names for qtype in qtypes)
+    results: collections.deque = collections.deque()
+    in_flight: set = set()
+    wakeup = asyncio.Event()
+    exhausted = False
+    error: Optional[BaseException] = None
+
+    def submit() -> None:
+        # Runs on the loop thread only, from the consumer or a done callback
+        nonlocal exhausted, error
+        while not exhausted and len(in_flight) < max_in_flight and len(results) < max_in_flight:
+            try:
+                name, qtype = next(queries)
+                future = resolver.query(name, qtype, **kwargs)
+            except StopIteration:
+                exhausted = True
+            except AresError as e:
+                # The query could not be submitted, like the answers of the
+                # queries which fail
+                results.append((name, None, e.args[0]))
+                wakeup.set()
+            except BaseException as e:
+                exhausted = True
+                error = e
+            else:
+                in_flight.add(future)
+                future.add_done_callback(functools.partial(on_done, name))
+
+    def on_done(name: Union[str, bytes], future: asyncio.Future) -> None:
+        in_flight.discard(future)
+        if future.cancelled():
+            return
+        exc = future.exception()
+        if exc is None:
+            results.append((name, future.result(), None))
+        else:
+            results.append((name, None, exc.args[0]))
+        wakeup.set()
+        submit()
+
+    try:
+        while True:
+            submit()
+            while results:
+                yield results.popleft()
+                submit()
+            if exhausted and not in_flight:
+                if error is not None:
+                    raise error
+                return
+            wakeup.clear()
+            await wakeup.wait()
+    finally:
+        for future in in_flight:
+            future.cancel()
+
+
+def _cancel_batch(batch: QueryBatch, future: asyncio.Future) -> None:
+    if future.cancelled():
+        batch.cancel()
+
+
+def _set_future(future: asyncio.Future, result: Any, error: Optional[int]) -> None:
+    if future.done():
+        # Cancelled by the caller
+        return
+    if error is not None:
+        future.set_exception(AresError(error, errno.strerror(error)))
+    else:
+        future.set_result(result)
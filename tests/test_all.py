@@ -1,12 +1,15 @@
 #!/usr/bin/env python
 
+import asyncio
 import functools
 import gc
 import ipaddress
 import os
 import random
+import select
 import socket
 import string
+import struct
 import sys
 import threading
 import time
@@ -14,6 +17,12 @@ import unittest
 import weakref
 
 import pycares
+import pycares.aio
+
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
 
 FIXTURES_PATH = os.path.realpath(os.path.join(os.path.dirname(__file__), "fixtures"))
 
@@ -104,6 +113,274 @@ class DNSTest(unittest.TestCase):
         self.assertEqual(node.addr[0], b"127.0.0.1")
         self.assertEqual(node.addr[1], 80)
 
+    @unittest.skipIf(sys.platform == "win32", "skipped on Windows")
+    def test_getaddrinfo_address_format(self):
+        expected = {
+            pycares.ADDRESS_FORMAT_PACKED: b"\x7f\x00\x00\x01",
+            pycares.ADDRESS_FORMAT_INT: 0x7f000001,
+            pycares.ADDRESS_FORMAT_IPADDRESS: ipaddress.IPv4Address("127.0.0.1"),
+        }
+        for address_format, addr in expected.items():
+            self.result, self.errorno = None, None
+
+            def cb(result, errorno):
+                self.result, self.errorno = result, errorno
+
+            self.channel = pycares.Channel(address_format=address_format)
+            self.channel.getaddrinfo("localhost", "http", family=socket.AF_INET, callback=cb)
+            self.wait()
+            self.assertNoError(self.errorno)
+            self.assertEqual(self.result.nodes[0].addr, (addr, 80))
+
+    def test_channel_bad_address_format(self):
+        with self.assertRaises(ValueError):
+            pycares.Channel(address_format=42)
+
+    @unittest.skipIf(sys.platform == "win32", "skipped on Windows")
+    def test_completion_ring(self):
+        results = []
+
+        def cb(result, errorno):
+            results.append((threading.current_thread(), errorno, result.nodes[0].addr))
+
+        # Smaller than the number of queries, so some completions overflow
+        self.channel = pycares.Channel(completion_ring=2)
+        for _ in range(5):
+            self.channel.getaddrinfo("localhost", 80, family=socket.AF_INET, callback=cb)
+        self.wait()
+        self.assertEqual(results, [])
+        self.assertEqual(self.channel.pending_completions, 5)
+        self.assertEqual(self.channel.process_completions(max_completions=2), 2)
+        self.assertEqual(self.channel.process_completions(), 3)
+        self.assertEqual(self.channel.pending_completions, 0)
+        self.assertEqual(results, [(threading.current_thread(), None, (b"127.0.0.1", 80))] * 5)
+
+    def test_completion_fd(self):
+        results = []
+
+        def cb(result, errorno):
+            results.append(errorno)
+
+        self.channel = pycares.Channel(completion_ring=16)
+        fd = self.channel.completion_fd()
+        self.assertEqual(select.select([fd], [], [], 0)[0], [])
+        for _ in range(3):
+            self.channel.getaddrinfo("localhost", 80, family=socket.AF_INET, callback=cb)
+        self.wait()
+        self.assertEqual(select.select([fd], [], [], 5)[0], [fd])
+        self.assertEqual(self.channel.process_completions(), 3)
+        self.assertEqual(select.select([fd], [], [], 0)[0], [])
+        self.assertEqual(results, [None] * 3)
+
+    def test_completion_ring_submit_error(self):
+        results = []
+
+        def cb(result, errorno):
+            results.append(errorno)
+
+        self.channel = pycares.Channel(completion_ring=16, servers=["127.0.0.1"])
+        self.channel.servers = []
+        # The callback runs before the error is raised, as without a ring
+        with self.assertRaises(pycares.AresError) as cm:
+            self.channel.query("example.com", pycares.QUERY_TYPE_A, callback=cb)
+        errorno = cm.exception.args[0]
+        self.assertEqual(results, [errorno])
+        # The next query doesn't get the completion of the failed one
+        self.channel.getaddrinfo("localhost", 80, family=socket.AF_INET, callback=cb)
+        self.assertEqual(self.channel.queries_in_flight, 2)
+        self.wait()
+        self.channel.process_completions()
+        self.assertEqual(results, [errorno, None])
+        self.assertEqual(self.channel.queries_in_flight, 0)
+        self.assertEqual(self.channel.query_stats()["completed"], 2)
+
+    def test_queries_in_flight(self):
+        blackhole = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        blackhole.bind(("127.0.0.1", 0))
+        self.addCleanup(blackhole.close)
+        errors = []
+
+        def cb(result, errorno):
+            errors.append(errorno)
+
+        self.channel = pycares.Channel(servers=["127.0.0.1:%d" % blackhole.getsockname()[1]], timeout=60.0, tries=1)
+        self.assertEqual(self.channel.queries_in_flight, 0)
+        for _ in range(100):
+            self.channel.query("example.com", pycares.QUERY_TYPE_A, callback=cb)
+        self.assertEqual(self.channel.queries_in_flight, 100)
+        self.channel.cancel()
+        self.wait()
+        self.assertEqual(self.channel.queries_in_flight, 0)
+        self.assertEqual(errors, [pycares.errno.ARES_ECANCELLED] * 100)
+
+    def test_channel_alive_while_in_flight(self):
+        blackhole = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        blackhole.bind(("127.0.0.1", 0))
+        self.addCleanup(blackhole.close)
+        done = threading.Event()
+
+        def cb(result, errorno):
+            done.set()
+
+        channel = pycares.Channel(servers=["127.0.0.1:%d" % blackhole.getsockname()[1]], timeout=0.2, tries=1)
+        channel.query("example.com", pycares.QUERY_TYPE_A, callback=cb)
+        weak_ref = weakref.ref(channel)
+        del channel
+        gc.collect()
+        self.assertIsNotNone(weak_ref())
+        self.assertTrue(done.wait(5))
+        # The channel goes away once its last query is done
+        for _ in range(50):
+            gc.collect()
+            if weak_ref() is None:
+                break
+            time.sleep(0.1)
+        self.assertIsNone(weak_ref())
+
+    def test_coalesce_queries(self):
+        blackhole = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        blackhole.bind(("127.0.0.1", 0))
+        self.addCleanup(blackhole.close)
+        errors = []
+
+        def cb(result, errorno):
+            errors.append(errorno)
+
+        def bad_cb(result, errorno):
+            raise RuntimeError("error in callback")
+
+        self.channel = pycares.Channel(servers=["127.0.0.1:%d" % blackhole.getsockname()[1]], timeout=60.0, tries=1, coalesce_queries=True)
+        self.channel.query("example.com", pycares.QUERY_TYPE_A, callback=bad_cb)
+        for _ in range(9):
+            self.channel.query("EXAMPLE.com", pycares.QUERY_TYPE_A, callback=cb)
+        self.channel.query("example.com", pycares.QUERY_TYPE_AAAA, callback=cb)
+        self.channel.query("example.com", pycares.QUERY_TYPE_A, sections=[pycares.SECTION_ANSWER], callback=cb)
+        self.assertEqual(self.channel.queries_in_flight, 3)
+        self.assertEqual(self.channel.queries_coalesced, 9)
+        self.channel.cancel()
+        self.wait()
+        self.assertEqual(errors, [pycares.errno.ARES_ECANCELLED] * 11)
+        self.assertEqual(self.channel.queries_in_flight, 0)
+
+        # A new query goes to the wire once the previous one completed
+        self.channel.query("example.com", pycares.QUERY_TYPE_A, callback=cb)
+        self.assertEqual(self.channel.queries_in_flight, 1)
+        self.assertEqual(self.channel.queries_coalesced, 9)
+
+    def test_coalesce_queries_disabled(self):
+        self.assertEqual(self.channel.queries_coalesced, 0)
+
+    def test_getaddrinfo_many(self):
+        batch = self.channel.getaddrinfo_many(["localhost"] * 10, 80, family=socket.AF_INET)
+        self.assertIsInstance(batch, pycares.QueryBatch)
+        self.assertEqual(len(batch), 10)
+        self.assertTrue(batch.wait(5))
+        self.assertTrue(batch.done())
+        self.assertEqual(batch.pending, 0)
+        for result in batch.results:
+            self.assertEqual(type(result), pycares.AddrInfoResult)
+            self.assertEqual(result.nodes[0].addr, (b"127.0.0.1", 80))
+        self.assertEqual(self.channel.queries_in_flight, 0)
+
+    def test_getaddrinfo_many_callback(self):
+        results = []
+        done = []
+
+        def cb(host, result, errorno):
+            results.append((host, errorno))
+
+        batch = self.channel.getaddrinfo_many(["localhost", b"localhost"], 80, family=socket.AF_INET, callback=cb)
+        batch.add_done_callback(done.append)
+        self.assertTrue(batch.wait(5))
+        self.assertIsNone(batch.results)
+        self.assertEqual(sorted(results, key=repr), [("localhost", None), (b"localhost", None)])
+        self.assertEqual(done, [batch])
+
+    def test_query_many_cancel(self):
+        blackhole = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        blackhole.bind(("127.0.0.1", 0))
+        self.addCleanup(blackhole.close)
+        done = []
+
+        self.channel = pycares.Channel(servers=["127.0.0.1:%d" % blackhole.getsockname()[1]], timeout=60.0, tries=1)
+        names = ["%d.example.com" % i for i in range(100)]
+        batch = self.channel.query_many(names, pycares.QUERY_TYPE_A)
+        batch.add_done_callback(done.append)
+        self.assertEqual(batch.names, names)
+        self.assertEqual(batch.pending, 100)
+        self.assertEqual(self.channel.queries_in_flight, 100)
+        self.assertFalse(batch.wait(0.1))
+        self.assertEqual(batch.cancel(), 100)
+        self.assertTrue(batch.done())
+        self.assertTrue(batch.cancelled)
+        self.assertEqual(done, [batch])
+        self.assertEqual(batch.cancel(), 0)
+        for result in batch.results:
+            self.assertIsInstance(result, pycares.AresError)
+            self.assertEqual(result.args[0], pycares.errno.ARES_ECANCELLED)
+        # The queries are still in flight in c-ares, their answers are discarded
+        self.channel.cancel()
+        self.wait()
+        self.assertEqual(self.channel.queries_in_flight, 0)
+
+    def test_query_many_errors(self):
+        batch = self.channel.query_many([], pycares.QUERY_TYPE_A)
+        self.assertTrue(batch.done())
+        self.assertEqual(batch.results, [])
+        with self.assertRaises(ValueError):
+            self.channel.query_many(["example.com", "example\0.com"], pycares.QUERY_TYPE_A)
+        with self.assertRaises(ValueError):
+            self.channel.query_many(["example.com"], 667)
+        with self.assertRaises(TypeError):
+            self.channel.query_many(["example.com"], pycares.QUERY_TYPE_A, callback=1)
+        self.assertEqual(self.channel.queries_in_flight, 0)
+
+    def test_resolve_stream(self):
+        blackhole = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        blackhole.bind(("127.0.0.1", 0))
+        self.addCleanup(blackhole.close)
+        self.channel = pycares.Channel(servers=["127.0.0.1:%d" % blackhole.getsockname()[1]], timeout=0.1, tries=1)
+        names = ("%d.example.com" % i for i in range(10))
+        results = []
+        for item in pycares.resolve_stream(self.channel, names, [pycares.QUERY_TYPE_A, pycares.QUERY_TYPE_AAAA], max_in_flight=4):
+            self.assertLessEqual(self.channel.queries_in_flight, 4)
+            results.append(item)
+        self.assertEqual(len(results), 20)
+        self.assertEqual({name for name, _, _ in results}, {"%d.example.com" % i for i in range(10)})
+        for _, result, errorno in results:
+            self.assertIsNone(result)
+            self.assertEqual(errorno, pycares.errno.ARES_ETIMEOUT)
+        self.assertEqual(self.channel.queries_in_flight, 0)
+
+    def test_resolve_stream_errors(self):
+        with self.assertRaises(ValueError):
+            next(pycares.resolve_stream(self.channel, ["example.com"], pycares.QUERY_TYPE_A, max_in_flight=0))
+        with self.assertRaises(ValueError):
+            next(pycares.resolve_stream(self.channel, ["example.com"], [pycares.QUERY_TYPE_A, 667]))
+        channel = pycares.Channel(sock_state_cb=lambda *args: None)
+        with self.assertRaises(ValueError):
+            next(pycares.resolve_stream(channel, ["example.com"], pycares.QUERY_TYPE_A))
+        self.assertEqual(list(pycares.resolve_stream(self.channel, [], pycares.QUERY_TYPE_A)), [])
+
+    def test_resolve_stream_submit_error(self):
+        # Queries fail right away without servers, each name is yielded once
+        self.channel.servers = []
+        results = list(pycares.resolve_stream(self.channel, ["a.example.com", "b.example.com"], pycares.QUERY_TYPE_A))
+        self.assertEqual([name for name, _, _ in results], ["a.example.com", "b.example.com"])
+        for _, result, errorno in results:
+            self.assertIsNone(result)
+            self.assertIsNotNone(errorno)
+        self.assertEqual(self.channel.queries_in_flight, 0)
+
+    def test_completion_ring_errors(self):
+        with self.assertRaises(ValueError):
+            pycares.Channel(completion_ring=0)
+        with self.assertRaises(RuntimeError):
+            self.channel.process_completions()
+        with self.assertRaises(RuntimeError):
+            self.channel.completion_fd()
+        self.assertEqual(self.channel.pending_completions, 0)
+
     def test_getaddrinfo5(self):
         self.result, self.errorno = None, None
 
@@ -215,6 +492,91 @@ class DNSTest(unittest.TestCase):
             self.assertNotEqual(record.data.addr, None)
             self.assertGreater(record.ttl, 0)  # Real TTL values now!
 
+    def test_query_a_answer_only(self):
+        self.result, self.errorno = None, None
+
+        def cb(result, errorno):
+            self.result, self.errorno = result, errorno
+
+        self.channel.query("google.com", pycares.QUERY_TYPE_A, sections=[pycares.SECTION_ANSWER], callback=cb)
+        self.wait()
+        self.assertNoError(self.errorno)
+        self.assertEqual(type(self.result), pycares.DNSResult)
+        self.assertGreater(len(self.result.answer), 0)
+        self.assertEqual(self.result.authority, [])
+        self.assertEqual(self.result.additional, [])
+
+    def test_query_a_lazy(self):
+        self.result, self.errorno = None, None
+
+        def cb(result, errorno):
+            self.result, self.errorno = result, errorno
+
+        self.channel.query("google.com", pycares.QUERY_TYPE_A, lazy=True, callback=cb)
+        self.wait()
+        self.assertNoError(self.errorno)
+        self.assertIsInstance(self.result, pycares.LazyDNSResult)
+        self.assertIsInstance(self.result, pycares.DNSResult)
+        self.assertGreater(len(self.result.answer), 0)
+        record = self.result.answer[0]
+        self.assertEqual(type(record.data), pycares.ARecordData)
+        self.result.release()
+        self.assertIs(self.result.answer[0], record)
+        if len(self.result.answer) > 1:
+            with self.assertRaises(RuntimeError):
+                self.result.answer[1]
+
+    def test_query_a_raw(self):
+        self.result, self.errorno = None, None
+
+        def cb(result, errorno):
+            self.result, self.errorno = result, errorno
+
+        self.channel.query("google.com", pycares.QUERY_TYPE_A, raw=True, callback=cb)
+        self.wait()
+        self.assertNoError(self.errorno)
+        self.assertEqual(type(self.result), bytes)
+        # Header: QR bit set, one question and at least one answer
+        self.assertTrue(self.result[2] & 0x80)
+        self.assertEqual(int.from_bytes(self.result[4:6], "big"), 1)
+        self.assertGreater(int.from_bytes(self.result[6:8], "big"), 0)
+
+    def test_query_raw_lazy(self):
+        with self.assertRaises(ValueError):
+            self.channel.query("google.com", pycares.QUERY_TYPE_A, raw=True, lazy=True, callback=lambda *x: None)
+        self.wait()
+
+    def test_send_prepared_query(self):
+        self.results = []
+
+        def cb(result, errorno):
+            self.results.append((result, errorno))
+
+        query = pycares.PreparedQuery("google.com", pycares.QUERY_TYPE_A)
+        self.channel.send(query, callback=cb)
+        self.channel.send(query, search=True, callback=cb)
+        self.wait()
+        self.assertEqual(len(self.results), 2)
+        for result, errorno in self.results:
+            self.assertNoError(errorno)
+            self.assertEqual(type(result), pycares.DNSResult)
+            self.assertGreater(len(result.answer), 0)
+
+    def test_prepared_query_invalid(self):
+        with self.assertRaises(ValueError):
+            pycares.PreparedQuery("google.com", 667)
+        with self.assertRaises(ValueError):
+            pycares.PreparedQuery("google.com", pycares.QUERY_TYPE_A, query_class=667)
+        with self.assertRaises(TypeError):
+            self.channel.send("google.com", callback=lambda *x: None)
+
+    def test_query_bad_section(self):
+        with self.assertRaises(ValueError):
+            self.channel.query("google.com", pycares.QUERY_TYPE_A, sections=[667], callback=lambda *x: None)
+        with self.assertRaises(ValueError):
+            self.channel.search("google.com", pycares.QUERY_TYPE_A, sections=[667], callback=lambda *x: None)
+        self.wait()
+
     def test_query_a_bad(self):
         self.result, self.errorno = None, None
 
@@ -1266,5 +1628,1055 @@ class EventThreadTest(unittest.TestCase):
                 self.assertGreater(record.ttl, 0)
 
 
+class AsyncioTest(unittest.TestCase):
+    event_thread = False
+
+    def run_async(self, coro):
+        # Not asyncio.run(), the default loop of Windows is the proactor one
+        loop = asyncio.SelectorEventLoop()
+        try:
+            return loop.run_until_complete(coro)
+        finally:
+            loop.run_until_complete(loop.shutdown_asyncgens())
+            loop.close()
+
+    def resolver(self, **kwargs):
+        return pycares.aio.DNSResolver(event_thread=self.event_thread, **kwargs)
+
+    def blackhole(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.bind(("127.0.0.1", 0))
+        self.addCleanup(sock.close)
+        return "127.0.0.1:%d" % sock.getsockname()[1]
+
+    def test_getaddrinfo(self):
+        async def main():
+            async with self.resolver() as resolver:
+                return await asyncio.gather(*[
+                    resolver.getaddrinfo("localhost", 80, family=socket.AF_INET) for _ in range(10)
+                ])
+
+        results = self.run_async(main())
+        self.assertEqual(len(results), 10)
+        for result in results:
+            self.assertEqual(type(result), pycares.AddrInfoResult)
+            self.assertEqual(result.nodes[0].addr, (b"127.0.0.1", 80))
+
+    def test_submit_error(self):
+        async def main():
+            async with self.resolver() as resolver:
+                # Queries fail right away without servers
+                resolver.channel.servers = []
+                with self.assertRaises(pycares.AresError):
+                    resolver.query("example.com", pycares.QUERY_TYPE_A)
+                self.assertEqual(resolver._pending, 0)
+                # The next query doesn't get the completion of the failed one
+                result = await resolver.getaddrinfo("localhost", 80, family=socket.AF_INET)
+                self.assertEqual(result.nodes[0].addr, (b"127.0.0.1", 80))
+                self.assertEqual(resolver._pending, 0)
+                return [item async for item in pycares.aio.resolve_stream(resolver, ["a.example.com", "b.example.com"], pycares.QUERY_TYPE_A)]
+
+        results = self.run_async(main())
+        self.assertEqual([name for name, _, _ in results], ["a.example.com", "b.example.com"])
+        for _, result, errorno in results:
+            self.assertIsNone(result)
+            self.assertIsNotNone(errorno)
+
+    @unittest.skipUnless(sys.platform == "win32", "Windows only")
+    def test_proactor_loop(self):
+        loop = asyncio.ProactorEventLoop()
+        self.addCleanup(loop.close)
+        with self.assertRaises(RuntimeError):
+            pycares.aio.DNSResolver(loop=loop, event_thread=self.event_thread)
+
+    @unittest.skipIf(sys.platform == "win32", "skipped on Windows")
+    def test_gethostbyaddr(self):
+        async def main():
+            async with self.resolver() as resolver:
+                return await resolver.gethostbyaddr("127.0.0.1")
+
+        result = self.run_async(main())
+        self.assertEqual(type(result), pycares.HostResult)
+        self.assertIn("127.0.0.1", result.addresses)
+
+    @unittest.skipIf(sys.platform == "win32", "skipped on Windows")
+    def test_getnameinfo(self):
+        async def main():
+            async with self.resolver() as resolver:
+                return await resolver.getnameinfo(("127.0.0.1", 80), pycares.ARES_NI_LOOKUPHOST | pycares.ARES_NI_LOOKUPSERVICE)
+
+        result = self.run_async(main())
+        self.assertEqual(type(result), pycares.NameInfoResult)
+        self.assertEqual(result.service, "http")
+
+    def test_timeout(self):
+        server = self.blackhole()
+
+        async def main():
+            async with self.resolver(servers=[server], timeout=0.1, tries=1) as resolver:
+                await resolver.query("example.com", pycares.QUERY_TYPE_A)
+
+        with self.assertRaises(pycares.AresError) as cm:
+            self.run_async(main())
+        self.assertEqual(cm.exception.args[0], pycares.errno.ARES_ETIMEOUT)
+
+    def test_cancel(self):
+        server = self.blackhole()
+
+        async def main():
+            async with self.resolver(servers=[server], timeout=60.0) as resolver:
+                future = resolver.query("example.com", pycares.QUERY_TYPE_A)
+                resolver.cancel()
+                await future
+
+        with self.assertRaises(pycares.AresError) as cm:
+            self.run_async(main())
+        self.assertEqual(cm.exception.args[0], pycares.errno.ARES_ECANCELLED)
+
+    def test_getaddrinfo_many(self):
+        async def main():
+            async with self.resolver() as resolver:
+                return await resolver.getaddrinfo_many(["localhost"] * 10, 80, family=socket.AF_INET)
+
+        results = self.run_async(main())
+        self.assertEqual(len(results), 10)
+        for result in results:
+            self.assertEqual(result.nodes[0].addr, (b"127.0.0.1", 80))
+
+    def test_query_many_cancel(self):
+        server = self.blackhole()
+
+        async def main():
+            async with self.resolver(servers=[server], timeout=60.0) as resolver:
+                future = resolver.query_many(["example.com", "example.org"], pycares.QUERY_TYPE_A)
+                await asyncio.sleep(0)
+                future.cancel()
+                with self.assertRaises(asyncio.CancelledError):
+                    await future
+
+        self.run_async(main())
+
+    def test_resolve_stream(self):
+        server = self.blackhole()
+
+        async def main():
+            async with self.resolver(servers=[server], timeout=0.1, tries=1) as resolver:
+                names = ("%d.example.com" % i for i in range(10))
+                results = []
+                async for item in pycares.aio.resolve_stream(resolver, names, pycares.QUERY_TYPE_A, max_in_flight=4):
+                    self.assertLessEqual(resolver.channel.queries_in_flight, 4)
+                    results.append(item)
+                return results
+
+        results = self.run_async(main())
+        self.assertEqual(sorted(name for name, _, _ in results), sorted("%d.example.com" % i for i in range(10)))
+        for _, result, errorno in results:
+            self.assertIsNone(result)
+            self.assertEqual(errorno, pycares.errno.ARES_ETIMEOUT)
+
+    def test_closed(self):
+        async def main():
+            resolver = self.resolver()
+            resolver.close()
+            resolver.close()
+            resolver.getaddrinfo("localhost", 80)
+
+        with self.assertRaises(RuntimeError):
+            self.run_async(main())
+
+
+class AsyncioEventThreadTest(AsyncioTest):
+    event_thread = True
+
+
+@unittest.skipIf(uvloop is None, "uvloop is not installed")
+class UvloopTest(AsyncioTest):
+    def run_async(self, coro):
+        return uvloop.run(coro)
+
+
+class RecordExtractorTest(unittest.TestCase):
+    def test_unsupported_type(self):
+        with self.assertRaises(ValueError):
+            pycares.extract_record_data(None, 667)
+
+    def test_register_extractor(self):
+        pycares.register_record_extractor(667, lambda rr: "custom")
+        try:
+            self.assertEqual(pycares.extract_record_data(None, 667), "custom")
+        finally:
+            del pycares._record_extractors[667]
+
+    def test_register_extractor_not_callable(self):
+        with self.assertRaises(TypeError):
+            pycares.register_record_extractor(667, None)
+
+    def test_failing_extractor(self):
+        def extractor(info):
+            raise RuntimeError("broken extractor")
+
+        server = LocalDNSServer({"example.com": (["192.0.2.1"], 300)})
+        self.addCleanup(server.close)
+        original = pycares._record_extractors[pycares.QUERY_TYPE_A]
+        pycares.register_record_extractor(pycares.QUERY_TYPE_A, extractor)
+        self.addCleanup(pycares.register_record_extractor, pycares.QUERY_TYPE_A, original)
+        # The query fails instead of never calling its callback
+        completion_rings = (None,) if sys.platform == "win32" else (None, 16)
+        for completion_ring in completion_rings:
+            channel = pycares.Channel(servers=[server.address], timeout=5.0, tries=1, completion_ring=completion_ring)
+            self.addCleanup(channel.close)
+            results = []
+            channel.query("example.com", pycares.QUERY_TYPE_A, callback=lambda *args: results.append(args))
+            for _ in range(50):
+                if results:
+                    break
+                if completion_ring is None:
+                    time.sleep(0.1)
+                else:
+                    select.select([channel.completion_fd()], [], [], 0.1)
+                    channel.process_completions()
+            self.assertEqual(results, [(None, pycares.errno.ARES_EBADRESP)])
+
+
+class ResultTypesTest(unittest.TestCase):
+    @unittest.skipIf(sys.version_info < (3, 10), "slotted dataclasses require Python >= 3.10")
+    def test_no_instance_dict(self):
+        data = pycares.ARecordData(addr="192.0.2.1")
+        record = pycares.DNSRecord(name="example.com", type=pycares.QUERY_TYPE_A, record_class=pycares.QUERY_CLASS_IN, ttl=300, data=data)
+        result = pycares.DNSResult(answer=[record], authority=[], additional=[])
+        node = pycares.AddrInfoNode(ttl=300, flags=0, family=socket.AF_INET, socktype=0, protocol=0, addr=(b"192.0.2.1", 80))
+        for obj in (data, record, result, node):
+            self.assertFalse(hasattr(obj, "__dict__"))
+        self.assertEqual(record.data.addr, "192.0.2.1")
+
+    def test_addrinfo_export_addresses(self):
+        nodes = [
+            pycares.AddrInfoNode(ttl=60, flags=0, family=socket.AF_INET6, socktype=0, protocol=0, addr=(b"2001:db8::1", 80, 0, 0)),
+            pycares.AddrInfoNode(ttl=30, flags=0, family=socket.AF_INET, socktype=0, protocol=0, addr=(b"192.0.2.1", 80)),
+            pycares.AddrInfoNode(ttl=30, flags=0, family=socket.AF_INET, socktype=0, protocol=0, addr=(0xc0000202, 80)),
+        ]
+        result = pycares.AddrInfoResult(cnames=[], nodes=nodes)
+        addrs, ttls = result.export_addresses()
+        self.assertEqual(list(addrs), [0xc0000201, 0xc0000202])
+        self.assertEqual(list(ttls), [30, 30])
+        addrs, ttls = result.export_addresses(socket.AF_INET6)
+        self.assertEqual(bytes(addrs), socket.inet_pton(socket.AF_INET6, "2001:db8::1"))
+        self.assertEqual(list(ttls), [60])
+
+
+def build_a_response(name, addrs, qid=0x1234):
+    """Build a DNS response in wire format with an A record per address."""
+    qname = b"".join(bytes([len(label)]) + label.encode("ascii") for label in name.split(".")) + b"\x00"
+    msg = struct.pack("!6H", qid, 0x8180, 1, len(addrs), 0, 0) + qname + struct.pack("!HH", 1, 1)
+    for addr in addrs:
+        msg += qname + struct.pack("!HHIH", 1, 1, 300, 4) + socket.inet_aton(addr)
+    return msg
+
+
+class LocalDNSServer:
+    """
+    UDP DNS server on localhost which answers A queries for the names in
+    records, a {name: (addresses, ttl)} dict, and NXDOMAIN otherwise. Other
+    query types get no answers. Negative answers have a SOA record with the
+    (ttl, minimum) in soa, if it's set. The first drop queries get no
+    answer.
+    """
+
+    def __init__(self, records, soa=None):
+        self.records = records
+        self.soa = soa
+        self.queries = 0
+        self.drop = 0
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(("127.0.0.1", 0))
+        self.address = "127.0.0.1:%d" % self.sock.getsockname()[1]
+        self.thread = threading.Thread(target=self.serve, daemon=True)
+        self.thread.start()
+
+    def close(self):
+        self.sock.close()
+
+    def reply(self, query):
+        end = 12
+        labels = []
+        while query[end]:
+            labels.append(query[end + 1:end + 1 + query[end]].decode("ascii").lower())
+            end += query[end] + 1
+        question = query[12:end + 5]
+        qtype = struct.unpack("!H", query[end + 1:end + 3])[0]
+        addrs, ttl = self.records.get(".".join(labels), ((), 0))
+        if qtype != pycares.QUERY_TYPE_A:
+            addrs = ()
+        rcode = 0 if ".".join(labels) in self.records else 3
+        authority = b""
+        if not addrs and self.soa is not None:
+            soa_ttl, minimum = self.soa
+            rdata = b"\x02ns\xc0\x0c\x04host\xc0\x0c" + struct.pack("!5I", 1, 3600, 600, 86400, minimum)
+            authority = b"\xc0\x0c" + struct.pack("!HHIH", 6, 1, soa_ttl, len(rdata)) + rdata
+        msg = query[:2] + struct.pack("!5H", 0x8180 | rcode, 1, len(addrs), 1 if authority else 0, 0) + question
+        for addr in addrs:
+            msg += b"\xc0\x0c" + struct.pack("!HHIH", 1, 1, ttl, 4) + socket.inet_aton(addr)
+        return msg + authority
+
+    def serve(self):
+        while True:
+            try:
+                query, addr = self.sock.recvfrom(4096)
+                self.queries += 1
+                if self.queries <= self.drop:
+                    continue
+                self.sock.sendto(self.reply(query), addr)
+            except OSError:
+                return
+
+
+class ResponseCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.server = LocalDNSServer({
+            "example.com": (["192.0.2.1", "192.0.2.2"], 300),
+            "short.example.com": (["192.0.2.3"], 1),
+            "zero.example.com": (["192.0.2.4"], 0),
+        })
+        self.channel = pycares.Channel(servers=[self.server.address], timeout=5.0, tries=1, cache_size=2, qcache_max_ttl=0)
+
+    def tearDown(self):
+        self.channel.close()
+        self.server.close()
+
+    def query(self, name, query_type=pycares.QUERY_TYPE_A, **kwargs):
+        done = threading.Event()
+        results = []
+
+        def cb(result, errorno):
+            results.append((result, errorno))
+            done.set()
+
+        self.channel.query(name, query_type, callback=cb, **kwargs)
+        self.assertTrue(done.wait(5))
+        return results[0]
+
+    def test_hit(self):
+        result, errorno = self.query("example.com")
+        self.assertIsNone(errorno)
+        self.assertEqual([r.data.addr for r in result.answer], ["192.0.2.1", "192.0.2.2"])
+        self.assertEqual(self.server.queries, 1)
+        # Hits are answered right away, on the calling thread
+        results = []
+        self.channel.query("EXAMPLE.com", pycares.QUERY_TYPE_A, callback=lambda *args: results.append(args))
+        self.assertEqual(results, [(result, None)])
+        self.assertEqual(self.server.queries, 1)
+        self.assertEqual(self.channel.cache_stats(), {
+            "hits": 1, "negative_hits": 0, "stale_hits": 0, "snapshot_hits": 0, "shared_hits": 0, "misses": 1, "evictions": 0, "rejections": 0, "prefetches": 0,
+            "refreshes": 0, "refresh_failures": 0, "size": 1, "negative_size": 0, "bytes": 0, "maxsize": 2,
+        })
+
+    def test_result_copies(self):
+        # Every callback gets its own result, changing it doesn't change the cached one
+        result, _ = self.query("example.com")
+        result.answer[0].data.addr = "192.0.2.9"
+        result.answer.clear()
+        hit, _ = self.query("example.com")
+        self.assertEqual([r.data.addr for r in hit.answer], ["192.0.2.1", "192.0.2.2"])
+        self.assertIsNot(hit, self.query("example.com")[0])
+
+        lazy, _ = self.query("example.com", lazy=True)
+        with lazy:
+            self.assertEqual(len(lazy.answer), 2)
+        for _ in range(2):
+            hit, _ = self.query("example.com", lazy=True)
+            self.assertIsInstance(hit, pycares.LazyDNSResult)
+            self.assertEqual([r.data.addr for r in hit.answer], ["192.0.2.1", "192.0.2.2"])
+            hit.release()
+        self.assertEqual(self.server.queries, 2)
+
+        entry = next(e for e in self.channel.cache_entries() if not isinstance(e.result, pycares.LazyDNSResult))
+        entry.result.answer.clear()
+        self.assertEqual(len(self.query("example.com")[0].answer), 2)
+
+    def test_coalesced_copies(self):
+        self.channel.close()
+        self.channel = pycares.Channel(servers=[self.server.address], timeout=0.3, tries=2, qcache_max_ttl=0, coalesce_queries=True)
+        for lazy in (False, True):
+            # Keep the query in flight while the others join it
+            self.server.drop = self.server.queries + 1
+            done = threading.Event()
+            results = []
+
+            def cb(result, errorno):
+                results.append(result)
+                if len(results) == 3:
+                    done.set()
+
+            for _ in range(3):
+                self.channel.query("example.com", pycares.QUERY_TYPE_A, lazy=lazy, callback=cb)
+            self.assertTrue(done.wait(5))
+            self.assertEqual(self.channel.queries_coalesced, 4 if lazy else 2)
+            # A waiter releasing or changing its result doesn't affect the others
+            if lazy:
+                results[0].release()
+            else:
+                results[0].answer.clear()
+            for result in results[1:]:
+                self.assertEqual([r.data.addr for r in result.answer], ["192.0.2.1", "192.0.2.2"])
+
+    def test_parse_options(self):
+        self.query("example.com")
+        raw, errorno = self.query("example.com", raw=True)
+        self.assertIsInstance(raw, bytes)
+        self.assertEqual(self.server.queries, 2)
+        self.assertIs(self.query("example.com", raw=True)[0], raw)
+        self.assertEqual(self.server.queries, 2)
+
+    def test_expiry(self):
+        self.query("short.example.com")
+        self.query("short.example.com")
+        self.assertEqual(self.server.queries, 1)
+        time.sleep(1.1)
+        self.query("short.example.com")
+        self.assertEqual(self.server.queries, 2)
+
+    def test_not_cached(self):
+        self.query("zero.example.com")
+        result, errorno = self.query("nx.example.com")
+        self.assertEqual(errorno, pycares.errno.ARES_ENOTFOUND)
+        self.query("zero.example.com")
+        self.query("nx.example.com")
+        self.assertEqual(self.server.queries, 4)
+        self.assertEqual(self.channel.cache_stats()["size"], 0)
+
+    def test_negative(self):
+        self.server.soa = (60, 30)
+        self.assertEqual(self.query("nx.example.com"), (None, pycares.errno.ARES_ENOTFOUND))
+        self.assertEqual(self.query("example.com", query_type=pycares.QUERY_TYPE_AAAA), (None, pycares.errno.ARES_ENODATA))
+        self.assertEqual(self.server.queries, 2)
+        results = []
+        self.channel.query("nx.example.com", pycares.QUERY_TYPE_A, callback=lambda *args: results.append(args))
+        self.channel.query("example.com", pycares.QUERY_TYPE_AAAA, callback=lambda *args: results.append(args))
+        self.assertEqual(results, [(None, pycares.errno.ARES_ENOTFOUND), (None, pycares.errno.ARES_ENODATA)])
+        self.assertEqual(self.server.queries, 2)
+        stats = self.channel.cache_stats()
+        self.assertEqual(stats["negative_hits"], 2)
+        self.assertEqual(stats["hits"], 0)
+        self.assertEqual(stats["negative_size"], 2)
+
+    def test_negative_ttl(self):
+        # The TTL of the SOA record is lower than its minimum field
+        self.server.soa = (1, 300)
+        self.query("nx.example.com")
+        self.query("nx.example.com")
+        self.assertEqual(self.server.queries, 1)
+        time.sleep(1.1)
+        self.query("nx.example.com")
+        self.assertEqual(self.server.queries, 2)
+
+    def test_negative_max_ttl(self):
+        self.server.soa = (60, 30)
+        self.channel.close()
+        self.channel = pycares.Channel(servers=[self.server.address], timeout=5.0, tries=1, cache_size=2, negative_cache_max_ttl=0, qcache_max_ttl=0)
+        self.query("nx.example.com")
+        self.query("nx.example.com")
+        self.assertEqual(self.server.queries, 2)
+        self.assertEqual(self.channel.cache_stats()["negative_size"], 0)
+
+    def test_negative_completion_ring(self):
+        self.server.soa = (60, 30)
+        self.channel.close()
+        self.channel = pycares.Channel(servers=[self.server.address], timeout=5.0, tries=1, cache_size=2, qcache_max_ttl=0, completion_ring=16)
+        results = []
+        for _ in range(2):
+            self.channel.query("nx.example.com", pycares.QUERY_TYPE_A, callback=lambda *args: results.append(args))
+            while not results:
+                select.select([self.channel.completion_fd()], [], [], 5)
+                self.channel.process_completions()
+        self.assertEqual(results, [(None, pycares.errno.ARES_ENOTFOUND)] * 2)
+        self.assertEqual(self.server.queries, 1)
+
+    def new_channel(self, **kwargs):
+        self.channel.close()
+        self.channel = pycares.Channel(servers=[self.server.address], timeout=1.0, tries=1, cache_size=2, qcache_max_ttl=0, **kwargs)
+
+    def test_resolve_stream(self):
+        # Hits complete from query() itself, the window is refilled without recursing
+        self.query("example.com")
+        results = list(pycares.resolve_stream(self.channel, ["example.com"] * 2000, pycares.QUERY_TYPE_A, max_in_flight=1000))
+        self.assertEqual(len(results), 2000)
+        self.assertEqual({errorno for _, _, errorno in results}, {None})
+        self.assertEqual(self.server.queries, 1)
+
+    def wait_queries(self, count):
+        for _ in range(50):
+            if self.server.queries >= count and self.channel.queries_in_flight == 0:
+                break
+            time.sleep(0.05)
+        self.assertEqual(self.server.queries, count)
+
+    def test_serve_stale(self):
+        self.new_channel(cache_stale_ttl=60)
+        result, errorno = self.query("short.example.com")
+        time.sleep(1.1)
+        # Expired entries are served right away, with a single refresh
+        results = []
+        for _ in range(3):
+            self.channel.query("short.example.com", pycares.QUERY_TYPE_A, callback=lambda *args: results.append(args))
+        self.assertEqual(len(results), 3)
+        self.assertEqual(results[0], (result, None))
+        self.wait_queries(2)
+        stats = self.channel.cache_stats()
+        self.assertGreaterEqual(stats["stale_hits"], 1)
+        self.assertEqual(stats["stale_hits"] + stats["hits"], 3)
+        self.assertEqual(stats["refreshes"], 1)
+        # The refreshed entry is fresh again
+        refreshed, errorno = self.query("short.example.com")
+        self.assertIsNot(refreshed, result)
+        self.assertEqual(self.server.queries, 2)
+
+    def test_serve_stale_refresh_failure(self):
+        self.new_channel(cache_stale_ttl=60)
+        result, errorno = self.query("short.example.com")
+        self.server.close()
+        time.sleep(1.1)
+        self.assertEqual(self.query("short.example.com"), (result, None))
+        for _ in range(50):
+            if self.channel.cache_stats()["refresh_failures"]:
+                break
+            time.sleep(0.05)
+        # Failed refreshes are only retried after a while
+        self.assertEqual(self.query("short.example.com"), (result, None))
+        stats = self.channel.cache_stats()
+        self.assertEqual(stats["refreshes"], 1)
+        self.assertEqual(stats["refresh_failures"], 1)
+        self.assertEqual(stats["stale_hits"], 2)
+
+    def test_prefetch(self):
+        self.server.records["prefetch.example.com"] = (["192.0.2.5"], 2)
+        self.new_channel(cache_prefetch=0.9, cache_prefetch_hits=2, cache_jitter=0.0)
+        self.query("prefetch.example.com")
+        time.sleep(0.3)
+        # Only entries with enough hits are prefetched
+        self.query("prefetch.example.com")
+        self.assertEqual(self.server.queries, 1)
+        self.query("prefetch.example.com")
+        self.wait_queries(2)
+        self.assertEqual(self.channel.cache_stats()["prefetches"], 1)
+
+    def test_getaddrinfo(self):
+        done = threading.Event()
+        results = []
+
+        def cb(result, errorno):
+            results.append((result, errorno))
+            done.set()
+
+        self.channel.getaddrinfo("example.com", 80, family=socket.AF_INET, callback=cb)
+        self.assertTrue(done.wait(5))
+        result, errorno = results[0]
+        self.assertIsNone(errorno)
+        self.assertEqual([node.addr for node in result.nodes], [(b"192.0.2.1", 80), (b"192.0.2.2", 80)])
+        self.channel.getaddrinfo("example.com", 80, family=socket.AF_INET, callback=cb)
+        self.assertEqual(results[1], (result, None))
+        self.assertEqual(self.server.queries, 1)
+
+    def test_tinylfu(self):
+        for i in range(300):
+            self.server.records["host%d.example.com" % i] = (["192.0.2.1"], 300)
+        for policy, misses in (("lru", 10), ("tinylfu", 0)):
+            self.channel.close()
+            self.channel = pycares.Channel(servers=[self.server.address], timeout=1.0, tries=1, cache_size=100, cache_shards=1, cache_policy=policy, qcache_max_ttl=0)
+            self.server.queries = 0
+            hot = ["host%d.example.com" % i for i in range(10)]
+            for _ in range(10):
+                for name in hot:
+                    self.query(name)
+            # A scan of names looked up once
+            for i in range(100, 300):
+                self.query("host%d.example.com" % i)
+            queries = self.server.queries
+            for name in hot:
+                self.query(name)
+            # The scan only evicts the popular names with lru
+            self.assertEqual(self.server.queries - queries, misses)
+        # 89 names of the scan fit in the main list, one is in the window
+        self.assertEqual(self.channel.cache_stats()["rejections"], 110)
+
+    def test_shards(self):
+        self.channel.close()
+        self.channel = pycares.Channel(servers=[self.server.address], timeout=1.0, tries=1, cache_size=12, cache_shards=4, qcache_max_ttl=0)
+        self.query("example.com")
+        self.query("example.com", raw=True)
+        self.query("example.com", lazy=True)
+        self.query("example.com")
+        self.query("example.com", raw=True)
+        stats = self.channel.cache_stats()
+        self.assertEqual(stats["hits"], 2)
+        self.assertEqual(stats["size"], 3)
+        self.assertEqual(stats["maxsize"], 12)
+
+    def test_flush(self):
+        self.server.soa = (60, 30)
+        for name in ("a.example.com", "b.a.example.com", "example.org"):
+            self.server.records[name] = (["192.0.2.1"], 300)
+        self.channel.close()
+        self.channel = pycares.Channel(servers=[self.server.address], timeout=1.0, tries=1, cache_size=100, cache_shards=4, qcache_max_ttl=0)
+        for name in ("example.com", "a.example.com", "b.a.example.com", "nx.a.example.com", "example.org"):
+            self.query(name)
+        self.query("a.example.com", raw=True)
+        self.assertEqual(self.channel.cache_stats()["size"], 6)
+        self.assertEqual(self.channel.cache_flush(name="A.example.com."), 2)
+        self.assertEqual(self.channel.cache_flush(name="a.example.com"), 0)
+        self.assertEqual(self.channel.cache_flush(suffix="example.com"), 3)
+        self.assertEqual([e.name for e in self.channel.cache_entries()], ["example.org"])
+        self.query("b.a.example.com")
+        self.assertEqual(self.channel.cache_flush(), 2)
+        stats = self.channel.cache_stats()
+        self.assertEqual((stats["size"], stats["negative_size"], stats["bytes"]), (0, 0, 0))
+        with self.assertRaises(ValueError):
+            self.channel.cache_flush(name="example.com", suffix="com")
+
+    def test_flush_snapshot(self):
+        path = self.temp_path()
+        self.new_channel(cache_snapshots=True)
+        self.query("example.com")
+        self.query("short.example.com")
+        self.channel.cache_save(path)
+        self.new_channel(cache_snapshots=True)
+        self.channel.cache_load(path)
+        # Flushed entries of a snapshot are not used anymore
+        self.channel.cache_flush(suffix="short.example.com")
+        self.query("short.example.com")
+        self.query("example.com")
+        self.assertEqual(self.server.queries, 3)
+        self.assertEqual(self.channel.cache_save(path), 2)
+
+    def test_entries(self):
+        self.server.soa = (60, 30)
+        self.new_channel(cache_snapshots=True)
+        self.query("example.com")
+        self.query("example.com")
+        self.query("nx.example.com")
+        entries = sorted(self.channel.cache_entries(), key=lambda e: e.name)
+        self.assertEqual([(e.name, e.query_type, e.query_class, e.errorno, e.hits) for e in entries], [
+            ("example.com", pycares.QUERY_TYPE_A, pycares.QUERY_CLASS_IN, None, 1),
+            ("nx.example.com", pycares.QUERY_TYPE_A, pycares.QUERY_CLASS_IN, pycares.errno.ARES_ENOTFOUND, 0),
+        ])
+        self.assertTrue(290 < entries[0].ttl <= 300)
+        self.assertTrue(20 < entries[1].ttl <= 30)
+        self.assertEqual(entries[0].size, 61)
+        self.assertEqual([r.data.addr for r in entries[0].result.answer], ["192.0.2.1", "192.0.2.2"])
+        self.assertIsNone(entries[1].result)
+
+    def test_options(self):
+        for kwargs in ({"cache_stale_ttl": -1}, {"cache_prefetch": 1.0}, {"cache_jitter": -0.1}, {"negative_cache_max_ttl": -1},
+                       {"cache_shards": 0}, {"cache_shards": 11}, {"cache_policy": "lfu"}):
+            with self.assertRaises(ValueError):
+                pycares.Channel(cache_size=10, **kwargs)
+
+    def test_eviction(self):
+        self.query("example.com")
+        self.query("short.example.com")
+        self.query("example.com")
+        self.query("example.com", raw=True)
+        stats = self.channel.cache_stats()
+        self.assertEqual(stats["evictions"], 1)
+        self.assertEqual(stats["size"], 2)
+        # The least recently used entry was evicted
+        self.query("example.com")
+        self.assertEqual(self.server.queries, 3)
+        self.query("short.example.com")
+        self.assertEqual(self.server.queries, 4)
+
+    def temp_path(self):
+        path = os.path.join(os.path.dirname(__file__), "cache-%d.tmp" % os.getpid())
+        self.addCleanup(lambda: os.path.exists(path) and os.remove(path))
+        return path
+
+    def test_snapshot(self):
+        self.server.soa = (60, 30)
+        path = self.temp_path()
+        self.new_channel(cache_snapshots=True)
+        result, errorno = self.query("example.com")
+        self.assertEqual(self.channel.cache_stats()["bytes"], 61)
+        self.query("nx.example.com")
+        self.assertEqual(self.channel.cache_save(path), 2)
+        self.new_channel()
+        self.assertEqual(self.channel.cache_load(path), 2)
+        # Entries are taken from the snapshot without new queries
+        loaded, errorno = self.query("example.com")
+        self.assertIsNone(errorno)
+        self.assertEqual(loaded.answer, result.answer)
+        self.assertEqual(self.query("nx.example.com"), (None, pycares.errno.ARES_ENOTFOUND))
+        self.assertEqual(self.server.queries, 2)
+        stats = self.channel.cache_stats()
+        self.assertEqual(stats["snapshot_hits"], 2)
+        self.assertEqual(stats["hits"], 1)
+        self.assertEqual(stats["negative_hits"], 1)
+        # Entries are parsed for the options of each query
+        self.assertIsInstance(self.query("example.com", raw=True)[0], bytes)
+        self.assertEqual(self.server.queries, 2)
+
+    def test_snapshot_expiry(self):
+        path = self.temp_path()
+        self.new_channel(cache_snapshots=True)
+        self.query("example.com")
+        self.query("short.example.com")
+        self.channel.cache_save(path)
+        time.sleep(1.1)
+        self.new_channel()
+        self.channel.cache_load(path)
+        # Entries only live for the rest of their TTL
+        self.query("example.com")
+        self.assertEqual(self.server.queries, 2)
+        self.query("short.example.com")
+        self.assertEqual(self.server.queries, 3)
+        # Saving again keeps the snapshot entries which were not used
+        self.channel.close()
+        self.channel = pycares.Channel(servers=[self.server.address], timeout=1.0, tries=1, cache_size=2, qcache_max_ttl=0, cache_snapshots=True)
+        self.channel.cache_load(path)
+        self.query("short.example.com", raw=True)
+        self.assertEqual(self.channel.cache_save(path), 2)
+
+    def test_snapshot_invalid(self):
+        path = self.temp_path()
+        with open(path, "wb") as f:
+            f.write(b"not a snapshot" * 10)
+        with self.assertRaises(ValueError):
+            self.channel.cache_load(path)
+        self.query("example.com")
+        self.assertEqual(self.server.queries, 1)
+
+    def test_snapshot_corrupt(self):
+        path = self.temp_path()
+        self.new_channel(cache_snapshots=True)
+        self.query("example.com")
+        self.channel.cache_save(path)
+        # A table without free slots, lookups don't probe it forever
+        with open(path, "r+b") as f:
+            magic, version, nslots, count = struct.unpack("<8sIII", f.read(20))
+            for slot in range(nslots):
+                f.seek(20 + slot * 40)
+                f.write(struct.pack("<Q", 2))
+        self.new_channel(cache_snapshots=True)
+        self.channel.cache_load(path)
+        self.query("short.example.com")
+        self.query("example.com")
+        self.assertEqual(self.server.queries, 3)
+        self.assertEqual(self.channel.cache_save(path), 2)
+
+    def test_snapshot_disabled(self):
+        # Responses are only serialized for snapshots and the shared cache
+        self.query("example.com")
+        self.assertEqual([e.size for e in self.channel.cache_entries()], [0])
+        with self.assertRaises(RuntimeError):
+            self.channel.cache_save(self.temp_path())
+
+    @unittest.skipIf(sys.platform == "win32", "shared caches need fcntl")
+    def test_shared(self):
+        self.server.soa = (60, 30)
+        path = self.temp_path()
+        self.new_channel(shared_cache=path, shared_cache_size=16)
+        other = pycares.Channel(servers=[self.server.address], timeout=1.0, tries=1, cache_size=2, qcache_max_ttl=0, shared_cache=path)
+        self.addCleanup(other.close)
+        result, errorno = self.query("example.com")
+        self.query("nx.example.com")
+        self.assertEqual(self.server.queries, 2)
+        # Answers of one channel are hits for the others
+        results = []
+        other.query("example.com", pycares.QUERY_TYPE_A, callback=lambda *args: results.append(args))
+        other.query("nx.example.com", pycares.QUERY_TYPE_A, callback=lambda *args: results.append(args))
+        other.query("example.com", pycares.QUERY_TYPE_A, raw=True, callback=lambda *args: results.append(args))
+        self.assertEqual(results[0][0].answer, result.answer)
+        self.assertEqual(results[1], (None, pycares.errno.ARES_ENOTFOUND))
+        self.assertIsInstance(results[2][0], bytes)
+        self.assertEqual(self.server.queries, 2)
+        self.assertEqual(other.cache_stats()["shared_hits"], 3)
+        # Flushed names are removed from the shared cache too
+        self.channel.cache_flush(suffix="nx.example.com")
+        third = pycares.Channel(servers=[self.server.address], timeout=1.0, tries=1, cache_size=2, qcache_max_ttl=0, shared_cache=path)
+        self.addCleanup(third.close)
+        third.query("example.com", pycares.QUERY_TYPE_A, callback=lambda *args: results.append(args))
+        third.query("nx.example.com", pycares.QUERY_TYPE_A, callback=lambda *args: results.append(args))
+        for _ in range(50):
+            if len(results) == 5:
+                break
+            time.sleep(0.05)
+        self.assertEqual(self.server.queries, 3)
+        self.assertEqual(third.cache_stats()["shared_hits"], 1)
+
+    @unittest.skipIf(sys.platform == "win32", "shared caches need fcntl")
+    def test_shared_expired(self):
+        path = self.temp_path()
+        self.new_channel(shared_cache=path, shared_cache_size=16)
+        other = pycares.Channel(servers=[self.server.address], timeout=1.0, tries=1, cache_size=2, qcache_max_ttl=0, shared_cache=path)
+        self.addCleanup(other.close)
+        self.query("short.example.com")
+        time.sleep(1.1)
+        results = []
+        other.query("short.example.com", pycares.QUERY_TYPE_A, callback=lambda *args: results.append(args))
+        for _ in range(50):
+            if results:
+                break
+            time.sleep(0.05)
+        self.assertEqual(self.server.queries, 2)
+        # Expired entries are replaced by fresher ones of the shared cache
+        self.query("short.example.com")
+        self.assertEqual(self.server.queries, 2)
+        self.assertEqual(self.channel.cache_stats()["shared_hits"], 1)
+
+    @unittest.skipIf(sys.platform == "win32", "shared caches need fcntl")
+    def test_shared_options(self):
+        path = self.temp_path()
+        with self.assertRaises(ValueError):
+            pycares.Channel(shared_cache=path)
+        with self.assertRaises(ValueError):
+            pycares.Channel(cache_size=10, shared_cache=path, shared_cache_size=1000)
+        with open(path, "wb") as f:
+            f.write(b"not a shared cache" * 10)
+        with self.assertRaises(ValueError):
+            pycares.Channel(cache_size=10, shared_cache=path)
+
+    @unittest.skipIf(sys.platform == "win32", "shared caches need fcntl")
+    def test_failed_init(self):
+        path = self.temp_path()
+        tables = len(pycares._in_flight_tables)
+        with self.assertRaises(TypeError):
+            pycares.Channel(cache_size=10, shared_cache=path, sock_state_cb=1)
+        with self.assertRaises(ValueError):
+            pycares.Channel(cache_size=10, shared_cache=path, cache_shards=0)
+        # Channels that failed to initialize leave nothing registered
+        self.assertEqual(len(pycares._in_flight_tables), tables)
+
+    def test_no_cache(self):
+        channel = pycares.Channel()
+        self.addCleanup(channel.close)
+        with self.assertRaises(RuntimeError):
+            channel.cache_stats()
+        with self.assertRaises(RuntimeError):
+            channel.cache_save(os.devnull)
+        with self.assertRaises(RuntimeError):
+            channel.cache_flush()
+        with self.assertRaises(ValueError):
+            pycares.Channel(cache_size=0)
+
+
+class QueryInfoTest(unittest.TestCase):
+    def setUp(self):
+        self.server = LocalDNSServer({"example.com": (["192.0.2.1"], 300)})
+        self.channel = None
+
+    def tearDown(self):
+        if self.channel is not None:
+            self.channel.close()
+        self.server.close()
+
+    def new_channel(self, **kwargs):
+        self.channel = pycares.Channel(servers=[self.server.address], timeout=0.3, tries=3, qcache_max_ttl=0, **kwargs)
+
+    def query(self, name, query_type=pycares.QUERY_TYPE_A):
+        done = threading.Event()
+        results = []
+
+        def cb(*args):
+            results.append(args)
+            done.set()
+
+        self.channel.query(name, query_type, callback=cb)
+        self.assertTrue(done.wait(5))
+        return results[0]
+
+    def test_query_info(self):
+        self.new_channel(query_info=True)
+        result, errorno, info = self.query("example.com")
+        self.assertIsNone(errorno)
+        self.assertEqual(type(info), pycares.QueryInfo)
+        self.assertEqual(info.timeouts, 0)
+        self.assertFalse(info.cached)
+        self.assertGreater(info.latency, 0)
+        self.assertLess(info.latency, 5)
+
+    def test_timeouts(self):
+        self.server.drop = 1
+        self.new_channel(query_info=True)
+        result, errorno, info = self.query("example.com")
+        self.assertIsNone(errorno)
+        self.assertEqual(info.timeouts, 1)
+        self.assertGreaterEqual(info.latency, 0.2)
+        self.assertEqual(self.server.queries, 2)
+
+    def test_default(self):
+        # Callbacks get (result, errno) unless query_info is set
+        self.server.drop = 1
+        self.new_channel()
+        result, errorno = self.query("example.com")
+        self.assertIsNone(errorno)
+        stats = self.channel.query_stats()
+        self.assertEqual(stats["completed"], 1)
+        self.assertEqual(stats["errors"], 0)
+        self.assertEqual(stats["timeouts"], 1)
+        self.assertEqual(stats["timed_out"], 1)
+        self.assertGreaterEqual(stats["latency_max"], 0.2)
+        self.assertEqual(stats["latency_mean"], stats["latency_max"])
+
+    def test_stats(self):
+        self.new_channel()
+        self.assertEqual(self.channel.query_stats(), {
+            "completed": 0, "errors": 0, "timeouts": 0, "timed_out": 0, "latency_mean": 0.0, "latency_max": 0.0,
+        })
+        self.query("example.com")
+        self.query("nx.example.com")
+        stats = self.channel.query_stats()
+        self.assertEqual(stats["completed"], 2)
+        self.assertEqual(stats["errors"], 1)
+        self.assertEqual(stats["timeouts"], 0)
+        self.assertLessEqual(stats["latency_mean"], stats["latency_max"])
+
+    def test_cached(self):
+        self.new_channel(query_info=True, cache_size=2)
+        self.query("example.com")
+        result, errorno, info = self.query("example.com")
+        self.assertIsNone(errorno)
+        self.assertEqual(info, pycares.QueryInfo(0, 0.0, True))
+        self.assertEqual(self.channel.query_stats()["completed"], 1)
+
+    def test_coalesced(self):
+        self.server.drop = 1
+        self.new_channel(query_info=True, coalesce_queries=True)
+        done = threading.Event()
+        results = []
+
+        def cb(*args):
+            results.append(args)
+            if len(results) == 2:
+                done.set()
+
+        for _ in range(2):
+            self.channel.query("example.com", pycares.QUERY_TYPE_A, callback=cb)
+        self.assertTrue(done.wait(5))
+        self.assertEqual([info.timeouts for _, _, info in results], [1, 1])
+
+    @unittest.skipIf(sys.platform == "win32", "skipped on Windows")
+    def test_completion_ring(self):
+        self.server.drop = 1
+        self.new_channel(query_info=True, completion_ring=16)
+        results = []
+        self.channel.query("example.com", pycares.QUERY_TYPE_A, callback=lambda *args: results.append(args))
+        while not results:
+            select.select([self.channel.completion_fd()], [], [], 5)
+            self.channel.process_completions()
+        result, errorno, info = results[0]
+        self.assertIsNone(errorno)
+        self.assertEqual(info.timeouts, 1)
+
+    def test_getaddrinfo(self):
+        self.new_channel(query_info=True)
+        done = threading.Event()
+        results = []
+
+        def cb(*args):
+            results.append(args)
+            done.set()
+
+        self.channel.getaddrinfo("example.com", None, family=socket.AF_INET, callback=cb)
+        self.assertTrue(done.wait(5))
+        result, errorno, info = results[0]
+        self.assertEqual(info.timeouts, 0)
+
+    def test_aio(self):
+        loop = asyncio.new_event_loop()
+        self.addCleanup(loop.close)
+        with self.assertRaises(ValueError):
+            pycares.aio.DNSResolver(loop=loop, query_info=True)
+
+
+class ParseWireTest(unittest.TestCase):
+    def test_parse_wire(self):
+        result = pycares.parse_wire(build_a_response("example.com", ["192.0.2.1", "192.0.2.2"]))
+        self.assertEqual(type(result), pycares.DNSResult)
+        self.assertEqual([r.data.addr for r in result.answer], ["192.0.2.1", "192.0.2.2"])
+        self.assertEqual(result.answer[0].name, "example.com")
+        self.assertEqual(result.answer[0].ttl, 300)
+        self.assertEqual(result.authority, [])
+
+    def test_parse_wire_bad(self):
+        with self.assertRaises(pycares.AresError) as cm:
+            pycares.parse_wire(b"\x00\x01")
+        self.assertEqual(cm.exception.args[0], pycares.errno.ARES_EBADRESP)
+
+    def test_parse_wire_caa(self):
+        qname = b"\x07example\x03com\x00"
+        rdata = b"\x00\x05issue" + b"letsencrypt.org"
+        msg = struct.pack("!6H", 0x1234, 0x8180, 1, 1, 0, 0) + qname + struct.pack("!HH", 257, 1)
+        msg += qname + struct.pack("!HHIH", 257, 1, 300, len(rdata)) + rdata
+        record = pycares.parse_wire(msg).answer[0]
+        self.assertEqual(record.type, pycares.QUERY_TYPE_CAA)
+        self.assertEqual(record.data, pycares.CAARecordData(critical=0, tag="issue", value="letsencrypt.org"))
+
+    def test_parse_wire_address_format(self):
+        msg = build_a_response("example.com", ["192.0.2.1"])
+        result = pycares.parse_wire(msg, address_format=pycares.ADDRESS_FORMAT_PACKED)
+        self.assertEqual(result.answer[0].data.addr, b"\xc0\x00\x02\x01")
+        result = pycares.parse_wire(msg, address_format=pycares.ADDRESS_FORMAT_INT)
+        self.assertEqual(result.answer[0].data.addr, 0xc0000201)
+        result = pycares.parse_wire(msg, lazy=True, address_format=pycares.ADDRESS_FORMAT_IPADDRESS)
+        self.assertEqual(result.answer[0].data.addr, ipaddress.IPv4Address("192.0.2.1"))
+        with self.assertRaises(ValueError):
+            pycares.parse_wire(msg, address_format=42)
+
+    def test_export_addresses(self):
+        msg = build_a_response("example.com", ["192.0.2.1", "192.0.2.2"])
+        for lazy in (False, True):
+            result = pycares.parse_wire(msg, lazy=lazy, address_format=pycares.ADDRESS_FORMAT_PACKED)
+            addrs, ttls = result.export_addresses()
+            self.assertEqual(list(addrs), [0xc0000201, 0xc0000202])
+            self.assertEqual(list(ttls), [300, 300])
+            addrs, ttls = result.export_addresses(socket.AF_INET6)
+            self.assertEqual((len(addrs), len(ttls)), (0, 0))
+            with self.assertRaises(ValueError):
+                result.export_addresses(socket.AF_UNIX)
+
+    def test_parse_wire_addresses(self):
+        msgs = [build_a_response("example.com", ["192.0.2.1"]), b"bad", build_a_response("example.org", ["192.0.2.2", "192.0.2.3"])]
+        addrs, ttls, counts = pycares.parse_wire_addresses(msgs)
+        self.assertEqual(list(addrs), [0xc0000201, 0xc0000202, 0xc0000203])
+        self.assertEqual(list(ttls), [300, 300, 300])
+        self.assertEqual(list(counts), [1, 0, 2])
+
+    def test_parse_wire_lazy(self):
+        msg = build_a_response("example.com", ["192.0.2.1", "192.0.2.2"])
+        result = pycares.parse_wire(memoryview(msg), lazy=True)
+        self.assertIsInstance(result, pycares.LazyDNSResult)
+        self.assertEqual(len(result.answer), 2)
+        self.assertEqual(result.answer[1].data.addr, "192.0.2.2")
+        self.assertEqual(result.answer, pycares.parse_wire(msg).answer)
+        self.assertEqual(pycares.parse_wire(result.to_wire()), pycares.parse_wire(msg))
+        with result:
+            first = result.answer[0]
+        self.assertEqual(first.data.addr, "192.0.2.1")
+        with self.assertRaises(RuntimeError):
+            result.to_wire()
+
+    def test_parse_wire_many(self):
+        msgs = [build_a_response("example.com", ["192.0.2.1"]), b"junk", build_a_response("example.org", ["192.0.2.2"])]
+        results = pycares.parse_wire_many(msgs, sections=[pycares.SECTION_ANSWER])
+        self.assertEqual(len(results), 3)
+        self.assertEqual(results[0][0].answer[0].data.addr, "192.0.2.1")
+        self.assertIsNone(results[0][1])
+        self.assertEqual(results[1], (None, pycares.errno.ARES_EBADRESP))
+        self.assertEqual(results[2][0].answer[0].name, "example.org")
+
+        offsets = []
+        offset = 0
+        for msg in msgs:
+            offsets.append((offset, len(msg)))
+            offset += len(msg)
+        self.assertEqual(pycares.parse_wire_many(b"".join(msgs), offsets=offsets, sections=[pycares.SECTION_ANSWER]), results)
+
+    def test_parse_wire_many_executor(self):
+        import concurrent.futures
+
+        msgs = [build_a_response("example.com", ["192.0.2.%d" % i]) for i in range(1, 11)]
+        with concurrent.futures.ThreadPoolExecutor(2) as executor:
+            results = pycares.parse_wire_many(msgs, executor=executor, chunksize=3)
+        self.assertEqual(results, pycares.parse_wire_many(msgs))
+
+
 if __name__ == "__main__":
     unittest.main(verbosity=2)